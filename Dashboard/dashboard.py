@@ -5,9 +5,12 @@ import os
 import time
 import datetime
 import requests
+from requests.adapters import HTTPAdapter
 import uuid
 import base64
 import hashlib
+import json
+import threading
 from functools import wraps
 
 # Caricamento variabili d'ambiente e configurazione
@@ -16,6 +19,10 @@ DOMAIN: str = os.getenv('HOST', 'http://localhost')
 PORT: str = os.getenv('PORT', '8000')
 API_KEY: str = os.getenv('API_KEY')
 DETECTION_THRESHOLD: float = float(os.getenv('DETECTION_THRESHOLD', '0.5'))
+# Durata (secondi) della cache locale di soggetti e immagini per il caricamento delle pagine
+GALLERY_CACHE_TTL: float = float(os.getenv('GALLERY_CACHE_TTL', '10'))
+# Immagini inviate al servizio per ogni richiesta di enrollment massivo (caricamento cartella)
+BULK_UPLOAD_CHUNK: int = int(os.getenv('BULK_UPLOAD_CHUNK', '50'))
 
 # Configurazione delle credenziali per la dashboard
 DASHBOARD_PASSWORD = os.getenv('DASHBOARD_PASSWORD')
@@ -36,23 +43,57 @@ class InsightFaceClient:
     """
     Client HTTP per comunicare con InsightFace API Service.
     Sostituisce il SDK CompreFace con chiamate HTTP dirette.
+    Usa una sessione con pool di connessioni keep-alive: le operazioni in
+    sequenza (es. eliminazioni multiple) riusano la stessa connessione TCP.
     """
     
+    # Connessioni mantenute nel pool e timeout (connessione, lettura) di default in secondi
+    POOL_SIZE = 10
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = 30
+    
     def __init__(self, domain: str, port: str, api_key: str, det_prob_threshold: float = 0.8):
         self.base_url = f"{domain}:{port}"
         self.api_key = api_key
         self.det_prob_threshold = det_prob_threshold
         self.headers = {"x-api-key": api_key}
+        
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Senza pool_block: oltre POOL_SIZE richieste concorrenti si apre una
+        # connessione extra (non riusata) invece di bloccare il thread di Flask
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> dict:
-        """Esegue una richiesta HTTP al servizio InsightFace"""
+    def _send(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """Esegue una richiesta HTTP al servizio InsightFace sulla sessione condivisa"""
         url = f"{self.base_url}{endpoint}"
-        kwargs.setdefault('headers', {}).update(self.headers)
-        kwargs.setdefault('timeout', 30)
+        kwargs.setdefault('timeout', (self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
         
-        response = requests.request(method, url, **kwargs)
+        response = self.session.request(method, url, **kwargs)
         response.raise_for_status()
-        return response.json()
+        return response
+    
+    def _make_request(self, method: str, endpoint: str, **kwargs) -> dict:
+        """Esegue una richiesta HTTP al servizio InsightFace e ritorna il JSON"""
+        return self._send(method, endpoint, **kwargs).json()
+    
+    def _make_conditional_request(self, endpoint: str, etag: str = None, **kwargs) -> tuple:
+        """
+        GET condizionale con If-None-Match: ritorna (json, etag), oppure
+        (None, etag) se il servizio risponde 304 (contenuto invariato).
+        """
+        if etag:
+            kwargs.setdefault('headers', {})['If-None-Match'] = etag
+        response = self._send('GET', endpoint, **kwargs)
+        if response.status_code == 304:
+            return None, etag
+        return response.json(), response.headers.get('ETag')
+    
+    def get_status(self) -> dict:
+        """Stato del servizio (modello, soglie, dimensioni delle miniature)"""
+        return self._make_request('GET', '/api/v1/recognition/status')
     
     # === SUBJECTS API ===
     
@@ -60,6 +101,18 @@ class InsightFaceClient:
         """Lista tutti i soggetti"""
         return self._make_request('GET', '/api/v1/recognition/subjects')
     
+    def list_subjects_if_changed(self, etag: str = None) -> tuple:
+        """Lista dei soggetti solo se la versione del database è cambiata rispetto a etag"""
+        return self._make_conditional_request('/api/v1/recognition/subjects', etag)
+    
+    def list_subject_summary(self, prefix: str = None, page: int = 0, size: int = 50,
+                             images: int = 1) -> dict:
+        """Pagina di soggetti con numero di volti e primi image_id (miniature)"""
+        params = {'page': page, 'size': size, 'images': images}
+        if prefix:
+            params['prefix'] = prefix
+        return self._make_request('GET', '/api/v1/recognition/subjects/summary', params=params)
+    
     def add_subject(self, subject_name: str) -> dict:
         """Aggiunge un nuovo soggetto"""
         return self._make_request('POST', '/api/v1/recognition/subjects', 
@@ -74,6 +127,14 @@ class InsightFaceClient:
         return self._make_request('PUT', f'/api/v1/recognition/subjects/{old_name}',
                                   json={"subject": new_name})
     
+    def apply_batch(self, operations: list) -> dict:
+        """
+        Applica più modifiche (delete_face, delete_all_faces, delete_subject,
+        rename_subject) in una sola transazione lato servizio
+        """
+        return self._make_request('POST', '/api/v1/recognition/batch',
+                                  json={"operations": operations})
+    
     # === FACES API ===
     
     def list_faces(self, subject: str = None) -> dict:
@@ -88,11 +149,20 @@ class InsightFaceClient:
         with open(image_path, 'rb') as f:
             files = {'file': (os.path.basename(image_path), f, 'image/jpeg')}
             data = {'subject': subject}
-            url = f"{self.base_url}/api/v1/recognition/faces"
-            response = requests.post(url, files=files, data=data, 
-                                    headers=self.headers, timeout=30)
-            response.raise_for_status()
-            return response.json()
+            return self._make_request('POST', '/api/v1/recognition/faces', files=files, data=data)
+    
+    def add_faces_bulk(self, files: list, subjects: list) -> dict:
+        """
+        Enrollment massivo: files è una lista di (nome, bytes, mimetype),
+        subjects il soggetto di ciascun file nello stesso ordine.
+        """
+        return self._make_request(
+            'POST', '/api/v1/recognition/faces/bulk',
+            files=[('files', file) for file in files],
+            data={'subjects': json.dumps(subjects)},
+            # Decodifica ed embedding di tutto il batch avvengono nella stessa richiesta
+            timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT * 4)
+        )
     
     def delete_face(self, image_id: str) -> dict:
         """Elimina un singolo volto"""
@@ -103,12 +173,14 @@ class InsightFaceClient:
         return self._make_request('DELETE', '/api/v1/recognition/faces', 
                                   params={'subject': subject})
     
-    def get_face_image(self, image_id: str) -> bytes:
-        """Ottiene l'immagine di un volto"""
-        url = f"{self.base_url}/api/v1/recognition/faces/{image_id}/img"
-        response = requests.get(url, headers=self.headers, timeout=30)
-        response.raise_for_status()
-        return response.content
+    def get_face_image(self, image_id: str, size: int = None, etag: str = None) -> requests.Response:
+        """
+        Ottiene l'immagine di un volto (o la miniatura di lato size).
+        Con etag la richiesta è condizionale: status 304 se l'immagine è invariata.
+        """
+        params = {'size': size} if size else {}
+        headers = {'If-None-Match': etag} if etag else {}
+        return self._send('GET', f'/api/v1/recognition/faces/{image_id}/img', params=params, headers=headers)
 
 
 # Inizializzazione client InsightFace
@@ -119,6 +191,106 @@ insightface_client = InsightFaceClient(
     det_prob_threshold=DETECTION_THRESHOLD
 )
 
+class GalleryCache:
+    """
+    Cache in-process della gallery, validata con l'ETag della versione del database.
+    - Contiene i nomi dei soggetti, le pagine di riepilogo già richieste e gli
+      image_id dei soggetti aperti: si scarica solo ciò che la pagina mostra.
+    - Per il caricamento delle pagine i dati valgono per `ttl` secondi.
+    - Con revalidate=True (controlli prima delle modifiche) si fa sempre una
+      richiesta condizionale sulla lista soggetti: se il servizio risponde 304
+      non viene trasferito nulla, altrimenti pagine e volti vengono scartati.
+    - Le modifiche fatte dalla dashboard invalidano la cache.
+    - Il lock protegge solo la lettura e la sostituzione dei dati: le richieste
+      al servizio avvengono senza lock, quindi un servizio lento non blocca le
+      altre pagine. Una sola rivalidazione per scadenza del ttl alla volta: nel
+      frattempo le altre richieste usano i dati in cache.
+    """
+    
+    def __init__(self, client: InsightFaceClient, ttl: float):
+        self.client = client
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.subjects = None        # Tutti i soggetti, anche senza immagini
+        self.pages = {}             # {(prefix, page, size): pagina di riepilogo}
+        self.subject_images = {}    # {soggetto: [image_id, ...]} dei soggetti richiesti
+        self.etag = None
+        self.validated_at = 0
+        self.generation = 0         # Incrementata da invalidate()
+        self.refreshing = False     # Rivalidazione per scadenza del ttl in corso
+    
+    def _refresh(self, revalidate: bool):
+        with self.lock:
+            if self.subjects is not None and not revalidate:
+                if time.time() - self.validated_at < self.ttl or self.refreshing:
+                    return
+            guarded = not revalidate
+            if guarded:
+                self.refreshing = True
+            etag = self.etag if self.subjects is not None else None
+            generation = self.generation
+        
+        try:
+            # Soggetti e volti hanno la stessa versione: l'ETag della lista soggetti vale per tutto
+            subjects, etag = self.client.list_subjects_if_changed(etag)
+        finally:
+            if guarded:
+                with self.lock:
+                    self.refreshing = False
+        
+        with self.lock:
+            if subjects is not None and etag != self.etag:
+                self.subjects = subjects.get('subjects', [])
+                self.pages = {}
+                self.subject_images = {}
+                self.etag = etag
+            # Un'invalidazione arrivata durante la richiesta impone una nuova rivalidazione
+            if generation == self.generation:
+                self.validated_at = time.time()
+    
+    def _store(self, entries: dict, key, value, etag):
+        """Salva un dato scaricato solo se la versione della cache non è cambiata nel frattempo"""
+        with self.lock:
+            if self.etag == etag:
+                entries[key] = value
+    
+    def get_subjects(self, revalidate: bool = False) -> list:
+        """Tutti i soggetti, compresi quelli senza immagini"""
+        self._refresh(revalidate)
+        with self.lock:
+            return list(self.subjects)
+    
+    def get_subject_page(self, prefix: str = None, page: int = 0, size: int = 50) -> dict:
+        """Pagina di riepilogo dei soggetti (nome, numero di volti, miniatura)"""
+        self._refresh(False)
+        key = (prefix or '', page, size)
+        with self.lock:
+            subjects_page, etag = self.pages.get(key), self.etag
+        if subjects_page is None:
+            subjects_page = self.client.list_subject_summary(prefix, page, size)
+            self._store(self.pages, key, subjects_page, etag)
+        return subjects_page
+    
+    def get_subject_images(self, subject: str, revalidate: bool = False) -> list:
+        """image_id di un soggetto (copia)"""
+        self._refresh(revalidate)
+        with self.lock:
+            images, etag = self.subject_images.get(subject), self.etag
+        if images is None:
+            faces = self.client.list_faces(subject).get('faces', [])
+            images = [face['image_id'] for face in faces]
+            self._store(self.subject_images, subject, images, etag)
+        return list(images)
+    
+    def invalidate(self):
+        """Da chiamare dopo ogni modifica: il prossimo accesso rivalida con il servizio"""
+        with self.lock:
+            self.validated_at = 0
+            self.generation += 1
+
+
+gallery_cache = GalleryCache(insightface_client, GALLERY_CACHE_TTL)
+
 # Inizializzazione applicazione Flask
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -173,12 +345,31 @@ def retry_with_backoff(func, retries=10, initial_delay=1, max_delay=10, backoff_
             last_exception = e
             time.sleep(delay)
             delay = min(delay * backoff_factor, max_delay)
+        except requests.exceptions.HTTPError as e:
+            # Solo gli errori del servizio (5xx) sono transitori: i 4xx vengono riportati subito
+            if e.response is None or e.response.status_code < 500:
+                raise
+            print(f"Tentativo {attempt+1}/{retries} fallito con errore del servizio: {str(e)}")
+            last_exception = e
+            time.sleep(delay)
+            delay = min(delay * backoff_factor, max_delay)
         except Exception as e:
             print(f"Errore non di connessione durante il tentativo {attempt+1}/{retries}: {str(e)}")
             raise e
 
     raise last_exception or Exception("Tutti i tentativi falliti")
 
+def client_error_response(e):
+    """Risposta JSON per un errore 4xx del servizio (con il suo status), None per gli altri errori"""
+    response = getattr(e, 'response', None)
+    if not isinstance(e, requests.exceptions.HTTPError) or response is None or not 400 <= response.status_code < 500:
+        return None
+    try:
+        detail = response.json().get('detail', str(e))
+    except ValueError:
+        detail = str(e)
+    return jsonify({"error": detail}), response.status_code
+
 # ============================================
 # WRAPPER SICURI PER INSIGHTFACE API
 # ============================================
@@ -187,38 +378,66 @@ def safe_list_faces():
     """Wrapper sicuro per listare tutte le facce nella collezione."""
     return insightface_client.list_faces()
 
+# I wrapper di scrittura invalidano la cache della galleria (anche in caso di
+# errore: la modifica potrebbe essere stata applicata solo in parte)
+
 def safe_add_subject(subject_name):
     """Wrapper sicuro per aggiungere un nuovo soggetto."""
-    return insightface_client.add_subject(subject_name)
+    try:
+        return insightface_client.add_subject(subject_name)
+    finally:
+        gallery_cache.invalidate()
 
 def safe_add_image(image_path, subject_name):
     """Wrapper sicuro per aggiungere un'immagine a un soggetto."""
-    return insightface_client.add_face(image_path, subject_name)
+    try:
+        return insightface_client.add_face(image_path, subject_name)
+    finally:
+        gallery_cache.invalidate()
 
-def safe_delete_all_subject_faces(subject_name):
-    """Wrapper sicuro per eliminare tutte le immagini di un soggetto."""
-    return insightface_client.delete_all_faces(subject_name)
+def safe_add_images_bulk(files, subjects):
+    """Wrapper sicuro per l'enrollment massivo di immagini."""
+    try:
+        return insightface_client.add_faces_bulk(files, subjects)
+    finally:
+        gallery_cache.invalidate()
+
+def safe_apply_batch(operations):
+    """Wrapper sicuro per applicare un batch di modifiche in una transazione."""
+    try:
+        return insightface_client.apply_batch(operations)
+    finally:
+        gallery_cache.invalidate()
 
 def safe_delete_subject(subject_name):
-    """Wrapper sicuro per eliminare un soggetto."""
-    return insightface_client.delete_subject(subject_name)
+    """
+    Elimina un soggetto con le sue immagini, ritentando sugli errori transitori.
+    Un tentativo in timeout o in 5xx può essere stato applicato comunque: se un
+    retry riceve un 4xx e il soggetto non esiste più, l'eliminazione è riuscita.
+    """
+    attempts = 0
 
-def safe_delete_image(image_id):
-    """Wrapper sicuro per eliminare un'immagine specifica tramite ID."""
-    return insightface_client.delete_face(image_id)
+    def attempt():
+        nonlocal attempts
+        attempts += 1
+        try:
+            return safe_apply_batch([{"op": "delete_subject", "subject": subject_name}])
+        except requests.exceptions.HTTPError as e:
+            client_error = e.response is not None and 400 <= e.response.status_code < 500
+            if attempts > 1 and client_error \
+                    and subject_name not in insightface_client.list_subjects().get('subjects', []):
+                logging.info(f"Soggetto '{subject_name}' già eliminato da un tentativo precedente")
+                return {"operations": 1, "deleted_faces": 0}
+            raise
+
+    return retry_with_backoff(attempt, retries=5, initial_delay=1, max_delay=5, backoff_factor=2)
 
 def refresh_insightface_connection():
     """
     Funzione di compatibilità - non più necessaria con HTTP client.
-    Manteniamo per retrocompatibilità con il codice esistente.
+    Il client mantiene un pool di connessioni keep-alive: ricrearlo
+    chiuderebbe solo connessioni ancora valide, quindi non fa nulla.
     """
-    global insightface_client
-    insightface_client = InsightFaceClient(
-        domain=DOMAIN,
-        port=PORT,
-        api_key=API_KEY,
-        det_prob_threshold=DETECTION_THRESHOLD
-    )
 
 # Alias per retrocompatibilità
 refresh_compre_face_connection = refresh_insightface_connection
@@ -258,8 +477,16 @@ def logout():
 # Endpoint per ottenere la configurazione dell'URL del servizio di riconoscimento facciale
 @app.route('/config')
 def get_config():
+    # Dimensioni delle miniature servite dal servizio (configurabili con THUMBNAIL_SIZES):
+    # se il servizio non risponde la pagina usa le immagini originali
+    try:
+        thumbnail_sizes = insightface_client.get_status().get('thumbnail_sizes', [])
+    except Exception as e:
+        app.logger.warning(f"Dimensioni miniature non disponibili: {str(e)}")
+        thumbnail_sizes = []
     return jsonify({
-        'poggio_face_url': os.getenv('POGGIO_FACE_URL', 'http://localhost:5002')
+        'poggio_face_url': os.getenv('POGGIO_FACE_URL', 'http://localhost:5002'),
+        'thumbnail_sizes': thumbnail_sizes
     })
 
 
@@ -268,14 +495,27 @@ def get_config():
 @login_required
 def proxy_image(image_id):
     try:
-        image_data = insightface_client.get_face_image(str(image_id))
+        # Miniatura (?size=) e richieste condizionali del browser inoltrate al servizio
+        size = request.args.get('size', type=int)
+        etag = request.headers.get('If-None-Match')
+        try:
+            response = insightface_client.get_face_image(str(image_id), size=size, etag=etag)
+        except requests.exceptions.HTTPError as e:
+            if not size or e.response.status_code != 400:
+                raise
+            # Dimensione non prevista dal servizio: si ripiega sull'immagine originale
+            response = insightface_client.get_face_image(str(image_id), etag=etag)
+        headers = {name: response.headers[name] for name in ('ETag', 'Cache-Control') if name in response.headers}
+        if response.status_code == 304:
+            return Response(status=304, headers=headers)
         return Response(
-            image_data,
-            content_type='image/jpeg'
+            response.content,
+            content_type='image/jpeg',
+            headers=headers
         )
     except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            return Response(b'', status=404)
+        if e.response.status_code in (400, 404):
+            return Response(b'', status=e.response.status_code)
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -286,14 +526,21 @@ def proxy_image(image_id):
 @login_required
 def list_subjects():
     try:
-        all_faces = retry(safe_list_faces, retries=3, delay=1)
-        subjects_dict = {}
-        for face in all_faces.get('faces', []):
-            subject = face['subject']
-            if subject not in subjects_dict:
-                subjects_dict[subject] = []
-            subjects_dict[subject].append(face['image_id'])
-        return jsonify(subjects_dict)
+        prefix = request.args.get('prefix', '').strip()
+        page = max(0, request.args.get('page', 0, type=int))
+        size = min(max(1, request.args.get('size', 50, type=int)), 200)
+        subjects_page = retry(lambda: gallery_cache.get_subject_page(prefix, page, size), retries=3, delay=1)
+        return jsonify(subjects_page)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Endpoint per ottenere le immagini di un soggetto (caricate all'apertura dei dettagli)
+@app.route('/subjects/<string:subject_name>/images', methods=['GET'])
+@login_required
+def list_subject_images(subject_name):
+    try:
+        images = retry(lambda: gallery_cache.get_subject_images(subject_name), retries=3, delay=1)
+        return jsonify({"subject": subject_name, "images": images})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -315,7 +562,7 @@ def add_subject():
             app.logger.error("Nome soggetto e immagine (o percorso temporaneo) sono richiesti.")
             return jsonify({"error": "Nome soggetto e immagine (o percorso temporaneo) sono richiesti."}), 400
 
-        existing_subjects = retry(lambda: insightface_client.list_subjects(), retries=3, delay=1).get('subjects', [])
+        existing_subjects = retry(lambda: gallery_cache.get_subjects(revalidate=True), retries=3, delay=1)
         if subject_name in existing_subjects:
             app.logger.warning(f"Tentativo di aggiungere un soggetto esistente: {subject_name}")
             return jsonify({"error": f"Soggetto '{subject_name}' esiste già."}), 409
@@ -376,8 +623,8 @@ def add_image_to_subject(subject_name):
     try:
         app.logger.info(f"Aggiunta immagine per soggetto: {subject_name}")
         
-        all_subjects_list = retry(lambda: insightface_client.list_subjects(), retries=3, delay=1)
-        if subject_name not in all_subjects_list.get('subjects', []):
+        all_subjects_list = retry(lambda: gallery_cache.get_subjects(revalidate=True), retries=3, delay=1)
+        if subject_name not in all_subjects_list:
             app.logger.error(f"Soggetto '{subject_name}' non trovato")
             return jsonify({"error": f"Soggetto '{subject_name}' non trovato."}), 404
         
@@ -432,6 +679,54 @@ def add_image_to_subject(subject_name):
         elif cleanup_temp and image_path:
              app.logger.info(f"File temporaneo {image_path} non trovato per la pulizia (finally add_image_to_subject) o non previsto per la pulizia.")
 
+# Endpoint per il caricamento di una cartella di immagini (una sottocartella per soggetto)
+@app.route('/subjects/bulk', methods=['POST'])
+@login_required
+def add_subjects_bulk():
+    try:
+        images = request.files.getlist('images')
+        # Percorsi relativi alla cartella selezionata (webkitRelativePath), uno per immagine
+        paths = json.loads(request.form.get('paths') or '[]')
+        subject_name = request.form.get('subject', '').strip()
+        
+        if not images:
+            return jsonify({"error": "Nessuna immagine fornita."}), 400
+        
+        files, subjects = [], []
+        for i, image in enumerate(images):
+            path = paths[i] if i < len(paths) else image.filename
+            # Il soggetto è il nome della cartella che contiene l'immagine
+            parts = path.replace('\\', '/').split('/')
+            files.append((parts[-1], image.read(), image.mimetype or 'image/jpeg'))
+            subjects.append(subject_name or (parts[-2] if len(parts) > 1 else ''))
+        
+        app.logger.info(f"Enrollment massivo: {len(files)} immagini, {len(set(subjects))} soggetti")
+        added, failed = [], []
+        for start in range(0, len(files), BULK_UPLOAD_CHUNK):
+            chunk_files = files[start:start + BULK_UPLOAD_CHUNK]
+            chunk_subjects = subjects[start:start + BULK_UPLOAD_CHUNK]
+            try:
+                response = safe_add_images_bulk(chunk_files, chunk_subjects)
+            except Exception as e:
+                # I chunk precedenti sono già registrati: il chunk fallito va nel report, non interrompe il caricamento
+                app.logger.error(f"Errore enrollment massivo (immagini {start + 1}-{start + len(chunk_files)}): {str(e)}")
+                failed.extend(
+                    {"file": file[0], "subject": subject, "error": str(e)}
+                    for file, subject in zip(chunk_files, chunk_subjects)
+                )
+                continue
+            added.extend(response.get('added', []))
+            failed.extend(response.get('failed', []))
+        
+        return jsonify({
+            "message": f"{len(added)} immagini aggiunte, {len(failed)} scartate.",
+            "added": added,
+            "failed": failed
+        })
+    except Exception as e:
+        app.logger.error(f"Errore durante l'enrollment massivo: {str(e)}")
+        return jsonify({"error": f"Errore durante il caricamento della cartella: {str(e)}"}), 500
+
 # Endpoint per rinominare un soggetto esistente
 @app.route('/subjects/<string:old_subject_name>', methods=['PUT'])
 @login_required
@@ -451,9 +746,9 @@ def rename_subject(old_subject_name):
             max_delay=5,
             backoff_factor=2
         )
+        gallery_cache.invalidate()
 
         if response.get('updated'):
-            refresh_insightface_connection()
             return jsonify({"message": f"Soggetto '{old_subject_name}' rinominato in '{new_subject_name}'."}), 200
         return jsonify({"error": "Rinominazione fallita"}), 400
 
@@ -468,62 +763,45 @@ def delete_subject(subject_name):
     try:
         logging.info(f"Inizio eliminazione del soggetto: {subject_name}")
         
-        # Recupero di tutte le immagini associate al soggetto
-        all_faces = retry(safe_list_faces, retries=3, delay=1)
-        subject_images = [face['image_id'] for face in all_faces.get('faces', []) if face['subject'] == subject_name]
-
-        # Eliminazione di tutte le immagini prima del soggetto
-        for image_id in subject_images:
-            retry_with_backoff(lambda: safe_delete_image(image_id), retries=5, initial_delay=1, max_delay=5, backoff_factor=2)
-
-        # Eliminazione del soggetto dopo rimozione immagini
-        retry_with_backoff(lambda: safe_delete_subject(subject_name), retries=5, initial_delay=1, max_delay=5, backoff_factor=2)
+        # Soggetto e immagini eliminati in una sola transazione (una richiesta al servizio)
+        response = safe_delete_subject(subject_name)
 
-        # Refresh connessione per evitare problemi di stato
-        refresh_compre_face_connection()
-        logging.info(f"Soggetto '{subject_name}' e tutte le immagini associate eliminate con successo.")
+        logging.info(f"Soggetto '{subject_name}' e {response.get('deleted_faces', 0)} immagini associate eliminate con successo.")
         return jsonify({"message": f"Soggetto '{subject_name}' e tutte le immagini associate eliminate."})
 
     except Exception as e:
         logging.error(f"Errore durante la cancellazione del soggetto {subject_name}: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return client_error_response(e) or (jsonify({"error": str(e)}), 500)
 
 # Endpoint per eliminare una singola immagine tramite ID
 @app.route('/images/<string:image_id>', methods=['DELETE'])
 @login_required
 def delete_image(image_id):
     try:
-        # Recupero informazioni sull'immagine e conteggio immagini per soggetto
-        all_faces = insightface_client.list_faces()
-        
-        subject_name = None
-        image_count = 0
+        # Soggetto proprietario dell'immagine: indicato dalla pagina (?subject=),
+        # altrimenti cercato nella lista completa dei volti
+        subject_name = request.args.get('subject')
+        if not subject_name:
+            faces = insightface_client.list_faces().get('faces', [])
+            subject_name = next((face['subject'] for face in faces if face['image_id'] == image_id), None)
         
-        # Identificazione soggetto proprietario dell'immagine
-        for face in all_faces.get('faces', []):
-            if face['image_id'] == image_id:
-                subject_name = face['subject']
-        
-        if subject_name is None:
+        subject_images = gallery_cache.get_subject_images(subject_name, revalidate=True) if subject_name else []
+        if image_id not in subject_images:
             return jsonify({"error": "Immagine non trovata"}), 404
         
         # Conteggio immagini totali per il soggetto
-        for face in all_faces.get('faces', []):
-            if face['subject'] == subject_name:
-                image_count += 1
+        image_count = len(subject_images)
         
         # Logica di eliminazione: se è l'ultima immagine, elimina anche il soggetto
         if image_count > 1:
-            insightface_client.delete_face(image_id)
+            safe_apply_batch([{"op": "delete_face", "image_id": image_id}])
             return jsonify({"message": "Immagine eliminata con successo."})
         else:
-            # Eliminazione completa del soggetto se è l'ultima immagine
-            retry(lambda: safe_delete_all_subject_faces(subject_name), retries=5, delay=2)
-            retry(lambda: safe_delete_subject(subject_name), retries=5, delay=2)
-            refresh_insightface_connection()
+            # Eliminazione completa del soggetto (con la sua immagine) se è l'ultima immagine
+            safe_delete_subject(subject_name)
             return jsonify({"message": f"Soggetto '{subject_name}' e tutte le immagini associate eliminate."})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return client_error_response(e) or (jsonify({"error": str(e)}), 500)
     
 @app.route('/receive_remote_photo', methods=['POST'])
 def receive_remote_photo():
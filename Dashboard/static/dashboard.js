@@ -1,7 +1,14 @@
 // Variabili globali per la gestione dell'applicazione
 let compreface_base_url; // URL base per CompreFace (non utilizzato nel codice attuale)
 let selectedSubject = null; // Soggetto attualmente selezionato per la visualizzazione dei dettagli
-let allSubjects = {}; // Cache di tutti i soggetti caricati dal server
+let allSubjects = {}; // Soggetti delle pagine caricate: {nome: {face_count, image_ids}}
+let subjectImages = {}; // Immagini dei soggetti aperti nei dettagli: {nome: [image_id]}
+let subjectsPage = 0; // Ultima pagina di soggetti caricata
+let subjectsFilter = ''; // Filtro per prefisso del nome
+const SUBJECTS_PAGE_SIZE = 50; // Soggetti per pagina
+const THUMBNAIL_SIZE_SMALL = 96; // Miniatura desiderata per la lista soggetti (avatar 48px, schermi ad alta densità)
+const THUMBNAIL_SIZE_LARGE = 256; // Miniatura desiderata per la griglia immagini nei dettagli
+let thumbnailSizes = []; // Dimensioni delle miniature disponibili sul servizio (da /config)
 let POGGIO_FACE_URL; // URL del servizio PoggioFace caricato dalla configurazione
 
 // Variabili per la gestione della webcam remota
@@ -19,6 +26,7 @@ async function loadConfig() {
         const response = await fetch('/config');
         const config = await response.json();
         POGGIO_FACE_URL = config.poggio_face_url;
+        thumbnailSizes = config.thumbnail_sizes || [];
         console.log('Configurazione caricata:', config);
     } catch (error) {
         console.error('Errore durante il caricamento della configurazione:', error);
@@ -42,6 +50,29 @@ document.addEventListener('DOMContentLoaded', async function() {
         document.getElementById('loading-overlay').style.display = 'none';
     });
 
+    // Filtro per nome (con debounce) e caricamento delle pagine successive
+    let filterTimeout = null;
+    document.getElementById('subjects-filter').addEventListener('input', function() {
+        clearTimeout(filterTimeout);
+        filterTimeout = setTimeout(() => {
+            subjectsFilter = this.value.trim();
+            fetchSubjects();
+        }, 300);
+    });
+    document.getElementById('subjects-more-btn').addEventListener('click', function() {
+        fetchSubjects(subjectsPage + 1);
+    });
+
+    // Caricamento di una cartella di immagini (enrollment massivo)
+    document.getElementById('bulk-folder-btn').addEventListener('click', function() {
+        document.getElementById('bulk-folder-input').click();
+    });
+    document.getElementById('bulk-folder-input').addEventListener('change', function() {
+        uploadFolder(this.files).finally(() => {
+            this.value = ''; // Permette di ricaricare la stessa cartella
+        });
+    });
+
     // Configura le aree di upload drag-and-drop
     setupUploadAreas();
 
@@ -373,27 +404,56 @@ function openWebcamModal(inputId, previewId, previewContainerId) {
 }
 
 /**
- * Recupera tutti i soggetti dal server
+ * URL dell'immagine di un volto alla miniatura disponibile più adatta:
+ * la più piccola non inferiore a quella desiderata, altrimenti la più grande.
+ * Senza miniature disponibili ritorna l'immagine originale.
+ * @param {string} imageId - ID dell'immagine
+ * @param {number} wantedSize - Lato desiderato in pixel
+ */
+function thumbnailUrl(imageId, wantedSize) {
+    if (thumbnailSizes.length === 0) {
+        return `/proxy/images/${imageId}`;
+    }
+    const size = thumbnailSizes.find(s => s >= wantedSize) || thumbnailSizes[thumbnailSizes.length - 1];
+    return `/proxy/images/${imageId}?size=${size}`;
+}
+
+/**
+ * Recupera una pagina di soggetti dal server (nome, numero di immagini, miniatura)
+ * Con page = 0 la lista viene ricaricata, altrimenti la pagina viene accodata
  * Gestisce anche i retry in caso di errori di rete
+ * @param {number} page - Pagina da caricare
  */
-async function fetchSubjects() {
+async function fetchSubjects(page = 0) {
     try {
-        const response = await fetch('/subjects');
+        const params = new URLSearchParams({ page: page, size: SUBJECTS_PAGE_SIZE });
+        if (subjectsFilter) {
+            params.set('prefix', subjectsFilter);
+        }
+        const response = await fetch(`/subjects?${params}`);
         
         if (!response.ok) {
             // Gestione speciale per errori di connessione
             if (response.status === 0) {
                 console.warn('Problema di connessione alla rete. Attesa e nuovo tentativo...');
                 await new Promise(resolve => setTimeout(resolve, 2000));
-                return fetchSubjects(); // Retry ricorsivo
+                return fetchSubjects(page); // Retry ricorsivo
             }
             throw new Error(`Errore del server HTTP: ${response.status}`);
         }
         
         const data = await response.json();
-        allSubjects = data; // Aggiorna la cache globale
-        renderSubjectsList(data); // Renderizza la lista
-        return data;
+        if (page === 0) {
+            allSubjects = {};
+            subjectImages = {};
+        }
+        for (const group of data.subjects) {
+            allSubjects[group.subject] = group; // Aggiorna la cache globale
+        }
+        subjectsPage = page;
+        renderSubjectsList(data.subjects, page > 0); // Renderizza la lista
+        document.getElementById('subjects-more').classList.toggle('d-none', page + 1 >= data.total_pages);
+        return allSubjects;
     } catch (error) {
         console.error('Errore durante il recupero dei soggetti:', error);
         
@@ -401,7 +461,7 @@ async function fetchSubjects() {
         if (error.name === 'TypeError' && error.message.includes('NetworkError')) {
             console.warn('Errore di rete. Riprovando tra 2 secondi...');
             await new Promise(resolve => setTimeout(resolve, 2000));
-            return fetchSubjects(); // Retry ricorsivo
+            return fetchSubjects(page); // Retry ricorsivo
         }
         
         showToast('Errore durante il recupero dei soggetti: ' + error.message, 'danger');
@@ -411,33 +471,36 @@ async function fetchSubjects() {
 
 /**
  * Renderizza la lista dei soggetti nell'interfaccia utente
- * @param {Object} subjects - Oggetto contenente i soggetti e le loro immagini
+ * @param {Array} subjects - Soggetti della pagina (già in ordine alfabetico dal server)
+ * @param {boolean} append - Accoda alla lista invece di sostituirla
  */
-function renderSubjectsList(subjects) {
+function renderSubjectsList(subjects, append = false) {
     const subjectsList = document.getElementById('subjects-list');
-    subjectsList.innerHTML = '';
+    if (!append) {
+        subjectsList.innerHTML = '';
+    }
 
     // Gestisce il caso di nessun soggetto presente
-    if (Object.keys(subjects).length === 0) {
+    if (!append && subjects.length === 0) {
+        const message = subjectsFilter
+            ? `Nessun soggetto corrisponde a "${subjectsFilter}".`
+            : 'Nessun soggetto presente. Aggiungi un nuovo soggetto per iniziare.';
         subjectsList.innerHTML = `
             <div class="col-12">
                 <div class="empty-state">
                     <i class="fas fa-users"></i>
-                    <p>Nessun soggetto presente. Aggiungi un nuovo soggetto per iniziare.</p>
+                    <p>${message}</p>
                 </div>
             </div>
         `;
         return;
     }
 
-    // Ordina i soggetti alfabeticamente
-    const sortedSubjects = Object.keys(subjects).sort();
-
     // Crea una card per ogni soggetto
-    for (const subject of sortedSubjects) {
-        const images = subjects[subject] || [];
+    for (const group of subjects) {
+        const subject = group.subject;
         // Usa la prima immagine come thumbnail, o un placeholder se non ci sono immagini
-        const firstImageUrl = images.length > 0 ? `/proxy/images/${images[0]}` : 'https://via.placeholder.com/48';
+        const firstImageUrl = group.image_ids.length > 0 ? thumbnailUrl(group.image_ids[0], THUMBNAIL_SIZE_SMALL) : 'https://via.placeholder.com/48';
         
         // ID univoco per il pannello dettagli
         const detailsId = `details-${subject.replace(/\s+/g, '-').replace(/[^a-zA-Z0-9-]/g, '')}`;
@@ -488,13 +551,31 @@ function renderSubjectsList(subjects) {
     }
 }
 
+/**
+ * Recupera le immagini di un soggetto (solo all'apertura dei dettagli)
+ * @param {string} subject - Nome del soggetto
+ * @param {boolean} reload - Ignora le immagini già caricate
+ */
+async function fetchSubjectImages(subject, reload = false) {
+    if (!reload && subjectImages[subject]) {
+        return subjectImages[subject];
+    }
+    const response = await fetch(`/subjects/${encodeURIComponent(subject)}/images`);
+    if (!response.ok) {
+        throw new Error(`Errore del server HTTP: ${response.status}`);
+    }
+    const data = await response.json();
+    subjectImages[subject] = data.images;
+    return data.images;
+}
+
 /**
  * Toggle dei dettagli di un soggetto specifico (espande/comprime inline)
  * @param {string} subject - Nome del soggetto da visualizzare
  * @param {string} detailsId - ID del pannello dettagli
  * @param {HTMLElement} button - Pulsante cliccato
  */
-function toggleSubjectDetails(subject, detailsId, button) {
+async function toggleSubjectDetails(subject, detailsId, button) {
     const detailsPanel = document.getElementById(detailsId);
     const isVisible = detailsPanel.style.display !== 'none';
     
@@ -523,28 +604,34 @@ function toggleSubjectDetails(subject, detailsId, button) {
     } else {
         // Apri il pannello
         selectedSubject = subject;
-        const subjectImages = allSubjects[subject] || [];
+        let images;
+        try {
+            images = await fetchSubjectImages(subject);
+        } catch (error) {
+            showToast('Errore durante il recupero delle immagini: ' + error.message, 'danger');
+            return;
+        }
         
         // Genera il contenuto dei dettagli
         detailsPanel.innerHTML = `
             <div class="details-content">
                 <div class="d-flex justify-content-between align-items-center mb-3">
-                    <span class="text-muted">Numero di immagini: <strong>${subjectImages.length}</strong></span>
+                    <span class="text-muted">Numero di immagini: <strong>${images.length}</strong></span>
                     <button class="btn btn-sm btn-success add-photo-inline-btn" data-subject="${subject}">
                         <i class="fas fa-camera me-1"></i> Aggiungi Foto
                     </button>
                 </div>
                 
-                ${subjectImages.length === 0 ? `
+                ${images.length === 0 ? `
                     <div class="empty-state-inline">
                         <i class="fas fa-image fa-2x text-muted mb-2"></i>
                         <p class="text-muted mb-0">Nessuna immagine disponibile per questo soggetto.</p>
                     </div>
                 ` : `
                     <div class="image-container-inline">
-                        ${subjectImages.map(imageId => `
+                        ${images.map(imageId => `
                             <div class="image-item-inline">
-                                <img src="/proxy/images/${imageId}" alt="${subject}">
+                                <img src="${thumbnailUrl(imageId, THUMBNAIL_SIZE_LARGE)}" alt="${subject}" loading="lazy">
                                 <button class="image-delete-inline" data-image-id="${imageId}" data-subject="${subject}">
                                     <i class="fas fa-times"></i>
                                 </button>
@@ -587,7 +674,7 @@ function toggleSubjectDetails(subject, detailsId, button) {
  */
 function showSubjectDetails(subject) {
     selectedSubject = subject; // Memorizza il soggetto selezionato
-    const subjectImages = allSubjects[subject] || [];
+    const images = subjectImages[subject] || [];
     
     const detailsContainer = document.getElementById('subject-details');
     // Se non esiste il container, usa la nuova logica inline
@@ -616,18 +703,18 @@ function showSubjectDetails(subject) {
         </div>
         <hr>
         
-        <p class="text-muted mb-3">Numero di immagini: ${subjectImages.length}</p>
+        <p class="text-muted mb-3">Numero di immagini: ${images.length}</p>
         
-        ${subjectImages.length === 0 ? `
+        ${images.length === 0 ? `
             <div class="empty-state">
                 <i class="fas fa-image fa-2x text-muted mb-2"></i>
                 <p class="text-muted mb-0">Nessuna immagine disponibile per questo soggetto.</p>
             </div>
         ` : `
             <div class="image-container">
-                ${subjectImages.map(imageId => `
+                ${images.map(imageId => `
                     <div class="image-item">
-                        <img src="/proxy/images/${imageId}" alt="${subject}">
+                        <img src="${thumbnailUrl(imageId, THUMBNAIL_SIZE_LARGE)}" alt="${subject}" loading="lazy">
                         <button class="image-delete" data-image-id="${imageId}">
                             <i class="fas fa-times"></i>
                         </button>
@@ -712,11 +799,56 @@ function openDeleteImageModal(imageId, subject) {
     // Configura il pulsante di conferma per l'eliminazione dell'immagine
     document.getElementById('confirm-delete-btn').setAttribute('data-action', 'delete-image');
     document.getElementById('confirm-delete-btn').setAttribute('data-image-id', imageId);
+    document.getElementById('confirm-delete-btn').setAttribute('data-subject', subject);
     
     const modal = new bootstrap.Modal(document.getElementById('confirmDeleteModal'));
     modal.show();
 }
 
+/**
+ * Carica una cartella di immagini con un'unica richiesta di enrollment massivo
+ * Il soggetto di ogni immagine è il nome della cartella che la contiene
+ * @param {FileList} fileList - File selezionati con l'input webkitdirectory
+ */
+async function uploadFolder(fileList) {
+    const images = Array.from(fileList).filter(file => file.type.startsWith('image/'));
+    if (images.length === 0) {
+        showToast('Nessuna immagine trovata nella cartella selezionata.', 'warning');
+        return;
+    }
+
+    const formData = new FormData();
+    for (const image of images) {
+        formData.append('images', image);
+    }
+    formData.append('paths', JSON.stringify(images.map(image => image.webkitRelativePath || image.name)));
+
+    document.getElementById('loading-overlay').style.display = 'flex';
+    showToast(`Caricamento di ${images.length} immagini in corso...`, 'info');
+
+    try {
+        const response = await fetch('/subjects/bulk', {
+            method: 'POST',
+            body: formData
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.error || 'Errore durante il caricamento della cartella');
+        }
+
+        for (const failure of result.failed) {
+            console.warn(`Immagine scartata ${failure.file}: ${failure.error}`);
+        }
+        showToast(result.message, result.failed.length ? 'warning' : 'success');
+        await fetchSubjects();
+    } catch (error) {
+        console.error('Errore durante il caricamento della cartella:', error);
+        showToast('Errore durante il caricamento della cartella: ' + error.message, 'danger');
+    } finally {
+        document.getElementById('loading-overlay').style.display = 'none';
+    }
+}
+
 /**
  * Aggiunge un nuovo soggetto con la sua prima immagine
  */
@@ -976,25 +1108,9 @@ async function deleteSubject() {
     const subject = document.getElementById('confirm-delete-btn').getAttribute('data-subject');
     
     try {
-        // Copia l'array delle immagini per evitare modifiche durante l'iterazione
-        const subjectImages = [...(allSubjects[subject] || [])];
-        
         showToast(`Eliminazione del soggetto "${subject}" in corso...`, 'info');
         
-        // Elimina tutte le immagini associate al soggetto
-        for (const imageId of subjectImages) {
-            try {
-                await fetch(`/images/${imageId}`, {
-                    method: 'DELETE'
-                });
-                // Breve pausa tra le eliminazioni per evitare sovraccarico del server
-                await new Promise(resolve => setTimeout(resolve, 200));
-            } catch (error) {
-                console.warn(`Errore durante l'eliminazione dell'immagine ${imageId}: ${error.message}`);
-            }
-        }
-        
-        // Elimina il soggetto dal sistema di riconoscimento
+        // Elimina il soggetto dal sistema di riconoscimento (il server elimina anche le immagini)
         const response = await fetch(`/subjects/${subject}`, {
             method: 'DELETE'
         });
@@ -1004,8 +1120,6 @@ async function deleteSubject() {
             throw new Error(result.error || 'Errore durante l\'eliminazione del soggetto');
         }
         
-        // Pausa per permettere al server di completare l'operazione
-        await new Promise(resolve => setTimeout(resolve, 1000));
         await fetchSubjects();
         
         showToast(`Soggetto "${subject}" eliminato con successo.`, 'success');
@@ -1020,21 +1134,14 @@ async function deleteSubject() {
  */
 async function deleteImage() {
     const imageId = document.getElementById('confirm-delete-btn').getAttribute('data-image-id');
+    // Soggetto proprietario dell'immagine
+    const imageSubject = document.getElementById('confirm-delete-btn').getAttribute('data-subject');
     
     try {
-        // Trova il soggetto proprietario dell'immagine
-        let imageSubject = null;
-        for (const [subject, images] of Object.entries(allSubjects)) {
-            if (images.includes(imageId)) {
-                imageSubject = subject;
-                break;
-            }
-        }
-        
         showToast(`Eliminazione dell'immagine in corso...`, 'info');
         
         // Elimina l'immagine dal server
-        const response = await fetch(`/images/${imageId}`, {
+        const response = await fetch(`/images/${imageId}?subject=${encodeURIComponent(imageSubject)}`, {
             method: 'DELETE'
         });
         
@@ -1043,8 +1150,6 @@ async function deleteImage() {
             throw new Error(result.error || 'Errore durante l\'eliminazione dell\'immagine');
         }
         
-        // Pausa per permettere al server di completare l'operazione
-        await new Promise(resolve => setTimeout(resolve, 1000));
         
         showToast('Immagine eliminata con successo.', 'success');
         
@@ -1069,6 +1174,9 @@ async function deleteImage() {
 function resetDetailsPanel() {
     selectedSubject = null;
     const detailsContainer = document.getElementById('subject-details');
+    if (!detailsContainer) {
+        return; // Dettagli inline: i pannelli vengono ricreati con la lista
+    }
     detailsContainer.innerHTML = `
         <div class="empty-state">
             <i class="fas fa-user"></i>
@@ -0,0 +1,169 @@
+import itertools
+import time
+
+class FaceTrack:
+    """Volto seguito tra frame successivi, con l'identità assegnata dall'ultimo riconoscimento"""
+
+    def __init__(self, track_id, detection):
+        self.track_id = track_id
+        self.detection = detection
+        self.subjects = []          # Candidati dell'ultimo riconoscimento (formato CompreFace)
+        self.last_identified = None
+        self.recognized_hits = 0    # Riconoscimenti consecutivi dello stesso soggetto
+        self.misses = 0
+
+    @property
+    def box(self):
+        return detection_box(self.detection)
+
+    @property
+    def best_match(self):
+        return self.subjects[0] if self.subjects else None
+
+
+def detection_box(detection):
+    """Box (x_min, y_min, x_max, y_max) di una detection in formato CompreFace"""
+    box = detection['box']
+    return box['x_min'], box['y_min'], box['x_max'], box['y_max']
+
+
+def box_iou(a, b):
+    """Intersection over union di due box (x_min, y_min, x_max, y_max)"""
+    inter_w = min(a[2], b[2]) - max(a[0], b[0])
+    inter_h = min(a[3], b[3]) - max(a[1], b[1])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def centroid_distance(a, b):
+    """Distanza tra i centri di due box, relativa alla dimensione del box a"""
+    dx = (a[0] + a[2] - b[0] - b[2]) / 2
+    dy = (a[1] + a[3] - b[1] - b[3]) / 2
+    size = max(a[2] - a[0], a[3] - a[1], 1)
+    return (dx * dx + dy * dy) ** 0.5 / size
+
+
+class FaceTracker:
+    """
+    Associa le detection di frame successivi (IoU, con il centroide come
+    ripiego per i movimenti rapidi) e riutilizza l'identità già confermata
+    di ogni traccia: il riconoscimento (embedding + matching) viene richiesto
+    solo per tracce nuove, non riconosciute (ogni retry_interval secondi) o
+    con identità più vecchia di reembed_interval secondi.
+    """
+
+    def __init__(self, similarity_threshold, iou_threshold=0.3, max_centroid_distance=0.5,
+                 max_misses=5, reembed_interval=2.0, retry_interval=0.5, confirm_hits=1):
+        self.similarity_threshold = similarity_threshold
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_misses = max_misses
+        self.reembed_interval = reembed_interval
+        self.retry_interval = retry_interval
+        self.confirm_hits = confirm_hits
+
+        self.tracks = []
+        self.track_ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = []
+
+    def _associate(self, detections):
+        """Abbinamento greedy traccia-detection per IoU decrescente (poi per centroide)"""
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            for d, detection in enumerate(detections):
+                box = detection_box(detection)
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((1 + iou, t, d))
+                elif centroid_distance(track.box, box) <= self.max_centroid_distance:
+                    pairs.append((1 - centroid_distance(track.box, box), t, d))
+        pairs.sort(reverse=True)
+
+        matched_tracks, matched_detections, matches = set(), set(), []
+        for _, t, d in pairs:
+            if t in matched_tracks or d in matched_detections:
+                continue
+            matched_tracks.add(t)
+            matched_detections.add(d)
+            matches.append((t, d))
+        return matches, matched_tracks, matched_detections
+
+    def _needs_identification(self, track, now):
+        if track.last_identified is None:
+            return True
+        if not self.is_confirmed(track):
+            # Volto non (ancora) riconosciuto con certezza: nuovo tentativo a intervallo breve
+            return now - track.last_identified >= self.retry_interval
+        return now - track.last_identified >= self.reembed_interval
+
+    def update(self, detections):
+        """
+        Aggiorna le tracce con le detection del frame corrente (formato
+        /detection/detect) e ritorna le tracce da (ri)identificare.
+        """
+        now = time.time()
+        matches, matched_tracks, matched_detections = self._associate(detections)
+
+        for t, d in matches:
+            self.tracks[t].detection = detections[d]
+            self.tracks[t].misses = 0
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                self.tracks.append(FaceTrack(next(self.track_ids), detection))
+
+        return [track for track in self.tracks
+                if track.misses == 0 and self._needs_identification(track, now)]
+
+    def assign(self, tracks, results):
+        """Assegna alle tracce i risultati di /recognize/aligned (stesso ordine)"""
+        now = time.time()
+        for track, result in zip(tracks, results):
+            subjects = sorted(result.get('subjects', []), key=lambda s: s['similarity'], reverse=True)
+            previous = track.best_match
+            if not subjects or subjects[0]['similarity'] < self.similarity_threshold:
+                track.recognized_hits = 0
+            elif previous and previous['subject'] == subjects[0]['subject']:
+                track.recognized_hits += 1
+            else:
+                track.recognized_hits = 1
+            track.subjects = subjects
+            track.last_identified = now
+
+    def is_confirmed(self, track):
+        """True se la traccia ha un'identità confermata da confirm_hits riconoscimenti concordi"""
+        best = track.best_match
+        return (best is not None and best['similarity'] >= self.similarity_threshold
+                and track.recognized_hits >= self.confirm_hits)
+
+    def results(self):
+        """Tracce visibili nel frame corrente, nel formato di /recognition/recognize"""
+        results = []
+        for track in self.tracks:
+            if track.misses:
+                continue
+            result = {
+                "box": track.detection['box'],
+                "subjects": track.subjects,
+                "track_id": track.track_id,
+                "confirmed": self.is_confirmed(track)
+            }
+            for attribute in ('age', 'gender'):
+                if attribute in track.detection:
+                    result[attribute] = track.detection[attribute]
+            results.append(result)
+        return results
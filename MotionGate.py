@@ -0,0 +1,98 @@
+import time
+import cv2
+
+class MotionGate:
+    """
+    Pre-filtro economico davanti al servizio di riconoscimento: confronta il
+    frame ridotto in scala di grigi con uno sfondo a media mobile e, se
+    richiesto, verifica la presenza di un volto con una cascata Haar.
+    Il riconoscimento parte solo quando qualcosa è cambiato; finché una persona
+    resta presente (presence_hold secondi dall'ultimo evento) il worker lavora
+    al ritmo pieno. Chi resta fermo viene assorbito dallo sfondo: per questo il
+    worker segnala con keep_present() ogni risultato che contiene volti.
+    """
+
+    # Larghezza dei frame ridotti per differenza di sfondo e controllo volto
+    MOTION_WIDTH = 160
+    FACE_WIDTH = 320
+
+    def __init__(self, motion_threshold=0.01, pixel_threshold=25, presence_hold=3.0,
+                 face_check=False, background_rate=0.05):
+        self.motion_threshold = motion_threshold  # Frazione minima di pixel cambiati
+        self.pixel_threshold = pixel_threshold    # Differenza minima di luminosità per pixel
+        self.presence_hold = presence_hold
+        self.background_rate = background_rate
+
+        self.background = None
+        self.last_presence = 0.0
+        self.last_motion_ratio = 0.0
+
+        self.face_cascade = None
+        if face_check:
+            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            self.face_cascade = cv2.CascadeClassifier(cascade_path)
+            if self.face_cascade.empty():
+                print(f"Cascata Haar non disponibile ({cascade_path}): controllo volto disattivato")
+                self.face_cascade = None
+
+    def reset(self):
+        """Dimentica sfondo e presenza (es. al riavvio dello stream)"""
+        self.background = None
+        self.last_presence = 0.0
+        self.last_motion_ratio = 0.0
+
+    def _resize_gray(self, gray, width):
+        height = max(1, int(gray.shape[0] * width / gray.shape[1]))
+        return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+    def _detect_motion(self, gray):
+        """Differenza con lo sfondo a media mobile sul frame ridotto"""
+        small = cv2.GaussianBlur(self._resize_gray(gray, self.MOTION_WIDTH), (5, 5), 0)
+
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small.astype('float32')
+            self.last_motion_ratio = 0.0
+            return True  # Primo frame: nessun riferimento, lascia passare
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self.background))
+        self.last_motion_ratio = cv2.countNonZero(
+            cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1]
+        ) / diff.size
+        cv2.accumulateWeighted(small, self.background, self.background_rate)
+        return self.last_motion_ratio >= self.motion_threshold
+
+    def _has_face(self, gray):
+        small = self._resize_gray(gray, self.FACE_WIDTH)
+        faces = self.face_cascade.detectMultiScale(small, scaleFactor=1.2, minNeighbors=4, minSize=(24, 24))
+        return len(faces) > 0
+
+    def keep_present(self, now=None):
+        """Prolunga la presenza (es. il riconoscimento vede ancora dei volti)"""
+        self.last_presence = now or time.time()
+
+    def is_present(self, now=None):
+        """True se c'è stata presenza negli ultimi presence_hold secondi"""
+        now = now or time.time()
+        return now - self.last_presence < self.presence_hold
+
+    def update(self, frame):
+        """
+        Analizza un frame BGR e ritorna True se vale la pena inviarlo al
+        riconoscimento (movimento, o volto visibile se il controllo è attivo).
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        now = time.time()
+        motion = self._detect_motion(gray)
+
+        if self.face_cascade is None:
+            present = motion
+        elif motion or self.is_present(now):
+            # Il controllo volto gira solo se qualcosa si muove o la persona era
+            # già presente (chi resta fermo davanti alla camera non viene perso)
+            present = self._has_face(gray)
+        else:
+            present = False
+
+        if present:
+            self.last_presence = now
+        return self.is_present(now)
@@ -4,9 +4,15 @@ from dotenv import load_dotenv
 import os
 import logging
 import datetime
+import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import threading
-from SharedVideoStreamer import SharedVideoStreamer
+from SharedVideoStreamer import SharedVideoStreamer, VideoStreamRegistry, parse_camera_sources
+from RecognitionWorker import RecognitionWorker, RecognitionScheduler
+from MotionGate import MotionGate
+from FaceTracker import FaceTracker
 
 
 
@@ -44,6 +50,49 @@ face_plugins = os.getenv('FACE_PLUGINS')
 shelly_url = os.getenv('SHELLY_URL')
 dashboard_url = os.getenv('DASHBOARD_URL')
 
+# Sorgente video: indice webcam (o percorso/URL), risoluzione, FPS di cattura e qualità JPEG
+camera_device = os.getenv('CAMERA_DEVICE', '0')
+camera_device = int(camera_device) if camera_device.isdigit() else camera_device
+camera_width = int(os.getenv('CAMERA_WIDTH', '640'))
+camera_height = int(os.getenv('CAMERA_HEIGHT', '480'))
+camera_fps = float(os.getenv('CAMERA_FPS', '10'))
+jpeg_quality = int(os.getenv('JPEG_QUALITY', '75'))
+
+# Replay da file video o cartella di immagini (test di carico senza webcam):
+# pacing 'realtime' (REPLAY_FPS, default FPS del video) oppure 'fast', con o senza loop
+replay_pacing = os.getenv('REPLAY_PACING', 'realtime').lower()
+replay_loop = os.getenv('REPLAY_LOOP', 'true').lower() in ('1', 'true', 'yes')
+replay_fps = float(os.getenv('REPLAY_FPS')) if os.getenv('REPLAY_FPS') else None
+
+# Più ingressi: camere con nome 'id=sorgente,...' (indice USB, URL RTSP o file video).
+# Se vuoto viene usata una sola camera 'default' con CAMERA_DEVICE
+camera_sources = parse_camera_sources(os.getenv('CAMERAS')) or {'default': camera_device}
+# Richieste contemporanee al servizio InsightFace, distribuite a turno tra le camere
+recognition_concurrency = int(os.getenv('RECOGNITION_CONCURRENCY', '2'))
+
+# Riconoscimento lato server: intervallo minimo tra due richieste (0 = al ritmo della camera)
+# e parametri opzionali di detection inoltrati al servizio InsightFace
+recognition_interval = float(os.getenv('RECOGNITION_INTERVAL', '0'))
+recognition_det_size = os.getenv('RECOGNITION_DET_SIZE')
+recognition_roi = os.getenv('RECOGNITION_ROI')
+
+# Pre-filtro movimento/presenza: il servizio viene chiamato solo se la scena cambia
+motion_gate_enabled = os.getenv('MOTION_GATE', 'true').lower() in ('1', 'true', 'yes')
+motion_threshold = float(os.getenv('MOTION_THRESHOLD', '0.01'))
+motion_face_check = os.getenv('MOTION_FACE_CHECK', 'false').lower() in ('1', 'true', 'yes')
+motion_presence_hold = float(os.getenv('MOTION_PRESENCE_HOLD', '3'))
+recognition_idle_interval = float(os.getenv('RECOGNITION_IDLE_INTERVAL', '0'))
+
+# Tracking dei volti: detection a ogni frame, riconoscimento solo per volti nuovi
+# o ogni TRACKER_REEMBED_INTERVAL secondi; identità confermata dopo TRACKER_CONFIRM_HITS match concordi
+tracking_enabled = os.getenv('RECOGNITION_TRACKING', 'true').lower() in ('1', 'true', 'yes')
+tracker_reembed_interval = float(os.getenv('TRACKER_REEMBED_INTERVAL', '2'))
+tracker_confirm_hits = int(os.getenv('TRACKER_CONFIRM_HITS', '1'))
+
+# Intervallo minimo (secondi) tra due attivazioni Shelly e tra due log dello stesso soggetto
+SHELLY_COOLDOWN = 5
+LOG_COOLDOWN = 5
+
 # Log delle configurazioni per debug
 app.logger.info(f"=== CONFIGURAZIONE POGGIOFACE ===")
 app.logger.info(f"Host: {host}")
@@ -55,17 +104,233 @@ app.logger.info(f"=== FINE CONFIGURAZIONE ===")
 # Abilita CORS per tutte le rotte dell'applicazione
 CORS(app)
 
-# Aggiungi dopo le altre variabili globali
-shared_video_stream = SharedVideoStreamer()
-
-# Variabile globale per tracciare lo stato del riconoscimento facciale
-recognition_active = False
+# Stream video delle camere configurate, ognuno con cattura e buffer propri
+video_streams = VideoStreamRegistry()
+for camera_id, source in camera_sources.items():
+    video_streams.add(camera_id, SharedVideoStreamer(
+        device=source,
+        width=camera_width,
+        height=camera_height,
+        fps=camera_fps,
+        jpeg_quality=jpeg_quality,
+        replay_pacing=replay_pacing,
+        replay_loop=replay_loop,
+        replay_fps=replay_fps
+    ))
+app.logger.info(f"Camere configurate: {', '.join(f'{cid}={src}' for cid, src in camera_sources.items())}")
+
+# Stato del riconoscimento facciale per camera
+recognition_active = {camera_id: False for camera_id in video_streams.ids()}
 
 # Sistema di log per i riconoscimenti facciali (in memoria, max 100 entries)
 recognition_logs = []
 MAX_LOG_ENTRIES = 100
 log_lock = threading.Lock()  # Lock per accesso thread-safe ai log
 
+
+def insightface_base_url():
+    """URL base del servizio InsightFace (aggiunge la porta se non già nell'host)"""
+    base_url = host or ''
+    if port and f":{port}" not in base_url:
+        base_url = f"{base_url}:{port}"
+    return base_url
+
+
+def add_recognition_log_entry(subject, similarity, recognized, log_type, camera=None):
+    """Aggiunge una voce al log dei riconoscimenti (thread-safe)"""
+    global recognition_logs
+    log_entry = {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'subject': subject,
+        'similarity': similarity,
+        'recognized': recognized,
+        'type': log_type,  # 'detection', 'recognition', 'failed'
+        'camera': camera
+    }
+    
+    with log_lock:
+        recognition_logs.insert(0, log_entry)  # Inserisci all'inizio (più recente prima)
+        # Mantieni solo gli ultimi MAX_LOG_ENTRIES
+        if len(recognition_logs) > MAX_LOG_ENTRIES:
+            recognition_logs = recognition_logs[:MAX_LOG_ENTRIES]
+    
+    app.logger.info(f"Log riconoscimento: {log_entry['type']} - {log_entry['subject']} ({log_entry['similarity']:.2f})")
+    return log_entry
+
+
+def create_http_session(pool_size=10):
+    """Sessione HTTP con pool di connessioni keep-alive (una connessione TCP riusata per host)"""
+    http_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    http_session.mount('http://', adapter)
+    http_session.mount('https://', adapter)
+    return http_session
+
+
+# Sessione per i dispositivi e servizi esterni (Shelly, Dashboard): separata da
+# quella del riconoscimento, che porta l'header x-api-key di InsightFace
+external_session = create_http_session()
+
+
+def activate_shelly():
+    """Attiva il relay Shelly. Ritorna (payload, status_code)."""
+    try:
+        if not shelly_url:
+            return {"error": "URL Shelly non configurato"}, 400
+        # Effettua la chiamata al dispositivo Shelly
+        response = external_session.get(shelly_url, timeout=5)
+        
+        if response.ok:
+            app.logger.info(f"Shelly attivato correttamente: {shelly_url}")
+            return {"status": "success", "message": "Relay attivato"}, 200
+        else:
+            app.logger.error(f"Errore nella chiamata Shelly: {response.status_code}")
+            return {"error": f"Errore Shelly: {response.status_code}"}, 502
+            
+    except requests.exceptions.Timeout:
+        app.logger.error("Timeout nella chiamata al dispositivo Shelly")
+        return {"error": "Timeout dispositivo Shelly"}, 504
+    except requests.exceptions.ConnectionError:
+        app.logger.error("Errore di connessione al dispositivo Shelly")
+        return {"error": "Dispositivo Shelly non raggiungibile"}, 503
+    except Exception as e:
+        app.logger.error(f"Errore generico nella chiamata Shelly: {str(e)}")
+        return {"error": f"Errore: {str(e)}"}, 500
+
+
+# Stato per la deduplica di log e attivazioni Shelly, separato per camera
+recognition_states = {
+    camera_id: {
+        'last_logged_subject': None,
+        'last_log_time': 0,
+        'last_shelly_time': 0,
+        'triggered_tracks': set()
+    }
+    for camera_id in video_streams.ids()
+}
+
+
+def handle_recognition_results(camera_id, results):
+    """
+    Gestisce i risultati del worker di riconoscimento: log dei riconoscimenti
+    (al massimo uno ogni LOG_COOLDOWN secondi per soggetto) e attivazione Shelly
+    (al massimo una ogni SHELLY_COOLDOWN secondi).
+    Con il tracking attivo lo Shelly scatta una sola volta per traccia, quando
+    la sua identità viene confermata.
+    """
+    recognition_state = recognition_states[camera_id]
+    if not results:
+        recognition_state['last_logged_subject'] = None  # Reset quando non c'è più nessuno
+        recognition_state['triggered_tracks'].clear()
+        return
+    
+    # Dimentica le tracce non più visibili
+    recognition_state['triggered_tracks'] &= {result.get('track_id') for result in results}
+    
+    for result in results:
+        current_time = time.time()
+        subjects = sorted(result.get('subjects', []), key=lambda s: s['similarity'], reverse=True)
+        
+        if not subjects:
+            # Volto rilevato ma senza match
+            if current_time - recognition_state['last_log_time'] > LOG_COOLDOWN:
+                add_recognition_log_entry('Sconosciuto', 0, False, 'detection', camera_id)
+                recognition_state['last_log_time'] = current_time
+            continue
+        
+        best_match = subjects[0]
+        if best_match['similarity'] >= similarity_threshold:
+            if (best_match['subject'] != recognition_state['last_logged_subject']
+                    or current_time - recognition_state['last_log_time'] > LOG_COOLDOWN):
+                add_recognition_log_entry(best_match['subject'], best_match['similarity'], True, 'recognition', camera_id)
+                recognition_state['last_logged_subject'] = best_match['subject']
+                recognition_state['last_log_time'] = current_time
+            
+            track_id = result.get('track_id')
+            if track_id is not None:
+                if not result.get('confirmed') or track_id in recognition_state['triggered_tracks']:
+                    continue
+                recognition_state['triggered_tracks'].add(track_id)
+            
+            if shelly_url and current_time - recognition_state['last_shelly_time'] >= SHELLY_COOLDOWN:
+                recognition_state['last_shelly_time'] = current_time
+                # Thread separato: il timeout dello Shelly non deve fermare il riconoscimento
+                threading.Thread(target=activate_shelly, daemon=True).start()
+        elif current_time - recognition_state['last_log_time'] > LOG_COOLDOWN:
+            # Volto rilevato ma non riconosciuto con certezza sufficiente
+            add_recognition_log_entry('Non riconosciuto', best_match['similarity'], False, 'failed', camera_id)
+            recognition_state['last_log_time'] = current_time
+
+
+recognition_params = {
+    'limit': 0,
+    'det_prob_threshold': detection_threshold,
+    'prediction_count': 1
+}
+if face_plugins:
+    recognition_params['face_plugins'] = face_plugins
+if recognition_det_size:
+    recognition_params['det_size'] = recognition_det_size
+if recognition_roi:
+    recognition_params['roi'] = recognition_roi
+
+# Sessione HTTP (pool di connessioni) e scheduler condivisi dai worker di tutte le camere
+recognition_session = create_http_session(max(10, recognition_concurrency))
+recognition_scheduler = RecognitionScheduler(recognition_concurrency)
+
+
+def create_recognition_worker(camera_id):
+    """Worker di riconoscimento di una camera, con gate e tracker propri"""
+    return RecognitionWorker(
+        video_streams.get(camera_id),
+        f"{insightface_base_url()}/api/v1/recognition/recognize",
+        api_key=api_key,
+        params=recognition_params,
+        on_results=lambda results: handle_recognition_results(camera_id, results),
+        min_interval=recognition_interval,
+        gate=MotionGate(
+            motion_threshold=motion_threshold,
+            presence_hold=motion_presence_hold,
+            face_check=motion_face_check
+        ) if motion_gate_enabled else None,
+        idle_interval=recognition_idle_interval,
+        tracker=FaceTracker(
+            similarity_threshold,
+            reembed_interval=tracker_reembed_interval,
+            confirm_hits=tracker_confirm_hits
+        ) if tracking_enabled else None,
+        detect_url=f"{insightface_base_url()}/api/v1/detection/detect",
+        aligned_url=f"{insightface_base_url()}/api/v1/recognition/recognize/aligned",
+        session=recognition_session,
+        scheduler=recognition_scheduler
+    )
+
+
+recognition_workers = {camera_id: create_recognition_worker(camera_id) for camera_id in video_streams.ids()}
+
+
+def set_recognition_active(active, camera_id=None):
+    """Avvia o ferma il worker di riconoscimento di una camera (None = tutte le camere)"""
+    for cid in ([camera_id] if camera_id else video_streams.ids()):
+        recognition_active[cid] = active
+        if active:
+            recognition_workers[cid].start()
+        else:
+            recognition_workers[cid].stop()
+
+
+def requested_camera():
+    """Camera indicata dal parametro 'camera' della richiesta (default: la prima configurata)"""
+    return request.args.get('camera') or video_streams.default_id
+
+
+@app.before_request
+def validate_camera():
+    """Rifiuta le richieste per camere non configurate"""
+    camera_id = request.args.get('camera')
+    if camera_id and camera_id not in video_streams:
+        return jsonify({"error": f"Camera '{camera_id}' non configurata"}), 404
+
 # Route principale che serve il template HTML per il riconoscimento facciale
 @app.route('/')
 def home():
@@ -110,25 +375,15 @@ def log_message():
 @app.route('/recognition_log', methods=['POST'])
 def add_recognition_log():
     """Aggiunge un nuovo log di riconoscimento facciale"""
-    global recognition_logs
     try:
         data = request.get_json()
         
-        log_entry = {
-            'timestamp': datetime.datetime.now().isoformat(),
-            'subject': data.get('subject', 'Sconosciuto'),
-            'similarity': data.get('similarity', 0),
-            'recognized': data.get('recognized', False),
-            'type': data.get('type', 'detection')  # 'detection', 'recognition', 'failed'
-        }
-        
-        with log_lock:
-            recognition_logs.insert(0, log_entry)  # Inserisci all'inizio (più recente prima)
-            # Mantieni solo gli ultimi MAX_LOG_ENTRIES
-            if len(recognition_logs) > MAX_LOG_ENTRIES:
-                recognition_logs = recognition_logs[:MAX_LOG_ENTRIES]
-        
-        app.logger.info(f"Log riconoscimento: {log_entry['type']} - {log_entry['subject']} ({log_entry['similarity']:.2f})")
+        add_recognition_log_entry(
+            data.get('subject', 'Sconosciuto'),
+            data.get('similarity', 0),
+            data.get('recognized', False),
+            data.get('type', 'detection')
+        )
         return jsonify({"status": "success"}), 200
         
     except Exception as e:
@@ -175,47 +430,31 @@ def get_config():
 
 @app.route('/shelly_url', methods=['POST'])
 def shelly_url_handler():
-        try:
-            if not shelly_url:
-                return jsonify({"error": "URL Shelly non configurato"}), 400                
-            # Effettua la chiamata al dispositivo Shelly
-            response = requests.get(shelly_url, timeout=5)
-            
-            if response.ok:
-                app.logger.info(f"Shelly attivato correttamente: {shelly_url}")
-                return jsonify({"status": "success", "message": "Relay attivato"})
-            else:
-                app.logger.error(f"Errore nella chiamata Shelly: {response.status_code}")
-                return jsonify({"error": f"Errore Shelly: {response.status_code}"}), 502
-                
-        except requests.exceptions.Timeout:
-            app.logger.error("Timeout nella chiamata al dispositivo Shelly")
-            return jsonify({"error": "Timeout dispositivo Shelly"}), 504
-        except requests.exceptions.ConnectionError:
-            app.logger.error("Errore di connessione al dispositivo Shelly")
-            return jsonify({"error": "Dispositivo Shelly non raggiungibile"}), 503
-        except Exception as e:
-            app.logger.error(f"Errore generico nella chiamata Shelly: {str(e)}")
-            return jsonify({"error": f"Errore: {str(e)}"}), 500
+        payload, status_code = activate_shelly()
+        return jsonify(payload), status_code
         
 @app.route('/recognition_status')
 def recognition_status():
     """Restituisce lo stato del riconoscimento"""
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
     return jsonify({
-        "active": recognition_active,
-        "stream_running": shared_video_stream.is_running()
+        "active": recognition_active[camera_id],
+        "stream_running": stream.is_running(),
+        "stats": recognition_workers[camera_id].get_stats()
     })
 
 @app.route('/start_recognition', methods=['POST'])
 def start_recognition():
-    """Avvia il riconoscimento facciale"""
-    global recognition_active
+    """Avvia il riconoscimento facciale (worker lato server; senza 'camera' su tutte le camere)"""
+    camera_id = request.args.get('camera')
     try:
-        if not shared_video_stream.is_running():
-            shared_video_stream.start_stream()
+        for cid in ([camera_id] if camera_id else video_streams.ids()):
+            if not video_streams.get(cid).is_running():
+                video_streams.get(cid).start_stream()
         
-        recognition_active = True
-        app.logger.info("Riconoscimento facciale avviato")
+        set_recognition_active(True, camera_id)
+        app.logger.info(f"Riconoscimento facciale avviato ({camera_id or 'tutte le camere'})")
         return jsonify({"status": "success", "message": "Riconoscimento avviato"})
     except Exception as e:
         app.logger.error(f"Errore avvio riconoscimento: {str(e)}")
@@ -223,32 +462,76 @@ def start_recognition():
 
 @app.route('/stop_recognition', methods=['POST'])
 def stop_recognition():
-    """Ferma il riconoscimento facciale (mantiene lo stream attivo)"""
-    global recognition_active
+    """Ferma il riconoscimento facciale (mantiene lo stream attivo; senza 'camera' su tutte le camere)"""
+    camera_id = request.args.get('camera')
     try:
-        recognition_active = False
-        app.logger.info("Riconoscimento facciale fermato")
+        set_recognition_active(False, camera_id)
+        app.logger.info(f"Riconoscimento facciale fermato ({camera_id or 'tutte le camere'})")
         return jsonify({"status": "success", "message": "Riconoscimento fermato"})
     except Exception as e:
         app.logger.error(f"Errore stop riconoscimento: {str(e)}")
         return jsonify({"error": f"Errore: {str(e)}"}), 500
 
+@app.route('/recognition_results')
+def recognition_results():
+    """Restituisce l'ultimo risultato del worker di riconoscimento"""
+    camera_id = requested_camera()
+    return jsonify({**recognition_workers[camera_id].get_results(), "active": recognition_active[camera_id]})
+
+@app.route('/recognition_events')
+def recognition_events():
+    """Stream Server-Sent Events dei risultati di riconoscimento"""
+    camera_id = requested_camera()
+    worker = recognition_workers[camera_id]
+    
+    def event_stream():
+        last_seq = 0
+        while True:
+            latest = worker.wait_for_results(last_seq, timeout=15)
+            if latest["seq"] == last_seq:
+                yield ": keepalive\n\n"
+                continue
+            last_seq = latest["seq"]
+            yield f"data: {json.dumps({**latest, 'active': recognition_active[camera_id]})}\n\n"
+    
+    return Response(event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/cameras')
+def list_cameras():
+    """Elenco delle camere configurate con lo stato di stream e riconoscimento"""
+    return jsonify({
+        "default": video_streams.default_id,
+        "cameras": [
+            {
+                "id": camera_id,
+                "stream_running": stream.is_running(),
+                "recognition_active": recognition_active[camera_id]
+            }
+            for camera_id, stream in video_streams.items()
+        ]
+    })
+
 @app.route('/webcam_status')
 def webcam_status():
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
     try:
         return jsonify({
-            "stream_running": shared_video_stream.is_running(),
-            "recognition_active": recognition_active,
-            "available_for_capture": shared_video_stream.is_running() and not recognition_active
+            "stream_running": stream.is_running(),
+            "recognition_active": recognition_active[camera_id],
+            "available_for_capture": stream.is_running() and not recognition_active[camera_id],
+            "capture": stream.get_stats()
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/start_video_stream', methods=['POST'])
 def start_video_stream():
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
     try:
-        if not shared_video_stream.is_running():
-            shared_video_stream.start_stream()
+        if not stream.is_running():
+            stream.start_stream()
         return jsonify({"status": "success", "message": "Stream avviato"})
     except Exception as e:
         app.logger.error(f"Errore avvio stream: {str(e)}")
@@ -257,22 +540,90 @@ def start_video_stream():
 
 @app.route('/get_video_frame')
 def get_video_frame():
+    """
+    Ultimo frame in base64 con numero di sequenza e timestamp di cattura.
+    Con since=<seq> (o If-None-Match con l'ETag ricevuto) il frame viene inviato
+    solo se più recente: altrimenti risponde 304, oppure con wait=<secondi>
+    attende (long-poll) l'arrivo di un nuovo frame.
+    """
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
     try:
-        if not shared_video_stream.is_running():
+        if not stream.is_running():
             return jsonify({"error": "Stream non attivo"}), 400
-            
-        frame = shared_video_stream.get_frame()
-        if frame:
-            return jsonify({"frame": frame})
-        else:
-            return jsonify({"frame": None})
+        
+        since = request.args.get('since', type=int)
+        if since is None:
+            etag = request.headers.get('If-None-Match', '').strip()
+            if etag.startswith('W/'):
+                etag = etag[2:]
+            if len(etag) >= 2 and etag[0] == etag[-1] == '"':
+                etag = etag[1:-1]
+            if etag.startswith('frame-') and etag[6:].isdigit():
+                since = int(etag[6:])
+        
+        if since is not None and since > stream.get_frame_seq():
+            # Sequenza più avanti dello stream: il contatore è ripartito (riavvio
+            # del processo), il riferimento del client non è più valido
+            since = None
+        
+        if since is not None:
+            wait = min(max(request.args.get('wait', 0, type=float), 0), 10)
+            if wait > 0:
+                stream.wait_for_frame(since, timeout=wait)
+            if stream.get_frame_seq() <= since:
+                response = make_response('', 304)
+                response.headers['ETag'] = f'"frame-{since}"'
+                return response
+        
+        packet = stream.get_frame_packet()
+        if not packet:
+            return jsonify({"frame": None, "seq": None, "timestamp": None})
+        
+        response = jsonify(packet)
+        response.headers['ETag'] = f'"frame-{packet["seq"]}"'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+@app.route('/video_feed')
+def video_feed():
+    """
+    Anteprima live MJPEG (multipart/x-mixed-replace): invia JPEG binari
+    solo quando la camera produce un nuovo frame, su un'unica connessione.
+    """
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
+    if not stream.is_running():
+        return jsonify({"error": "Stream non attivo"}), 400
+    
+    def mjpeg_stream():
+        last_seq = 0
+        while stream.is_running():
+            if stream.wait_for_frame(last_seq, timeout=5) <= last_seq:
+                continue
+            seq, jpeg = stream.get_jpeg()
+            if jpeg is None:
+                continue
+            last_seq = seq
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n'
+                   b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n' +
+                   jpeg + b'\r\n')
+    
+    return Response(
+        mjpeg_stream(),
+        mimetype='multipart/x-mixed-replace; boundary=frame',
+        headers={'Cache-Control': 'no-cache'}
+    )
+    
 @app.route('/stop_video_stream', methods=['POST', 'GET'])
 def stop_video_stream():
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
     try:
-        shared_video_stream.stop_stream()
+        stream.stop_stream()
         return jsonify({"status": "success", "message": "Stream fermato"})
     except Exception as e:
         app.logger.error(f"Errore stop stream: {str(e)}")
@@ -281,11 +632,13 @@ def stop_video_stream():
 
 @app.route('/capture_video_frame', methods=['POST'])
 def capture_video_frame():
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
     try:
-        if not shared_video_stream.is_running():
+        if not stream.is_running():
             return jsonify({"error": "Stream non attivo"}), 400
             
-        frame = shared_video_stream.get_frame()
+        frame = stream.get_frame()
         if frame:
             return jsonify({
                 "success": True,
@@ -334,7 +687,7 @@ def remote_photo_data():
             endpoint_url = f"{dashboard_url}/receive_remote_photo"
             app.logger.info(f"Invio foto alla Dashboard: {endpoint_url}")
             
-            dashboard_response = requests.post(
+            dashboard_response = external_session.post(
                 endpoint_url,
                 json={
                     "photo_data": photo_data,
@@ -385,35 +738,36 @@ def remote_photo_data():
 
 @app.route('/restart_system', methods=['POST'])
 def restart_system():
-    """Riavvia completamente il sistema di riconoscimento e stream"""
-    global recognition_active
+    """Riavvia completamente il sistema di riconoscimento e stream (senza 'camera' tutte le camere)"""
+    camera_id = request.args.get('camera')
+    camera_ids = [camera_id] if camera_id else video_streams.ids()
     try:
-        app.logger.info("Riavvio completo del sistema richiesto")
+        app.logger.info(f"Riavvio completo del sistema richiesto ({camera_id or 'tutte le camere'})")
         
         # Ferma tutto
-        recognition_active = False
+        set_recognition_active(False, camera_id)
         
         # Piccola pausa per permettere il rilascio delle risorse
-        import time
         time.sleep(1)
         
-        # Riavvia lo stream se non è attivo
-        if not shared_video_stream.is_running():
-            shared_video_stream.start_stream()
-            app.logger.info("Stream video riavviato")
+        # Riavvia gli stream non attivi
+        for cid in camera_ids:
+            if not video_streams.get(cid).is_running():
+                video_streams.get(cid).start_stream()
+                app.logger.info(f"Stream video riavviato ({cid})")
         
         # Piccola pausa per stabilizzazione
         time.sleep(0.5)
         
         # Riavvia il riconoscimento
-        recognition_active = True
+        set_recognition_active(True, camera_id)
         app.logger.info("Sistema riavviato completamente")
         
         return jsonify({
             "status": "success", 
             "message": "Sistema riavviato",
-            "stream_running": shared_video_stream.is_running(),
-            "recognition_active": recognition_active
+            "stream_running": all(video_streams.get(cid).is_running() for cid in camera_ids),
+            "recognition_active": all(recognition_active[cid] for cid in camera_ids)
         })
         
     except Exception as e:
@@ -423,12 +777,14 @@ def restart_system():
 @app.route('/system_status')
 def system_status():
     """Restituisce lo stato completo del sistema"""
+    camera_id = requested_camera()
+    stream = video_streams.get(camera_id)
     try:
         return jsonify({
-            "stream_running": shared_video_stream.is_running(),
-            "recognition_active": recognition_active,
-            "system_healthy": shared_video_stream.is_running() and recognition_active,
-            "available_for_capture": shared_video_stream.is_running() and not recognition_active
+            "stream_running": stream.is_running(),
+            "recognition_active": recognition_active[camera_id],
+            "system_healthy": stream.is_running() and recognition_active[camera_id],
+            "available_for_capture": stream.is_running() and not recognition_active[camera_id]
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,278 @@
+import datetime
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import requests
+
+class RecognitionScheduler:
+    """
+    Turni equi tra i worker di più camere verso il servizio InsightFace:
+    al massimo max_concurrent richieste in volo, concesse in ordine di arrivo.
+    Ogni worker ha una sola richiesta in attesa alla volta, quindi una camera
+    molto attiva torna in coda dietro alle altre (round-robin) e non le affama.
+    """
+
+    def __init__(self, max_concurrent=1):
+        self.max_concurrent = max(1, max_concurrent)
+        self.condition = threading.Condition()
+        self.waiting = deque()
+        self.in_flight = 0
+
+    @contextmanager
+    def slot(self):
+        ticket = object()
+        with self.condition:
+            self.waiting.append(ticket)
+            self.condition.wait_for(
+                lambda: self.waiting[0] is ticket and self.in_flight < self.max_concurrent
+            )
+            self.waiting.popleft()
+            self.in_flight += 1
+            self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+
+class RecognitionWorker:
+    """
+    Loop di riconoscimento lato server: prende i frame direttamente dallo
+    SharedVideoStreamer, li invia al servizio InsightFace e pubblica i risultati.
+    Il browser si limita a sottoscrivere i risultati (nessun round-trip
+    base64/HTTP del frame attraverso il client).
+    Con un gate (MotionGate) i frame vengono inviati solo in presenza di
+    movimento/volti; a scena vuota al più uno ogni idle_interval secondi
+    (0 = nessuno).
+    Con un tracker (FaceTracker) ogni frame passa solo dalla detection
+    (detect_url) e il riconoscimento dei volti già localizzati (aligned_url)
+    viene richiesto solo per le tracce da (ri)identificare.
+    Con più camere i worker condividono la sessione HTTP (pool di connessioni)
+    e uno scheduler che distribuisce equamente le richieste.
+    """
+
+    def __init__(self, streamer, recognize_url, api_key=None, params=None,
+                 on_results=None, min_interval=0.0, timeout=10,
+                 gate=None, idle_interval=0.0,
+                 tracker=None, detect_url=None, aligned_url=None,
+                 session=None, scheduler=None):
+        self.streamer = streamer
+        self.recognize_url = recognize_url
+        self.tracker = tracker
+        self.detect_url = detect_url
+        self.aligned_url = aligned_url
+        self.params = params or {}
+        self.on_results = on_results
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.gate = gate
+        self.idle_interval = idle_interval
+        self.was_present = False
+        self.last_request = 0.0
+
+        self.scheduler = scheduler
+        self.session = session or requests.Session()
+        if api_key:
+            self.session.headers.update({'x-api-key': api_key})
+
+        self.running = False
+        self.worker_thread = None
+        self.state_lock = threading.Lock()
+
+        # Misure di throughput e latenza (per i test di carico con sorgenti di replay)
+        self.stats_lock = threading.Lock()
+        self._reset_stats()
+
+        # Ultimo risultato pubblicato, con numero di sequenza per i sottoscrittori
+        self.result_condition = threading.Condition()
+        self.latest = {"seq": 0, "timestamp": None, "results": []}
+
+    def start(self):
+        """Avvia il loop di riconoscimento"""
+        with self.state_lock:
+            if self.running:
+                return
+            self.running = True
+            if self.gate:
+                self.gate.reset()
+            if self.tracker:
+                self.tracker.reset()
+            self.was_present = False
+            self._reset_stats()
+            self.worker_thread = threading.Thread(target=self._recognition_loop, daemon=True)
+            self.worker_thread.start()
+
+    def stop(self):
+        """Ferma il loop di riconoscimento e pubblica un risultato vuoto"""
+        with self.state_lock:
+            self.running = False
+            if self.worker_thread and self.worker_thread is not threading.current_thread():
+                self.worker_thread.join(timeout=self.timeout + 1)
+            self.worker_thread = None
+        self._publish([])
+        # A worker fermo _publish non notifica: il chiamante deve comunque
+        # sapere che la scena è vuota (es. per azzerare le tracce già attivate)
+        self._notify([])
+
+    def is_running(self):
+        return self.running
+
+    def _recognition_loop(self):
+        """Riconosce ogni nuovo frame dello stream, al ritmo della camera"""
+        last_seq = None
+
+        while self.running:
+            # Attende il prossimo frame della camera (nessun polling a vuoto)
+            if self.streamer.wait_for_frame(last_seq or 0, timeout=1) == last_seq:
+                time.sleep(0.02)
+                continue
+            if self.gate and not self._gate_allows():
+                last_seq = self.streamer.get_frame_seq()
+                continue
+            # JPEG memoizzato dallo streamer: condiviso con l'anteprima, nessun passaggio base64
+            seq, jpeg = self.streamer.get_jpeg()
+            if jpeg is None:
+                time.sleep(0.02)
+                continue
+            last_seq = seq
+            frame_timestamp = self.streamer.get_frame_timestamp(seq)
+
+            started = time.time()
+            self.last_request = started
+            try:
+                results = self.recognize(jpeg)
+                if self.gate and results:
+                    # Volti ancora visibili: la persona ferma non diventa "assente"
+                    self.gate.keep_present()
+                self._publish(results)
+            except Exception as e:
+                print(f"Errore riconoscimento: {e}")
+                with self.stats_lock:
+                    self.errors += 1
+                time.sleep(1)  # Servizio non raggiungibile: evita un loop a vuoto
+                continue
+            self._record_request(started, frame_timestamp)
+
+            elapsed = time.time() - started
+            if elapsed < self.min_interval:
+                time.sleep(self.min_interval - elapsed)
+
+    def _reset_stats(self):
+        with self.stats_lock:
+            self.stats_started = time.time()
+            self.requests = 0
+            self.errors = 0
+            self.latencies = deque(maxlen=200)    # Durata delle richieste al servizio (s)
+            self.frame_ages = deque(maxlen=200)   # Età del frame alla pubblicazione del risultato (s)
+
+    def _record_request(self, started, frame_timestamp):
+        finished = time.time()
+        with self.stats_lock:
+            self.requests += 1
+            self.latencies.append(finished - started)
+            if frame_timestamp is not None:
+                self.frame_ages.append(finished - frame_timestamp)
+
+    def get_stats(self):
+        """Throughput e latenze (media, p95 in ms) delle ultime richieste"""
+        def summary(samples):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return {
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1)
+            }
+
+        with self.stats_lock:
+            elapsed = time.time() - self.stats_started
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "throughput_fps": round(self.requests / elapsed, 2) if elapsed > 0 else 0.0,
+                "request_latency": summary(self.latencies),
+                "frame_to_result": summary(self.frame_ages)
+            }
+
+    def _gate_allows(self):
+        """Decide con il gate se il frame corrente va inviato al servizio"""
+        _, frame = self.streamer.get_raw_frame()
+        if frame is None:
+            return False
+
+        present = self.gate.update(frame)
+        if present or (self.tracker and self.tracker.tracks):
+            # Con tracce ancora vive i frame continuano a passare: le tracce
+            # scadono normalmente (max_misses) quando i volti non ci sono più
+            self.was_present = True
+            return True
+
+        if self.was_present:
+            # La scena si è svuotata: pulisce gli overlay e i risultati pubblicati
+            self.was_present = False
+            self._publish([])
+
+        return bool(self.idle_interval) and time.time() - self.last_request >= self.idle_interval
+
+    def _post_frame(self, url, jpeg_bytes, data=None):
+        response = self.session.post(
+            url,
+            params=self.params,
+            data=data,
+            files={'file': ('frame.jpg', jpeg_bytes, 'image/jpeg')},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json().get('result', [])
+
+    def recognize(self, jpeg_bytes):
+        """Invia un frame JPEG al servizio e ritorna la lista dei volti"""
+        with self.scheduler.slot() if self.scheduler else nullcontext():
+            return self._recognize(jpeg_bytes)
+
+    def _recognize(self, jpeg_bytes):
+        if self.tracker is None:
+            return self._post_frame(self.recognize_url, jpeg_bytes)
+
+        # Detection sul frame, riconoscimento solo delle tracce nuove o da verificare
+        detections = self._post_frame(self.detect_url, jpeg_bytes)
+        pending = self.tracker.update(detections)
+        if pending:
+            landmarks = [track.detection['landmarks'] for track in pending]
+            results = self._post_frame(self.aligned_url, jpeg_bytes, data={'landmarks': json.dumps(landmarks)})
+            self.tracker.assign(pending, results)
+        return self.tracker.results()
+
+    def _publish(self, results):
+        with self.result_condition:
+            self.latest = {
+                "seq": self.latest["seq"] + 1,
+                "timestamp": datetime.datetime.now().isoformat(),
+                "results": results
+            }
+            self.result_condition.notify_all()
+
+        if self.running:
+            self._notify(results)
+
+    def _notify(self, results):
+        if self.on_results:
+            try:
+                self.on_results(results)
+            except Exception as e:
+                print(f"Errore gestione risultati riconoscimento: {e}")
+
+    def get_results(self):
+        """Restituisce l'ultimo risultato pubblicato"""
+        with self.result_condition:
+            return self.latest
+
+    def wait_for_results(self, after_seq, timeout=15):
+        """Attende un risultato con sequenza successiva ad after_seq (o il timeout)"""
+        with self.result_condition:
+            self.result_condition.wait_for(lambda: self.latest["seq"] > after_seq, timeout=timeout)
+            return self.latest
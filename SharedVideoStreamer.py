@@ -1,16 +1,170 @@
 import cv2
+import os
 import threading
 import base64
 import time
+from collections import deque
+
+class ReplayCapture:
+    """
+    Sorgente di replay con la stessa interfaccia di cv2.VideoCapture usata dallo
+    streamer (grab/retrieve): un file video o una cartella di immagini JPEG/PNG,
+    per pilotare la pipeline senza webcam (test di carico, CI headless).
+    - pacing 'realtime': i frame escono al ritmo della sorgente (FPS del video,
+      oppure fps per le cartelle o se indicato esplicitamente)
+    - pacing 'fast': i frame escono alla velocità massima di lettura
+    Con loop=False la sorgente si chiude a fine replay (finished = True).
+    """
+
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+    DEFAULT_FPS = 10
+
+    def __init__(self, path, pacing='realtime', loop=True, fps=None):
+        self.path = path
+        self.pacing = pacing
+        self.loop = loop
+        self.finished = False
+        self.frame = None
+        self.index = 0
+        self.video = None
+
+        if os.path.isdir(path):
+            self.images = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(self.IMAGE_EXTENSIONS)
+            )
+            source_fps = None
+        else:
+            self.images = None
+            self.video = cv2.VideoCapture(path)
+            source_fps = self.video.get(cv2.CAP_PROP_FPS) if self.video.isOpened() else None
+
+        self.fps = fps or source_fps or self.DEFAULT_FPS
+        self.next_frame_time = None
+
+    def isOpened(self):
+        if self.finished:
+            return False
+        if self.images is not None:
+            return bool(self.images)
+        return self.video.isOpened()
+
+    def set(self, prop, value):
+        return False  # Risoluzione e FPS della sorgente non sono configurabili
+
+    def _read_next(self):
+        """Legge il frame successivo (riparte dall'inizio se loop)"""
+        if self.images is None:
+            ret, frame = self.video.read()
+            if not ret and self.loop:
+                # Fine sorgente: ricomincia
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self.video.read()
+            return frame if ret else None
+
+        # Le immagini illeggibili vengono saltate: il replay finisce solo
+        # dopo un giro completo della cartella senza immagini leggibili
+        for _ in range(len(self.images)):
+            if self.index >= len(self.images):
+                if not self.loop:
+                    return None
+                self.index = 0
+            frame = cv2.imread(self.images[self.index])
+            self.index += 1
+            if frame is not None:
+                return frame
+        return None
+
+    def grab(self):
+        if self.finished:
+            return False
+        if self.pacing == 'realtime':
+            now = time.time()
+            if self.next_frame_time is None:
+                self.next_frame_time = now
+            elif now < self.next_frame_time:
+                time.sleep(self.next_frame_time - now)
+            # Scadenza successiva, senza recuperare i ritardi accumulati
+            self.next_frame_time = max(self.next_frame_time + 1.0 / self.fps, time.time() - 1.0 / self.fps)
+
+        self.frame = self._read_next()
+        if self.frame is None:
+            self.finished = True
+            return False
+        return True
+
+    def retrieve(self):
+        return self.frame is not None, self.frame
+
+    def read(self):
+        return (self.retrieve() if self.grab() else (False, None))
+
+    def release(self):
+        self.finished = True
+        if self.video is not None:
+            self.video.release()
+
 
 class SharedVideoStreamer:
-    def __init__(self):
+    # Valori di default della cattura (sovrascrivibili dal costruttore)
+    STREAM_SIZE = (640, 480)
+    JPEG_QUALITY = 75
+    TARGET_FPS = 10
+
+    def __init__(self, device=0, width=None, height=None, fps=None, jpeg_quality=None, buffer_size=2,
+                 replay_pacing='realtime', replay_loop=True, replay_fps=None):
+        self.device = device  # Indice webcam, URL di uno stream, file video o cartella di immagini
+        # Opzioni dei replay da file/cartella (vedi ReplayCapture)
+        self.replay_pacing = replay_pacing
+        self.replay_loop = replay_loop
+        self.replay_fps = replay_fps
+        self.stream_size = (width or self.STREAM_SIZE[0], height or self.STREAM_SIZE[1])
+        self.target_fps = fps or self.TARGET_FPS
+        self.jpeg_quality = jpeg_quality or self.JPEG_QUALITY
         self.cap = None
         self.running = False
-        self.current_frame = None
+        # Ring buffer drop-oldest degli ultimi frame grezzi (seq, timestamp di cattura, array BGR):
+        # la cattura non aspetta mai i consumatori, che leggono sempre il più recente
+        self.frames = deque(maxlen=max(1, buffer_size))
+        self.frame_seq = 0
         self.frame_lock = threading.Lock()
+        # Notifica i consumatori in attesa di un nuovo frame (MJPEG, long-poll)
+        self.frame_condition = threading.Condition(self.frame_lock)
+        # Codifiche del frame corrente, calcolate solo su richiesta: {(formato, qualità): bytes}
+        self.encoded_cache = {}
+        self.encoded_seq = None
+        self.encoded_timestamp = None
+        self.encode_lock = threading.Lock()
         self.capture_thread = None
         self.restart_lock = threading.Lock()  # Nuovo: lock per restart sicuro
+        self.stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        # Statistiche di cattura: intervalli tra frame (media mobile) ed età dei frame consegnati
+        self.capture_interval = None
+        self.grab_interval = None
+        self.last_publish_time = None
+        self.last_grab_time = None
+        self.grabbed_frames = 0
+        self.skipped_frames = 0
+        self.delivered_age = None
+
+    def is_replay(self):
+        """True se la sorgente è un file video o una cartella di immagini locali"""
+        return isinstance(self.device, str) and os.path.exists(self.device)
+
+    def _open_capture(self):
+        """Apre la sorgente e applica risoluzione e FPS configurati"""
+        if self.is_replay():
+            return ReplayCapture(self.device, self.replay_pacing, self.replay_loop, self.replay_fps)
+        cap = cv2.VideoCapture(self.device)
+        if cap.isOpened():
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.stream_size[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.stream_size[1])
+            cap.set(cv2.CAP_PROP_FPS, self.target_fps)
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Riduce latenza (ignorato da molti driver V4L2)
+        return cap
     
     def start_stream(self):
         """Avvia lo stream video condiviso"""
@@ -23,16 +177,11 @@ class SharedVideoStreamer:
                 self.cap.release()
                 time.sleep(0.5)  # Pausa per rilascio risorse
                 
-            self.cap = cv2.VideoCapture(0)
+            self.cap = self._open_capture()
             if not self.cap.isOpened():
                 raise Exception("Impossibile aprire la webcam")
-                
-            # Configura le proprietà della webcam per migliori performance
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.cap.set(cv2.CAP_PROP_FPS, 30)
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Riduce latenza
             
+            self._reset_stats()
             self.running = True
             self.capture_thread = threading.Thread(target=self._capture_frames, daemon=True)
             self.capture_thread.start()
@@ -50,7 +199,11 @@ class SharedVideoStreamer:
                 self.cap = None
                 
             with self.frame_lock:
-                self.current_frame = None
+                self.frames.clear()
+                self.frame_condition.notify_all()
+            with self.encode_lock:
+                self.encoded_cache = {}
+                self.encoded_seq = None
     
     def restart_stream(self):
         """Riavvia lo stream in modo sicuro"""
@@ -60,42 +213,67 @@ class SharedVideoStreamer:
             self.start_stream()
     
     def _capture_frames(self):
-        """Loop di cattura frame in background"""
+        """
+        Loop di cattura in background: legge di continuo dalla sorgente (grab)
+        così il buffer del driver non accumula frame vecchi, e decodifica
+        (retrieve) solo i frame necessari per rispettare target_fps.
+        Un replay 'fast' pubblica invece ogni frame, alla velocità di lettura.
+        """
         consecutive_failures = 0
         max_failures = 5
+        frame_interval = 1.0 / self.target_fps if self.target_fps > 0 else 0
+        if self.is_replay() and self.replay_pacing == 'fast':
+            frame_interval = 0
+        next_publish = 0
         
         while self.running and self.cap:
             try:
-                ret, frame = self.cap.read()
+                ret = self.cap.grab()
                 if ret:
                     consecutive_failures = 0  # Reset contatore errori
+                    grab_time = time.time()
+                    self._update_grab_stats(grab_time)
                     
-                    # Ridimensiona per performance di rete
-                    frame = cv2.resize(frame, (640, 480))
+                    # Tolleranza per il jitter, minore del passo della sorgente
+                    tolerance = min(frame_interval / 4, (self.grab_interval or 0) / 2)
+                    if grab_time < next_publish - tolerance:
+                        # Frame in eccesso rispetto al target: scartato senza decodifica
+                        with self.stats_lock:
+                            self.skipped_frames += 1
+                        continue
                     
-                    # Converte in JPEG con qualità ottimizzata
-                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
-                    frame_b64 = base64.b64encode(buffer).decode('utf-8')
-                    
-                    # Aggiorna il frame corrente thread-safe
+                    ret, frame = self.cap.retrieve()
+                    if ret:
+                        # Scadenza successiva, senza recuperare i ritardi accumulati
+                        next_publish += frame_interval
+                        if next_publish <= grab_time:
+                            next_publish = grab_time + frame_interval
+                        self._publish_frame(frame, grab_time)
+                        continue
+                
+                if isinstance(self.cap, ReplayCapture) and self.cap.finished:
+                    # Replay senza loop terminato: lo stream si ferma
+                    print(f"Replay terminato: {self.device}")
                     with self.frame_lock:
-                        self.current_frame = frame_b64
+                        self.running = False
+                        self.frame_condition.notify_all()
+                    break
+                
+                consecutive_failures += 1
+                if consecutive_failures >= max_failures:
+                    # Troppi errori consecutivi, tenta restart
+                    time.sleep(1)
+                    if self.running:  # Solo se ancora dovrebbe girare
+                        try:
+                            self.cap.release()
+                            time.sleep(0.5)
+                            self.cap = self._open_capture()
+                            consecutive_failures = 0
+                        except Exception as e:
+                            print(f"Errore restart webcam: {e}")
+                            break
                 else:
-                    consecutive_failures += 1
-                    if consecutive_failures >= max_failures:
-                        # Troppi errori consecutivi, tenta restart
-                        time.sleep(1)
-                        if self.running:  # Solo se ancora dovrebbe girare
-                            try:
-                                self.cap.release()
-                                time.sleep(0.5)
-                                self.cap = cv2.VideoCapture(0)
-                                consecutive_failures = 0
-                            except Exception as e:
-                                print(f"Errore restart webcam: {e}")
-                                break
-                    else:
-                        time.sleep(0.1)
+                    time.sleep(0.1)
                         
             except Exception as e:
                 print(f"Errore cattura frame: {e}")
@@ -103,14 +281,145 @@ class SharedVideoStreamer:
                 if consecutive_failures >= max_failures:
                     break
                 time.sleep(0.1)
-            
-            # Controllo frame rate (circa 10 FPS per streaming)
-            time.sleep(0.1)
+
+    def _update_grab_stats(self, grab_time):
+        with self.stats_lock:
+            self.grabbed_frames += 1
+            if self.last_grab_time is not None and grab_time > self.last_grab_time:
+                self.grab_interval = self._smooth(self.grab_interval, grab_time - self.last_grab_time)
+            self.last_grab_time = grab_time
+
+    def _publish_frame(self, frame, timestamp):
+        """Salva solo il frame grezzo nel ring buffer: la codifica avviene su richiesta"""
+        with self.frame_lock:
+            self.frame_seq += 1
+            self.frames.append((self.frame_seq, timestamp, frame))
+            self.frame_condition.notify_all()
+        
+        with self.stats_lock:
+            if self.last_publish_time is not None and timestamp > self.last_publish_time:
+                self.capture_interval = self._smooth(self.capture_interval, timestamp - self.last_publish_time)
+            self.last_publish_time = timestamp
+
+    @staticmethod
+    def _smooth(current, sample, alpha=0.1):
+        """Media mobile esponenziale (il primo campione inizializza il valore)"""
+        return sample if current is None else current + alpha * (sample - current)
+
+    def _latest(self):
+        """(seq, timestamp, frame) del frame più recente (da chiamare con frame_lock)"""
+        if not self.frames:
+            return self.frame_seq, None, None
+        return self.frames[-1]
+
+    def _record_delivery(self, timestamp):
+        """Registra l'età del frame nel momento in cui viene consegnato a un consumatore"""
+        if timestamp is None:
+            return
+        with self.stats_lock:
+            self.delivered_age = self._smooth(self.delivered_age, time.time() - timestamp)
+
+    def get_stats(self):
+        """Statistiche della cattura: FPS misurati, frame scartati ed età dei frame (ms)"""
+        with self.frame_lock:
+            _, timestamp, _ = self._latest()
+        with self.stats_lock:
+            return {
+                "device": str(self.device),
+                "resolution": list(self.stream_size),
+                "target_fps": self.target_fps,
+                "capture_fps": round(1.0 / self.capture_interval, 1) if self.capture_interval else None,
+                "source_fps": round(1.0 / self.grab_interval, 1) if self.grab_interval else None,
+                "grabbed_frames": self.grabbed_frames,
+                "skipped_frames": self.skipped_frames,
+                "frame_age_ms": round((time.time() - timestamp) * 1000, 1) if timestamp else None,
+                "delivered_age_ms": round(self.delivered_age * 1000, 1) if self.delivered_age is not None else None
+            }
     
-    def get_frame(self):
-        """Restituisce l'ultimo frame catturato"""
+    def get_raw_frame(self):
+        """Restituisce (seq, frame) dell'ultimo frame grezzo catturato (da non modificare)"""
+        with self.frame_lock:
+            seq, timestamp, frame = self._latest()
+        self._record_delivery(timestamp)
+        return seq, frame
+
+    def get_frame_timestamp(self, seq):
+        """Istante di cattura del frame seq, se ancora nel ring buffer"""
+        with self.frame_lock:
+            for frame_seq, timestamp, _ in self.frames:
+                if frame_seq == seq:
+                    return timestamp
+        return None
+
+    def get_frame_seq(self):
+        """Restituisce il numero di sequenza dell'ultimo frame catturato"""
+        with self.frame_lock:
+            return self.frame_seq
+
+    def wait_for_frame(self, after_seq, timeout=5):
+        """Attende un frame con sequenza successiva ad after_seq. Ritorna la sequenza corrente."""
+        with self.frame_condition:
+            self.frame_condition.wait_for(
+                lambda: self.frame_seq > after_seq or not self.running,
+                timeout=timeout
+            )
+            return self.frame_seq
+
+    def get_encoded_frame(self, fmt='.jpg', quality=None):
+        """
+        Restituisce (seq, bytes) dell'ultimo frame codificato nel formato richiesto.
+        La codifica è memoizzata per numero di sequenza, formato e qualità:
+        più client dello stesso frame pagano una sola codifica.
+        """
+        quality = quality or self.jpeg_quality
+        key = (fmt, quality)
         with self.frame_lock:
-            return self.current_frame
+            seq, timestamp, frame = self._latest()
+        if frame is None:
+            return seq, None
+        self._record_delivery(timestamp)
+
+        with self.encode_lock:
+            if self.encoded_seq != seq:
+                self.encoded_cache = {}
+                self.encoded_seq = seq
+                self.encoded_timestamp = timestamp
+            encoded = self.encoded_cache.get(key)
+            if encoded is None:
+                # Ridimensiona per performance di rete
+                if (frame.shape[1], frame.shape[0]) != self.stream_size:
+                    frame = cv2.resize(frame, self.stream_size)
+                params = [cv2.IMWRITE_JPEG_QUALITY, quality] if fmt == '.jpg' else []
+                _, buffer = cv2.imencode(fmt, frame, params)
+                encoded = buffer.tobytes()
+                self.encoded_cache[key] = encoded
+            return seq, encoded
+
+    def get_jpeg(self, quality=None):
+        """Restituisce (seq, bytes JPEG) dell'ultimo frame"""
+        return self.get_encoded_frame('.jpg', quality)
+
+    def get_frame(self):
+        """Restituisce l'ultimo frame catturato come JPEG in base64"""
+        packet = self.get_frame_packet()
+        return packet["frame"] if packet else None
+
+    def get_frame_packet(self, quality=None):
+        """
+        Restituisce l'ultimo frame come dizionario {seq, timestamp, frame}:
+        JPEG in base64 etichettato con numero di sequenza e istante di cattura
+        (secondi epoch), oppure None se non è ancora disponibile alcun frame.
+        """
+        seq, jpeg = self.get_jpeg(quality)
+        if jpeg is None:
+            return None
+        with self.encode_lock:
+            timestamp = self.encoded_timestamp if self.encoded_seq == seq else None
+        return {
+            "seq": seq,
+            "timestamp": timestamp,
+            "frame": base64.b64encode(jpeg).decode('utf-8')
+        }
     
     def is_running(self):
         """Verifica se lo stream è attivo"""
@@ -123,4 +432,49 @@ class SharedVideoStreamer:
             return True
         except Exception as e:
             print(f"Errore force restart: {e}")
-            return False
\ No newline at end of file
+            return False
+
+def parse_camera_sources(value):
+    """
+    Interpreta la configurazione delle camere 'id=sorgente,id2=sorgente2'.
+    La sorgente è un indice di webcam USB, un URL RTSP/HTTP o un file video.
+    """
+    sources = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '=' not in item:
+            raise ValueError(f"Camera non valida '{item}', formato atteso id=sorgente")
+        camera_id, source = (part.strip() for part in item.split('=', 1))
+        sources[camera_id] = int(source) if source.isdigit() else source
+    return sources
+
+
+class VideoStreamRegistry:
+    """Registro degli stream video con nome (uno per ingresso), ognuno con la propria cattura"""
+
+    def __init__(self):
+        self.streams = {}
+        self.default_id = None
+
+    def add(self, camera_id, stream):
+        if camera_id in self.streams:
+            raise ValueError(f"Camera '{camera_id}' già registrata")
+        self.streams[camera_id] = stream
+        if self.default_id is None:
+            self.default_id = camera_id  # La prima camera registrata è quella di default
+        return stream
+
+    def get(self, camera_id=None):
+        """Stream della camera richiesta (None = camera di default)"""
+        return self.streams[camera_id or self.default_id]
+
+    def ids(self):
+        return list(self.streams)
+
+    def items(self):
+        return self.streams.items()
+
+    def __contains__(self, camera_id):
+        return camera_id in self.streams
@@ -6,23 +6,37 @@ per permettere una migrazione trasparente.
 
 Endpoints implementati:
 - POST /api/v1/recognition/recognize - Riconoscimento 1:N
+- POST /api/v1/recognition/recognize/aligned - Riconoscimento 1:N da volti già localizzati
+- POST /api/v1/recognition/embed - Embedding di volti già localizzati (senza detection)
+- POST /api/v1/detection/detect - Solo detection (box e landmark, senza riconoscimento)
 - POST /api/v1/recognition/faces - Aggiunta volto
+- POST /api/v1/recognition/faces/bulk - Enrollment massivo (multipart o zip)
 - GET  /api/v1/recognition/faces - Lista volti
 - DELETE /api/v1/recognition/faces - Elimina tutti i volti di un soggetto
 - DELETE /api/v1/recognition/faces/{image_id} - Elimina singolo volto
 - GET  /api/v1/recognition/faces/{image_id}/img - Ottieni immagine
 - GET  /api/v1/recognition/subjects - Lista soggetti
+- GET  /api/v1/recognition/subjects/summary - Soggetti paginati con conteggio volti
 - POST /api/v1/recognition/subjects - Crea soggetto
 - DELETE /api/v1/recognition/subjects/{subject} - Elimina soggetto
 - PUT  /api/v1/recognition/subjects/{subject} - Rinomina soggetto
+- POST /api/v1/recognition/batch - Modifiche multiple in una transazione
 """
 
 import os
+import asyncio
 import uuid
+import json
 import pickle
 import logging
+import threading
+import glob
+import shutil
+import itertools
+import zipfile
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 from io import BytesIO
 
@@ -33,7 +47,10 @@ from fastapi import FastAPI, File, UploadFile, Form, Query, HTTPException, Heade
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from insightface import model_zoo
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
 
 # ============================================
 # CONFIGURAZIONE
@@ -51,15 +68,251 @@ SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))
 DETECTION_THRESHOLD = float(os.getenv("DETECTION_THRESHOLD", "0.5"))
 MODEL_NAME = os.getenv("MODEL_NAME", "buffalo_l")
 DET_SIZE = int(os.getenv("DET_SIZE", "640"))
+# Dimensioni di detection richiedibili per singola richiesta (parametro det_size)
+DET_SIZES = sorted({DET_SIZE} | {int(size) for size in os.getenv("DET_SIZES", "320,480,640").split(",") if size.strip()})
+# Moduli del modello caricati all'avvio: solo detection e riconoscimento di default.
+# I modelli di attributi (es. genderage) vengono caricati solo se richiesti via face_plugins.
+ALLOWED_MODULES = [m.strip() for m in os.getenv("ALLOWED_MODULES", "detection,recognition").split(",") if m.strip()]
+# Plugin CompreFace supportati -> taskname del modello InsightFace che li calcola
+FACE_PLUGIN_MODULES = {
+    "age": "genderage",
+    "gender": "genderage",
+}
+PROVIDERS = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+# Thread dedicati all'inferenza e richieste massime in coda oltre a quelle in esecuzione
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+# Micro-batching del modello di riconoscimento: finestra di raccolta dei volti
+# provenienti da richieste concorrenti e dimensione massima del batch
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "8"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+# Enrollment massivo: immagini massime per richiesta, thread di decodifica/detection
+# (pool proprio, condiviso da tutte le richieste di enrollment massivo) e
+# dimensione dei chunk passati al modello di riconoscimento
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "500"))
+BULK_DECODE_WORKERS = int(os.getenv("BULK_DECODE_WORKERS", "2"))
+BULK_EMBED_BATCH = int(os.getenv("BULK_EMBED_BATCH", "32"))
+# Attesa massima di un worker di inferenza libero per un chunk dell'enrollment massivo
+BULK_EMBED_WAIT_S = float(os.getenv("BULK_EMBED_WAIT_S", "30"))
+# Estensioni considerate immagini negli archivi zip
+BULK_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+# Miniature (lato lungo in pixel) generate all'enrollment e servite con il parametro size
+THUMBNAIL_SIZES = sorted({int(size) for size in os.getenv("THUMBNAIL_SIZES", "96,256").split(",") if size.strip()})
+# Durata della cache del browser per le immagini dei volti (il contenuto di un image_id non cambia)
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "86400"))
+# Numero di record nel journal dopo cui si compatta in un nuovo snapshot
+JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", "500"))
 
 # Percorsi dati persistenti
 DATA_DIR = Path("/app/data")
-EMBEDDINGS_DB_PATH = DATA_DIR / "embeddings.pkl"
+EMBEDDINGS_META_PATH = DATA_DIR / "embeddings.json"
+EMBEDDINGS_JOURNAL_PATH = DATA_DIR / "embeddings.journal"
 IMAGES_DIR = DATA_DIR / "images"
+THUMBNAILS_DIR = DATA_DIR / "thumbnails"
+# Database pickle delle versioni precedenti, migrato al primo avvio
+LEGACY_EMBEDDINGS_DB_PATH = DATA_DIR / "embeddings.pkl"
 
 # Crea directory se non esistono
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+
+# ============================================
+# INDICE GALLERY PER MATCHING 1:N
+# ============================================
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Normalizza L2 le righe di una matrice di embeddings (float32)"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+class GalleryIndex:
+    """
+    Matrice contigua degli embeddings registrati, già normalizzati L2,
+    con array paralleli di subject e image_id.
+    Il matching di tutti i volti di un frame si riduce a un prodotto
+    matriciale seguito da un argpartition per il top-k.
+    
+    L'indice viene aggiornato in place ad ogni modifica del database:
+    - aggiunta volto: append di una riga (capacità raddoppiata quando piena)
+    - eliminazione volto: swap-remove con l'ultima riga
+    - rinomina soggetto: rietichettatura del codice soggetto, nessuna riga toccata
+    """
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._subject_codes = np.empty(0, dtype=np.int32)
+        self.image_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._subject_names: Dict[int, str] = {}
+        self._codes_by_subject: Dict[str, int] = {}
+        self._next_code = 0
+
+    def __len__(self) -> int:
+        return len(self.image_ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Vista delle righe valide della matrice (N, D)"""
+        return self._matrix[:len(self)]
+
+    def build(self, subjects_data: Dict[str, Dict]):
+        """Ricostruisce la matrice a partire dalla struttura annidata del database"""
+        with self._lock:
+            self._reset()
+            for subject, subject_data in subjects_data.items():
+                for image_id, face_data in subject_data["faces"].items():
+                    self.add(subject, image_id, face_data["embedding"])
+
+    def load(self, matrix: np.ndarray, subjects: List[str], image_ids: List[str]):
+        """
+        Adotta una matrice già normalizzata (es. np.memmap in copy-on-write)
+        senza copiarla: la copia in memoria avviene solo alla prima crescita.
+        """
+        with self._lock:
+            self._reset()
+            self._matrix = matrix
+            self._subject_codes = np.fromiter(
+                (self._subject_code(subject) for subject in subjects),
+                dtype=np.int32,
+                count=len(subjects)
+            )
+            self.image_ids = list(image_ids)
+            self._rows = {image_id: row for row, image_id in enumerate(self.image_ids)}
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Ritorna subject, image_id ed embedding normalizzato di ogni riga"""
+        with self._lock:
+            return [
+                {
+                    "subject": self._subject_names[self._subject_codes[row]],
+                    "image_id": image_id,
+                    "embedding": np.array(self._matrix[row])
+                }
+                for row, image_id in enumerate(self.image_ids)
+            ]
+
+    def _subject_code(self, subject: str) -> int:
+        code = self._codes_by_subject.get(subject)
+        if code is None:
+            code = self._next_code
+            self._next_code += 1
+            self._codes_by_subject[subject] = code
+            self._subject_names[code] = subject
+        return code
+
+    def _ensure_capacity(self, dim: int):
+        n = len(self)
+        if self._matrix.shape[1] != dim:
+            if n:
+                raise ValueError(f"Dimensione embedding {dim} diversa da quella della gallery ({self._matrix.shape[1]})")
+            self._matrix = np.empty((self.INITIAL_CAPACITY, dim), dtype=np.float32)
+            self._subject_codes = np.empty(self.INITIAL_CAPACITY, dtype=np.int32)
+        elif n == self._matrix.shape[0]:
+            capacity = max(self.INITIAL_CAPACITY, 2 * n)
+            matrix = np.empty((capacity, dim), dtype=np.float32)
+            matrix[:n] = self._matrix[:n]
+            codes = np.empty(capacity, dtype=np.int32)
+            codes[:n] = self._subject_codes[:n]
+            self._matrix = matrix
+            self._subject_codes = codes
+
+    def add(self, subject: str, image_id: str, embedding: np.ndarray):
+        """Aggiunge (o sostituisce) la riga di un volto"""
+        row_data = l2_normalize(np.asarray(embedding, dtype=np.float32).ravel())
+        with self._lock:
+            if image_id in self._rows:
+                self.remove(image_id)
+            self._ensure_capacity(row_data.shape[0])
+            row = len(self)
+            self._matrix[row] = row_data
+            self._subject_codes[row] = self._subject_code(subject)
+            self.image_ids.append(image_id)
+            self._rows[image_id] = row
+
+    def remove(self, image_id: str) -> bool:
+        """Rimuove la riga di un volto spostando l'ultima riga al suo posto"""
+        with self._lock:
+            row = self._rows.pop(image_id, None)
+            if row is None:
+                return False
+            last = len(self) - 1
+            if row != last:
+                moved_id = self.image_ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._subject_codes[row] = self._subject_codes[last]
+                self.image_ids[row] = moved_id
+                self._rows[moved_id] = row
+            self.image_ids.pop()
+            return True
+
+    def remove_subject(self, subject: str) -> int:
+        """Rimuove tutte le righe di un soggetto. Ritorna il numero di righe rimosse."""
+        with self._lock:
+            code = self._codes_by_subject.pop(subject, None)
+            if code is None:
+                return 0
+            del self._subject_names[code]
+            rows = np.flatnonzero(self._subject_codes[:len(self)] == code)
+            # Ordine decrescente: lo swap-remove non sposta le righe ancora da rimuovere
+            for row in rows[::-1].tolist():
+                self.remove(self.image_ids[row])
+            return len(rows)
+
+    def rename_subject(self, old_name: str, new_name: str):
+        """Rietichetta il codice di un soggetto"""
+        with self._lock:
+            code = self._codes_by_subject.pop(old_name, None)
+            if code is None:
+                return
+            self._codes_by_subject[new_name] = code
+            self._subject_names[code] = new_name
+
+    def search(self, embeddings: np.ndarray, top_k: int = 1) -> List[List[Dict[str, Any]]]:
+        """
+        Cerca i top_k volti più simili per ciascun embedding di query.
+        top_k <= 0 ritorna tutti i volti della gallery, ordinati per similarità.
+        """
+        queries = l2_normalize(np.atleast_2d(embeddings))
+        with self._lock:
+            n = len(self)
+            if n == 0 or queries.shape[0] == 0:
+                return [[] for _ in range(queries.shape[0])]
+
+            # Similarità coseno di tutte le query contro tutta la gallery: (Q, N)
+            similarities = queries @ self.matrix.T
+
+            k = n if top_k <= 0 or top_k >= n else top_k
+            if k < n:
+                top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(n), (queries.shape[0], n))
+            top_scores = np.take_along_axis(similarities, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            return [
+                [
+                    {
+                        "subject": self._subject_names[self._subject_codes[idx]],
+                        "image_id": self.image_ids[idx],
+                        "similarity": float(score)
+                    }
+                    for idx, score in zip(row_idx.tolist(), row_scores.tolist())
+                ]
+                for row_idx, row_scores in zip(top, top_scores)
+            ]
+
 
 # ============================================
 # DATABASE IN-MEMORY CON PERSISTENZA
@@ -68,184 +321,623 @@ IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 class FaceDatabase:
     """
     Database per gestire embeddings e metadati dei volti.
-    Struttura:
+    Struttura dei metadati:
     {
         "subjects": {
             "subject_name": {
                 "faces": {
                     "image_id": {
-                        "embedding": np.ndarray,
                         "added_at": datetime,
                         "image_path": str
                     }
                 }
             }
-        }
+        },
+        "journal_seq": int
     }
+    Gli embeddings vivono solo nella GalleryIndex.
+    
+    Persistenza journaled: ogni modifica è un record (add/delete/rename)
+    accodato al journal append-only, con costo O(1) su disco. Ogni
+    `compact_every` record viene scritto un nuovo snapshot e il journal
+    viene azzerato. All'avvio si carica lo snapshot e si riapplicano i
+    record del journal con sequenza successiva a quella dello snapshot.
+    
+    Lo snapshot è composto da:
+    - una matrice float32 piatta `embeddings-<seq>.npy` (righe già normalizzate)
+    - un file JSON di metadati con l'ordine delle righe, scritto per ultimo
+      in modo atomico: è il punto di commit dello snapshot
+    All'avvio la matrice è aperta con np.memmap in copy-on-write, senza
+    deserializzare nulla; viene copiata in memoria solo alla prima crescita.
+    Journal, sequenza e indice vivono nel processo: il servizio deve girare
+    con un solo worker uvicorn (più processi scriverebbero gli stessi file).
     """
     
-    def __init__(self, db_path: Path):
-        self.db_path = db_path
-        self.data: Dict[str, Dict] = {"subjects": {}}
+    def __init__(self, meta_path: Path, journal_path: Path, compact_every: int = 500,
+                 legacy_path: Optional[Path] = None):
+        self.meta_path = meta_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.legacy_path = legacy_path
+        self.data: Dict[str, Any] = {"subjects": {}, "journal_seq": 0}
+        self.gallery = GalleryIndex()
+        self._instance_id = uuid.uuid4().hex[:8]
+        # Indice secondario image_id -> subject per lookup O(1)
+        self._face_subjects: Dict[str, str] = {}
+        self._matrix_file: Optional[str] = None
+        self._lock = threading.RLock()
+        # Serializza la scrittura degli snapshot, che avviene fuori da _lock
+        self._save_lock = threading.Lock()
+        self._journal = None
+        self._journal_records = 0
         self.load()
     
     def load(self):
-        """Carica il database da disco"""
-        if self.db_path.exists():
+        """Carica lo snapshot da disco e riapplica il journal"""
+        with self._lock:
+            if self.meta_path.exists():
+                try:
+                    self._load_snapshot()
+                    logger.info(f"Snapshot caricato: {len(self.data['subjects'])} soggetti, {len(self.gallery)} volti")
+                except Exception as e:
+                    logger.error(f"Errore caricamento database: {e}")
+                    self.data = {"subjects": {}, "journal_seq": 0}
+                    self.gallery.build(self.data["subjects"])
+            elif self.legacy_path is not None and self.legacy_path.exists():
+                self._migrate_legacy()
+            else:
+                logger.info("Database vuoto inizializzato")
+            self._face_subjects = {
+                image_id: subject
+                for subject, subject_data in self.data["subjects"].items()
+                for image_id in subject_data["faces"]
+            }
+            
+            replayed = self._replay_journal()
+            logger.info(f"Journal riapplicato: {replayed} record, gallery di {len(self.gallery)} volti")
+            
+            self._journal = open(self.journal_path, "ab")
+    
+    def _load_snapshot(self):
+        """Carica i metadati JSON e apre la matrice degli embeddings in memmap"""
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        
+        self.data = {"subjects": meta["subjects"], "journal_seq": meta["journal_seq"]}
+        self._matrix_file = meta.get("matrix_file")
+        image_ids = meta["rows"]
+        
+        if not image_ids:
+            self.gallery.build(self.data["subjects"])
+            return
+        
+        subject_of = {
+            image_id: subject
+            for subject, subject_data in self.data["subjects"].items()
+            for image_id in subject_data["faces"]
+        }
+        matrix = np.load(self.meta_path.parent / self._matrix_file, mmap_mode="c")
+        if matrix.shape[0] != len(image_ids):
+            raise ValueError(f"Snapshot incoerente: {matrix.shape[0]} righe per {len(image_ids)} volti")
+        self.gallery.load(matrix, [subject_of[image_id] for image_id in image_ids], image_ids)
+    
+    def _migrate_legacy(self):
+        """Converte il vecchio database pickle nel formato snapshot + journal"""
+        try:
+            with open(self.legacy_path, "rb") as f:
+                legacy = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Errore caricamento database pickle: {e}")
+            return
+        
+        self.gallery.build(legacy["subjects"])
+        self.data = {
+            "subjects": {
+                subject: {
+                    "faces": {
+                        image_id: {
+                            "added_at": face_data.get("added_at", ""),
+                            "image_path": face_data.get("image_path", "")
+                        }
+                        for image_id, face_data in subject_data["faces"].items()
+                    }
+                }
+                for subject, subject_data in legacy["subjects"].items()
+            },
+            "journal_seq": legacy.get("journal_seq", 0)
+        }
+        self.save()
+        self.legacy_path.rename(self.legacy_path.with_suffix(".pkl.migrated"))
+        logger.info(f"Database pickle migrato: {len(self.data['subjects'])} soggetti, {len(self.gallery)} volti")
+    
+    def _replay_journal(self) -> int:
+        """Riapplica i record del journal successivi allo snapshot"""
+        if not self.journal_path.exists():
+            return 0
+        
+        replayed = 0
+        valid_offset = 0
+        with open(self.journal_path, "rb") as f:
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    # Record troncato da un crash durante la scrittura: si scarta la coda
+                    logger.warning(f"Journal troncato all'offset {valid_offset}: {e}")
+                    break
+                valid_offset = f.tell()
+                self._journal_records += 1
+                if record["seq"] <= self.data["journal_seq"]:
+                    continue
+                self._apply(record)
+                self.data["journal_seq"] = record["seq"]
+                replayed += 1
+        
+        if valid_offset != self.journal_path.stat().st_size:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(valid_offset)
+        return replayed
+    
+    def _apply(self, record: Dict[str, Any]) -> Any:
+        """Applica un record del journal alla struttura in memoria e alla gallery"""
+        op = record["op"]
+        subjects = self.data["subjects"]
+        
+        if op == "add_subject":
+            subjects.setdefault(record["subject"], {"faces": {}})
+        
+        elif op == "delete_subject":
+            subject_data = subjects.pop(record["subject"], None)
+            if subject_data is not None:
+                for image_id in subject_data["faces"]:
+                    self._face_subjects.pop(image_id, None)
+                self.gallery.remove_subject(record["subject"])
+        
+        elif op == "rename_subject":
+            old_name, new_name = record["old_name"], record["new_name"]
+            if old_name in subjects and new_name not in subjects:
+                subjects[new_name] = subjects.pop(old_name)
+                for image_id in subjects[new_name]["faces"]:
+                    self._face_subjects[image_id] = new_name
+                self.gallery.rename_subject(old_name, new_name)
+        
+        elif op == "add_face":
+            self._apply_add_face(record)
+        
+        elif op == "add_faces":
+            for face in record["faces"]:
+                self._apply_add_face(face)
+        
+        elif op == "delete_face":
+            subject = self._face_subjects.pop(record["image_id"], None)
+            if subject is not None:
+                subjects[subject]["faces"].pop(record["image_id"], None)
+                self.gallery.remove(record["image_id"])
+                return subject
+        
+        elif op == "batch":
+            for operation in record["operations"]:
+                self._apply(operation)
+        
+        elif op == "delete_all_faces":
+            if record["subject"] in subjects:
+                for image_id in subjects[record["subject"]]["faces"]:
+                    self._face_subjects.pop(image_id, None)
+                subjects[record["subject"]]["faces"] = {}
+                self.gallery.remove_subject(record["subject"])
+        
+        else:
+            raise ValueError(f"Operazione journal sconosciuta: {op}")
+        return None
+    
+    def _apply_add_face(self, face: Dict[str, Any]):
+        subject = face["subject"]
+        self.gallery.add(subject, face["image_id"], face["embedding"])
+        self.data["subjects"].setdefault(subject, {"faces": {}})
+        self.data["subjects"][subject]["faces"][face["image_id"]] = {
+            "added_at": face["added_at"],
+            "image_path": face["image_path"]
+        }
+        self._face_subjects[face["image_id"]] = subject
+    
+    def _commit(self, op: str, **fields) -> Any:
+        """
+        Applica una modifica e la accoda al journal. La compattazione non
+        avviene qui: i chiamanti invocano _compact_if_needed() dopo aver
+        rilasciato il lock.
+        """
+        with self._lock:
+            record = {"seq": self.data["journal_seq"] + 1, "op": op, **fields}
+            result = self._apply(record)
+            self.data["journal_seq"] = record["seq"]
+            
             try:
-                with open(self.db_path, "rb") as f:
-                    self.data = pickle.load(f)
-                logger.info(f"Database caricato: {len(self.data['subjects'])} soggetti")
+                pickle.dump(record, self._journal, protocol=pickle.HIGHEST_PROTOCOL)
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal_records += 1
             except Exception as e:
-                logger.error(f"Errore caricamento database: {e}")
-                self.data = {"subjects": {}}
-        else:
-            logger.info("Database vuoto inizializzato")
+                logger.error(f"Errore scrittura journal: {e}")
+            return result
+    
+    def _compact_if_needed(self):
+        """Scrive uno snapshot se il journal è cresciuto oltre compact_every (da chiamare fuori dal lock)"""
+        if self._journal_records < self.compact_every:
+            return
+        # Se un'altra compattazione è già in corso non serve accodarne una seconda
+        if not self._save_lock.acquire(blocking=False):
+            return
+        try:
+            self._write_snapshot()
+        finally:
+            self._save_lock.release()
     
     def save(self):
-        """Salva il database su disco"""
+        """Compatta il database: scrive lo snapshot completo e azzera il journal"""
+        with self._save_lock:
+            self._write_snapshot()
+    
+    def _write_snapshot(self):
+        """
+        Copia lo stato sotto lock e scrive i file fuori dal lock: le modifiche
+        concorrenti proseguono sul journal durante la scrittura. Alla fine il
+        journal viene ridotto ai soli record successivi allo snapshot.
+        """
+        with self._lock:
+            seq = self.data["journal_seq"]
+            matrix_file = f"{self.meta_path.stem}-{seq}.npy"
+            # I dati dei singoli volti non vengono mai modificati in place:
+            # basta copiare i dizionari dei soggetti
+            subjects = {
+                subject: {"faces": dict(subject_data["faces"])}
+                for subject, subject_data in self.data["subjects"].items()
+            }
+            rows = list(self.gallery.image_ids)
+            matrix = np.array(self.gallery.matrix) if matrix_file != self._matrix_file else None
+            journal_offset = self._journal.tell() if self._journal is not None else 0
+        
+        matrix_path = self.meta_path.parent / matrix_file
+        meta_tmp_path = self.meta_path.with_suffix(self.meta_path.suffix + ".tmp")
         try:
-            with open(self.db_path, "wb") as f:
-                pickle.dump(self.data, f)
-            logger.info("Database salvato su disco")
+            # 1. Matrice degli embeddings in un nuovo file (mai sovrascritto in place)
+            if matrix is not None:
+                matrix_tmp_path = matrix_path.with_suffix(".tmp")
+                with open(matrix_tmp_path, "wb") as f:
+                    np.save(f, matrix)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(matrix_tmp_path, matrix_path)
+            
+            # 2. Metadati: il rename atomico è il punto di commit dello snapshot
+            meta = {
+                "journal_seq": seq,
+                "matrix_file": matrix_file,
+                "rows": rows,
+                "subjects": subjects
+            }
+            with open(meta_tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(meta_tmp_path, self.meta_path)
+            
+            # 3. Lo snapshot contiene journal_seq: eventuali record residui
+            # in caso di crash prima del taglio vengono ignorati al replay
+            with self._lock:
+                if self._journal is not None:
+                    self._truncate_journal(journal_offset)
+                self._journal_records = self.data["journal_seq"] - seq
+                self._matrix_file = matrix_file
+            
+            # 4. Rimuove le matrici degli snapshot precedenti
+            for old_path in self.meta_path.parent.glob(f"{self.meta_path.stem}-*.npy"):
+                if old_path.name != matrix_file:
+                    old_path.unlink()
+            logger.info(f"Database compattato su disco (seq {seq})")
         except Exception as e:
             logger.error(f"Errore salvataggio database: {e}")
     
+    def _truncate_journal(self, offset: int):
+        """Scarta i record del journal fino a offset, conservando quelli accodati dopo (sotto lock)"""
+        if self._journal.tell() == offset:
+            self._journal.truncate(0)
+            # truncate non sposta la posizione: tell() deve ripartire da zero
+            self._journal.seek(0)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            return
+        
+        # Record scritti durante lo snapshot: si riscrive il journal con la sola coda
+        tmp_path = self.journal_path.with_suffix(self.journal_path.suffix + ".tmp")
+        with open(self.journal_path, "rb") as src, open(tmp_path, "wb") as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst)
+            dst.flush()
+            os.fsync(dst.fileno())
+        self._journal.close()
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, "ab")
+    
+    def close(self):
+        """Compatta il database e chiude il journal"""
+        self.save()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+    
+    @property
+    def version(self) -> str:
+        """
+        Versione del contenuto: cambia a ogni modifica (sequenza del journal).
+        L'identificativo di istanza evita collisioni se il database viene ricreato.
+        """
+        return f"{self._instance_id}-{self.data['journal_seq']}"
+    
+    # I lettori prendono il lock: enrollment e modifiche avvengono nei thread di inferenza
+    # mentre l'event loop legge, e i dict non possono cambiare durante l'iterazione
+    
     def list_subjects(self) -> List[str]:
         """Ritorna lista dei soggetti"""
-        return list(self.data["subjects"].keys())
+        with self._lock:
+            return list(self.data["subjects"].keys())
+    
+    def face_count(self) -> int:
+        """Numero totale di volti registrati"""
+        with self._lock:
+            return len(self._face_subjects)
     
     def subject_exists(self, subject: str) -> bool:
         """Verifica se un soggetto esiste"""
         return subject in self.data["subjects"]
     
+    def _delete_image_files(self, faces: Dict[str, Dict]):
+        """Elimina dal filesystem le immagini (e le miniature) di un insieme di volti"""
+        for image_id, face_data in faces.items():
+            paths = [Path(face_data.get("image_path", ""))]
+            paths += [thumbnail_path(image_id, size) for size in THUMBNAIL_SIZES]
+            for image_path in paths:
+                if image_path.exists():
+                    try:
+                        image_path.unlink()
+                    except Exception as e:
+                        logger.warning(f"Errore eliminazione immagine {image_path}: {e}")
+    
     def add_subject(self, subject: str) -> bool:
         """Aggiunge un nuovo soggetto"""
-        if self.subject_exists(subject):
-            return False
-        self.data["subjects"][subject] = {"faces": {}}
-        self.save()
+        with self._lock:
+            if self.subject_exists(subject):
+                return False
+            self._commit("add_subject", subject=subject)
+        self._compact_if_needed()
         return True
     
     def delete_subject(self, subject: str) -> bool:
         """Elimina un soggetto e tutte le sue immagini"""
-        if not self.subject_exists(subject):
-            return False
-        
-        # Elimina le immagini dal filesystem
-        for image_id, face_data in self.data["subjects"][subject]["faces"].items():
-            image_path = Path(face_data.get("image_path", ""))
-            if image_path.exists():
-                try:
-                    image_path.unlink()
-                except Exception as e:
-                    logger.warning(f"Errore eliminazione immagine {image_path}: {e}")
-        
-        del self.data["subjects"][subject]
-        self.save()
+        with self._lock:
+            if not self.subject_exists(subject):
+                return False
+            faces = self.data["subjects"][subject]["faces"]
+            self._commit("delete_subject", subject=subject)
+        self._compact_if_needed()
+        self._delete_image_files(faces)
         return True
     
     def rename_subject(self, old_name: str, new_name: str) -> bool:
         """Rinomina un soggetto"""
-        if not self.subject_exists(old_name):
-            return False
-        if self.subject_exists(new_name):
-            return False
-        
-        self.data["subjects"][new_name] = self.data["subjects"].pop(old_name)
-        self.save()
+        with self._lock:
+            if not self.subject_exists(old_name):
+                return False
+            if self.subject_exists(new_name):
+                return False
+            self._commit("rename_subject", old_name=old_name, new_name=new_name)
+        self._compact_if_needed()
         return True
     
-    def add_face(self, subject: str, embedding: np.ndarray, image_path: str) -> str:
-        """Aggiunge un volto a un soggetto"""
-        if not self.subject_exists(subject):
-            self.add_subject(subject)
-        
-        image_id = str(uuid.uuid4())
-        self.data["subjects"][subject]["faces"][image_id] = {
-            "embedding": embedding,
-            "added_at": datetime.now().isoformat(),
-            "image_path": image_path
-        }
-        self.save()
+    def add_face(self, subject: str, embedding: np.ndarray, image_path: str,
+                 image_id: Optional[str] = None) -> str:
+        """Aggiunge un volto a un soggetto (creando il soggetto se non esiste)"""
+        image_id = image_id or str(uuid.uuid4())
+        self._commit(
+            "add_face",
+            subject=subject,
+            image_id=image_id,
+            embedding=np.asarray(embedding, dtype=np.float32),
+            added_at=datetime.now().isoformat(),
+            image_path=image_path
+        )
+        self._compact_if_needed()
         return image_id
     
+    def add_faces(self, faces: List[Dict[str, Any]]) -> List[str]:
+        """
+        Aggiunge più volti ({subject, embedding, image_path, image_id?}) con un
+        solo record del journal: una sola scrittura su disco per tutto il batch.
+        """
+        added_at = datetime.now().isoformat()
+        records = [
+            {
+                "subject": face["subject"],
+                "image_id": face.get("image_id") or str(uuid.uuid4()),
+                "embedding": np.asarray(face["embedding"], dtype=np.float32),
+                "added_at": added_at,
+                "image_path": face["image_path"]
+            }
+            for face in faces
+        ]
+        if records:
+            self._commit("add_faces", faces=records)
+            self._compact_if_needed()
+        return [record["image_id"] for record in records]
+    
     def delete_face(self, image_id: str) -> Optional[str]:
         """Elimina un volto tramite image_id. Ritorna il subject se trovato."""
-        for subject, subject_data in self.data["subjects"].items():
-            if image_id in subject_data["faces"]:
-                face_data = subject_data["faces"].pop(image_id)
-                
-                # Elimina immagine dal filesystem
-                image_path = Path(face_data.get("image_path", ""))
-                if image_path.exists():
-                    try:
-                        image_path.unlink()
-                    except Exception as e:
-                        logger.warning(f"Errore eliminazione immagine {image_path}: {e}")
-                
-                self.save()
-                return subject
-        return None
+        with self._lock:
+            face_data = self.get_face_by_id(image_id)
+            if face_data is None:
+                return None
+            subject = self._commit("delete_face", image_id=image_id)
+        self._compact_if_needed()
+        self._delete_image_files({image_id: face_data})
+        return subject
     
     def delete_all_faces_of_subject(self, subject: str) -> int:
         """Elimina tutti i volti di un soggetto. Ritorna il numero di volti eliminati."""
-        if not self.subject_exists(subject):
-            return 0
-        
-        count = len(self.data["subjects"][subject]["faces"])
+        with self._lock:
+            if not self.subject_exists(subject):
+                return 0
+            faces = self.data["subjects"][subject]["faces"]
+            self._commit("delete_all_faces", subject=subject)
+        self._compact_if_needed()
+        self._delete_image_files(faces)
+        return len(faces)
+    
+    def apply_batch(self, operations: List[Dict[str, Any]]) -> int:
+        """
+        Applica una lista di modifiche (delete_face, delete_all_faces,
+        delete_subject, rename_subject) in modo transazionale: ognuna viene
+        validata sullo stato lasciato dalle precedenti e tutte vengono
+        registrate con un solo record del journal. Alla prima operazione non
+        valida solleva ValueError senza modificare nulla.
+        Ritorna il numero di volti eliminati.
+        """
+        with self._lock:
+            records, removed = self._plan_batch(operations)
+            if records:
+                self._commit("batch", operations=records)
+        self._compact_if_needed()
+        self._delete_image_files(removed)
+        return len(removed)
+    
+    def _plan_batch(self, operations: List[Dict[str, Any]]) -> Tuple[List[Dict], Dict[str, Dict]]:
+        """Valida un batch e ritorna i record del journal e i volti che verranno eliminati"""
+        names = {name: name for name in self.data["subjects"]}  # Nome nel batch -> chiave attuale
+        cleared = set()   # Chiavi attuali dei soggetti già svuotati nel batch
+        removed = {}      # image_id -> dati dei volti eliminati
+        records = []
         
-        # Elimina le immagini dal filesystem
-        for image_id, face_data in self.data["subjects"][subject]["faces"].items():
-            image_path = Path(face_data.get("image_path", ""))
-            if image_path.exists():
-                try:
-                    image_path.unlink()
-                except Exception as e:
-                    logger.warning(f"Errore eliminazione immagine {image_path}: {e}")
+        for i, operation in enumerate(operations):
+            op = operation.get("op")
+            subject = operation.get("subject")
+            
+            if op == "delete_face":
+                image_id = operation.get("image_id")
+                owner = self._face_subjects.get(image_id)
+                if owner is None or owner in cleared or image_id in removed:
+                    raise ValueError(f"Operation {i}: face '{image_id}' not found")
+                removed[image_id] = self.data["subjects"][owner]["faces"][image_id]
+                records.append({"op": op, "image_id": image_id})
+            
+            elif op in ("delete_subject", "delete_all_faces"):
+                key = names.get(subject)
+                if key is None:
+                    raise ValueError(f"Operation {i}: subject '{subject}' not found")
+                if key not in cleared:
+                    for image_id, face_data in self.data["subjects"][key]["faces"].items():
+                        removed.setdefault(image_id, face_data)
+                    cleared.add(key)
+                if op == "delete_subject":
+                    del names[subject]
+                records.append({"op": op, "subject": subject})
+            
+            elif op == "rename_subject":
+                new_name = operation.get("new_name")
+                if subject not in names:
+                    raise ValueError(f"Operation {i}: subject '{subject}' not found")
+                if not new_name or new_name in names:
+                    raise ValueError(f"Operation {i}: subject '{new_name}' already exists")
+                names[new_name] = names.pop(subject)
+                records.append({"op": op, "old_name": subject, "new_name": new_name})
+            
+            else:
+                raise ValueError(f"Operation {i}: unknown op '{op}'")
         
-        self.data["subjects"][subject]["faces"] = {}
-        self.save()
-        return count
+        return records, removed
     
     def get_face_by_id(self, image_id: str) -> Optional[Dict]:
-        """Ottiene i dati di un volto tramite image_id"""
-        for subject, subject_data in self.data["subjects"].items():
-            if image_id in subject_data["faces"]:
-                return {
-                    "subject": subject,
-                    **subject_data["faces"][image_id]
-                }
-        return None
+        """Ottiene i dati di un volto tramite image_id (lookup O(1))"""
+        with self._lock:
+            subject = self._face_subjects.get(image_id)
+            if subject is None:
+                return None
+            return {
+                "subject": subject,
+                **self.data["subjects"][subject]["faces"][image_id]
+            }
     
     def list_faces(self, subject: Optional[str] = None) -> List[Dict]:
         """Lista tutti i volti, opzionalmente filtrati per soggetto"""
         faces = []
-        subjects_to_check = [subject] if subject else self.list_subjects()
+        with self._lock:
+            subjects_to_check = [subject] if subject else self.list_subjects()
+            
+            for subj in subjects_to_check:
+                if not self.subject_exists(subj):
+                    continue
+                for image_id, face_data in self.data["subjects"][subj]["faces"].items():
+                    faces.append({
+                        "image_id": image_id,
+                        "subject": subj,
+                        "added_at": face_data.get("added_at", "")
+                    })
         
-        for subj in subjects_to_check:
-            if not self.subject_exists(subj):
-                continue
-            for image_id, face_data in self.data["subjects"][subj]["faces"].items():
-                faces.append({
+        return faces
+    
+    def list_faces_page(self, subject: Optional[str], page: int, size: int) -> Tuple[List[Dict], int]:
+        """
+        Pagina di volti (ordine di inserimento) e numero totale di volti.
+        Scorre direttamente gli indici in memoria senza costruire la lista completa.
+        """
+        with self._lock:
+            if subject:
+                if not self.subject_exists(subject):
+                    return [], 0
+                faces = self.data["subjects"][subject]["faces"]
+                total = len(faces)
+                items = ((image_id, subject) for image_id in faces)
+            else:
+                total = len(self._face_subjects)
+                items = iter(self._face_subjects.items())
+            
+            page_faces = []
+            for image_id, subj in itertools.islice(items, page * size, (page + 1) * size):
+                page_faces.append({
                     "image_id": image_id,
                     "subject": subj,
-                    "added_at": face_data.get("added_at", "")
+                    "added_at": self.data["subjects"][subj]["faces"][image_id].get("added_at", "")
                 })
-        
-        return faces
+            return page_faces, total
     
-    def get_all_embeddings(self) -> List[Dict]:
-        """Ritorna tutti gli embeddings per il riconoscimento"""
-        embeddings = []
-        for subject, subject_data in self.data["subjects"].items():
-            for image_id, face_data in subject_data["faces"].items():
-                embeddings.append({
-                    "subject": subject,
-                    "image_id": image_id,
-                    "embedding": face_data["embedding"]
+    def list_subject_groups(self, prefix: Optional[str], page: int, size: int,
+                            images_per_subject: int = 1) -> Tuple[List[Dict], int]:
+        """
+        Pagina di soggetti (ordine alfabetico, filtrati per prefisso) con il
+        numero di volti e i primi images_per_subject image_id di ciascuno.
+        """
+        with self._lock:
+            names = sorted(
+                name for name in self.data["subjects"]
+                if not prefix or name.lower().startswith(prefix.lower())
+            )
+            groups = []
+            for name in names[page * size:(page + 1) * size]:
+                faces = self.data["subjects"][name]["faces"]
+                groups.append({
+                    "subject": name,
+                    "face_count": len(faces),
+                    "image_ids": list(itertools.islice(faces, images_per_subject))
                 })
-        return embeddings
+            return groups, len(names)
+    
+    def get_all_embeddings(self) -> List[Dict]:
+        """Ritorna tutti gli embeddings (normalizzati) per il riconoscimento"""
+        return self.gallery.entries()
+    
+    def match(self, embeddings: np.ndarray, top_k: int = 1) -> List[List[Dict[str, Any]]]:
+        """Matching 1:N vettorizzato di uno o più embeddings contro la gallery"""
+        return self.gallery.search(embeddings, top_k)
 
 
 # ============================================
@@ -256,32 +948,214 @@ class FaceAnalyzerSingleton:
     """Singleton per FaceAnalysis per evitare caricamenti multipli del modello"""
     _instance = None
     _analyzer = None
+    _attribute_models: Dict[str, Any] = {}
+    _attribute_lock = threading.Lock()
     
     @classmethod
     def get_instance(cls):
         if cls._analyzer is None:
-            logger.info(f"Inizializzazione modello InsightFace: {MODEL_NAME}")
+            logger.info(f"Inizializzazione modello InsightFace: {MODEL_NAME} (moduli: {', '.join(ALLOWED_MODULES)})")
             cls._analyzer = FaceAnalysis(
                 name=MODEL_NAME,
-                providers=['CUDAExecutionProvider', 'CPUExecutionProvider']
+                allowed_modules=ALLOWED_MODULES,
+                providers=PROVIDERS
             )
             cls._analyzer.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
+            cls._prepare_det_sizes()
             logger.info("Modello InsightFace inizializzato con successo")
         return cls._analyzer
+    
+    @classmethod
+    def _prepare_det_sizes(cls):
+        """
+        Prepara il detector per ogni dimensione supportata con una detection a vuoto:
+        le anchor di ogni dimensione restano in cache e le richieste con det_size
+        diversi non pagano l'inizializzazione (né la scrivono in concorrenza).
+        Le dimensioni non accettate dal modello vengono rimosse da DET_SIZES.
+        """
+        for size in list(DET_SIZES):
+            try:
+                cls._analyzer.det_model.detect(np.zeros((size, size, 3), dtype=np.uint8), input_size=(size, size))
+            except Exception as e:
+                logger.warning(f"Dimensione di detection {size} non supportata dal modello: {e}")
+                DET_SIZES.remove(size)
+        logger.info(f"Dimensioni di detection disponibili: {DET_SIZES}")
+    
+    @classmethod
+    def get_attribute_model(cls, taskname: str):
+        """Ritorna un modello di attributi, caricandolo al primo utilizzo"""
+        analyzer = cls.get_instance()
+        if taskname in analyzer.models:
+            return analyzer.models[taskname]
+        
+        with cls._attribute_lock:
+            if taskname not in cls._attribute_models:
+                # Nei pacchetti InsightFace il file ha il nome del task (es. genderage.onnx):
+                # si prova prima quello; i file dei modelli già caricati (detection,
+                # riconoscimento) sono esclusi per non creare una seconda sessione ONNX
+                loaded_files = {os.path.abspath(getattr(m, "model_file", "")) for m in analyzer.models.values()}
+                onnx_files = [f for f in sorted(glob.glob(os.path.join(analyzer.model_dir, "*.onnx")))
+                              if os.path.abspath(f) not in loaded_files]
+                onnx_files.sort(key=lambda f: taskname not in os.path.basename(f).lower())
+                model = None
+                for onnx_file in onnx_files:
+                    candidate = model_zoo.get_model(onnx_file, providers=PROVIDERS)
+                    if candidate is not None and candidate.taskname == taskname:
+                        model = candidate
+                        break
+                    del candidate
+                if model is None:
+                    raise ValueError(f"Modello '{taskname}' non disponibile in {MODEL_NAME}")
+                model.prepare(ctx_id=0)
+                cls._attribute_models[taskname] = model
+                logger.info(f"Modello di attributi caricato su richiesta: {taskname}")
+            return cls._attribute_models[taskname]
 
 
 # ============================================
-# UTILITY FUNCTIONS
+# ESECUZIONE INFERENZA FUORI DALL'EVENT LOOP
 # ============================================
 
-def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    """Calcola la similarità coseno tra due vettori"""
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+class InferenceExecutor:
+    """
+    Pool di thread limitato per l'inferenza ONNX (bloccante).
+    L'event loop resta libero per /health e gli endpoint leggeri; quando
+    le richieste in esecuzione + in coda superano il limite si risponde
+    subito 503 invece di accumulare latenza.
+    """
+    
+    def __init__(self, max_workers: int, queue_size: int):
+        self.max_workers = max_workers
+        self.max_pending = max_workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        # Modificato solo dal thread dell'event loop: nessun lock necessario
+        self._pending = 0
+        # Segnalato a ogni worker liberato, per i job a priorità bassa
+        self._released = asyncio.Event()
+    
+    @property
+    def pending(self) -> int:
+        return self._pending
+    
+    async def run(self, func, *args):
+        """Esegue func(*args) nel pool, con backpressure sulla coda"""
+        if self._pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Inference queue is full, retry later"
+            )
+        return await self._execute(func, *args)
+    
+    async def run_when_idle(self, func, *args, timeout: float):
+        """
+        Esegue func(*args) con priorità bassa: parte solo quando un worker è
+        libero, così non occupa la coda del riconoscimento live. Se nessun
+        worker si libera entro timeout secondi risponde 503.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._pending >= self.max_workers:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Inference workers are busy, retry later"
+                )
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        # Nessun await tra il controllo e l'incremento di _pending in _execute
+        return await self._execute(func, *args)
+    
+    async def _execute(self, func, *args):
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+            self._released.set()
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
 
+# ============================================
+# MICRO-BATCHING DEL RICONOSCIMENTO
+# ============================================
 
-async def read_image_from_upload(file: UploadFile) -> np.ndarray:
-    """Legge un'immagine da un upload file"""
-    contents = await file.read()
+class RecognitionBatcher:
+    """
+    Coalescer delle richieste di riconoscimento concorrenti.
+    I volti allineati che arrivano entro BATCH_WINDOW_MS vengono passati al
+    modello ArcFace in un'unica chiamata ONNX (molto più efficiente per core
+    rispetto a un crop alla volta); ogni chiamante riceve solo i propri embeddings.
+    Vive interamente nell'event loop: nessun lock necessario.
+    """
+    
+    def __init__(self, executor: InferenceExecutor, window_ms: float, max_batch: int):
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: List[Tuple[List[np.ndarray], asyncio.Future]] = []
+        self._pending_crops = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Riferimenti forti ai batch in esecuzione (l'event loop tiene solo riferimenti deboli)
+        self._tasks: set = set()
+    
+    async def embed(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Ritorna gli embeddings (N, D) dei crop allineati"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((crops, future))
+        self._pending_crops += len(crops)
+        
+        if self._pending_crops >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        self._pending_crops = 0
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+    
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Errore batch di riconoscimento: {task.exception()}")
+    
+    async def _run(self, batch: List[Tuple[List[np.ndarray], asyncio.Future]]):
+        crops = [crop for request_crops, _ in batch for crop in request_crops]
+        try:
+            embeddings = await self.executor.run(embed_crops, crops)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        offset = 0
+        for request_crops, future in batch:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(request_crops)])
+            offset += len(request_crops)
+
+
+# ============================================
+# UTILITY FUNCTIONS
+# ============================================
+
+def decode_image(contents: bytes) -> np.ndarray:
+    """Decodifica un'immagine dai byte caricati"""
     nparr = np.frombuffer(contents, np.uint8)
     img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     if img is None:
@@ -289,13 +1163,227 @@ async def read_image_from_upload(file: UploadFile) -> np.ndarray:
     return img
 
 
+def parse_face_plugins(face_plugins: Optional[str]) -> List[str]:
+    """Converte i face_plugins CompreFace (es. "age,gender") nei taskname dei modelli da eseguire"""
+    if not face_plugins:
+        return []
+    tasknames = []
+    for plugin in face_plugins.split(","):
+        taskname = FACE_PLUGIN_MODULES.get(plugin.strip().lower())
+        if taskname and taskname not in tasknames:
+            tasknames.append(taskname)
+    return tasknames
+
+
+def parse_det_size(det_size: Optional[int]) -> int:
+    """Valida la dimensione di detection richiesta"""
+    if det_size is None:
+        return DET_SIZE
+    if det_size not in DET_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported det_size {det_size}, supported: {DET_SIZES}"
+        )
+    return det_size
+
+
+def parse_roi(roi: Optional[str]) -> Optional[Tuple[int, int, int, int]]:
+    """Converte la region of interest "x,y,w,h" (pixel) in una tupla"""
+    if not roi:
+        return None
+    try:
+        x, y, w, h = (int(float(value)) for value in roi.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid roi, expected 'x,y,width,height'")
+    if w <= 0 or h <= 0:
+        raise HTTPException(status_code=400, detail="Invalid roi, width and height must be positive")
+    return x, y, w, h
+
+
+def detect_faces(img: np.ndarray, det_prob_threshold: float,
+                 attribute_tasks: Optional[List[str]] = None,
+                 det_size: int = DET_SIZE,
+                 roi: Optional[Tuple[int, int, int, int]] = None) -> List[Face]:
+    """
+    Detection dei volti e modelli di attributi, senza il modello di riconoscimento
+    (stessi passi di FaceAnalysis.get, con l'embedding calcolato a parte in batch).
+    Oltre ai moduli caricati all'avvio esegue solo gli attribute_tasks richiesti.
+    Con una roi la detection gira solo sul ritaglio; bbox e landmark vengono
+    riportati alle coordinate dell'immagine intera.
+    """
+    models = [model for taskname, model in analyzer.models.items()
+              if taskname not in ("detection", "recognition")]
+    for taskname in attribute_tasks or []:
+        model = FaceAnalyzerSingleton.get_attribute_model(taskname)
+        if model not in models:
+            models.append(model)
+    
+    offset_x, offset_y = 0, 0
+    det_img = img
+    if roi is not None:
+        x, y, w, h = roi
+        offset_x, offset_y = max(0, x), max(0, y)
+        det_img = img[offset_y:max(offset_y, y + h), offset_x:max(offset_x, x + w)]
+        if det_img.size == 0:
+            return []
+    
+    bboxes, kpss = analyzer.det_model.detect(det_img, input_size=(det_size, det_size), max_num=0, metric='default')
+    if roi is not None:
+        bboxes[:, 0:4] += (offset_x, offset_y, offset_x, offset_y)
+        if kpss is not None:
+            kpss += (offset_x, offset_y)
+    faces = []
+    for i in range(bboxes.shape[0]):
+        if bboxes[i, 4] < det_prob_threshold:
+            continue
+        face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        for model in models:
+            model.get(img, face)
+        faces.append(face)
+    return faces
+
+
+def align_faces(img: np.ndarray, faces: List[Face]) -> List[np.ndarray]:
+    """Allinea i volti rilevati nei crop di input del modello di riconoscimento"""
+    image_size = analyzer.models["recognition"].input_size[0]
+    return [face_align.norm_crop(img, landmark=face.kps, image_size=image_size) for face in faces]
+
+
+def parse_json_form(value: Optional[str], name: str) -> Optional[list]:
+    """Decodifica un campo form JSON (lista di hint per volto)"""
+    if not value:
+        return None
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}, expected a JSON list")
+    if not isinstance(parsed, list):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}, expected a JSON list")
+    return parsed
+
+
+def faces_from_aligned_crops(crops_contents: List[bytes]) -> Tuple[List[Face], List[np.ndarray]]:
+    """
+    Prepara crop già allineati (112x112, come norm_crop di InsightFace):
+    nessuna detection, il box del volto è l'intero crop. Un crop di altre
+    dimensioni non è allineato come il modello si aspetta: viene rifiutato (400).
+    """
+    image_size = analyzer.models["recognition"].input_size[0]
+    faces, crops = [], []
+    for contents in crops_contents:
+        crop = decode_image(contents)
+        height, width = crop.shape[:2]
+        if (width, height) != (image_size, image_size):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid aligned crop size {width}x{height}, expected {image_size}x{image_size}"
+            )
+        faces.append(Face(bbox=np.array([0, 0, width, height], dtype=np.float32), kps=None, det_score=1.0))
+        crops.append(crop)
+    return faces, crops
+
+
+def faces_from_hints(contents: bytes, landmarks: Optional[list], boxes: Optional[list],
+                     det_prob_threshold: float) -> Tuple[List[Face], List[np.ndarray]]:
+    """
+    Prepara i volti di un frame a partire dagli hint del client:
+    - landmarks: 5 punti [x, y] per volto -> allineamento diretto, nessuna detection
+    - boxes (senza landmarks): [x_min, y_min, x_max, y_max] per volto -> detection
+      solo nell'intorno del box alla dimensione minima, per ricavare i landmark
+    """
+    img = decode_image(contents)
+    faces = []
+    
+    if landmarks:
+        for i, points in enumerate(landmarks):
+            kps = np.asarray(points, dtype=np.float32).reshape(5, 2)
+            if boxes and i < len(boxes):
+                bbox = np.asarray(boxes[i], dtype=np.float32)[:4]
+            else:
+                bbox = np.concatenate([kps.min(axis=0), kps.max(axis=0)])
+            faces.append(Face(bbox=bbox, kps=kps, det_score=1.0))
+    else:
+        for box in boxes or []:
+            x_min, y_min, x_max, y_max = (float(value) for value in box[:4])
+            margin_x, margin_y = (x_max - x_min) * 0.25, (y_max - y_min) * 0.25
+            roi = (
+                int(x_min - margin_x),
+                int(y_min - margin_y),
+                int(x_max - x_min + 2 * margin_x),
+                int(y_max - y_min + 2 * margin_y)
+            )
+            candidates = detect_faces(img, det_prob_threshold, det_size=DET_SIZES[0], roi=roi)
+            if candidates:
+                faces.append(max(candidates, key=lambda face: face.det_score))
+    
+    return faces, align_faces(img, faces)
+
+
+def embed_crops(crops: List[np.ndarray]) -> np.ndarray:
+    """Esegue il modello di riconoscimento su un batch di crop allineati"""
+    return analyzer.models["recognition"].get_feat(crops)
+
+
 def save_image(img: np.ndarray, image_id: str) -> str:
-    """Salva un'immagine e ritorna il percorso"""
+    """Salva un'immagine con le sue miniature e ritorna il percorso"""
     image_path = IMAGES_DIR / f"{image_id}.jpg"
     cv2.imwrite(str(image_path), img)
+    try:
+        for size in THUMBNAIL_SIZES:
+            save_thumbnail(img, image_id, size)
+    except Exception:
+        # Il volto non verrà registrato: nessun file orfano su disco
+        discard_image(image_path, image_id)
+        raise
     return str(image_path)
 
 
+def discard_image(image_path: Path, image_id: str):
+    """Rimuove un'immagine salvata e le sue miniature (volto non registrato)"""
+    for path in [Path(image_path)] + [thumbnail_path(image_id, size) for size in THUMBNAIL_SIZES]:
+        path.unlink(missing_ok=True)
+
+
+def thumbnail_path(image_id: str, size: int) -> Path:
+    return THUMBNAILS_DIR / f"{image_id}-{size}.jpg"
+
+
+def save_thumbnail(img: np.ndarray, image_id: str, size: int) -> bytes:
+    """Ridimensiona l'immagine al lato lungo size (mai ingrandita), la salva e ritorna il JPEG"""
+    height, width = img.shape[:2]
+    scale = size / max(height, width)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        raise ValueError("Impossibile codificare la miniatura")
+    data = encoded.tobytes()
+    path = thumbnail_path(image_id, size)
+    # File temporaneo univoco: due richieste concorrenti possono generare la stessa miniatura
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    return data
+
+
+def read_face_image(image_path: Path, image_id: str, size: Optional[int]) -> bytes:
+    """
+    JPEG di un volto: originale, oppure miniatura di lato size.
+    Le miniature mancanti (es. volti registrati prima delle miniature) vengono
+    generate al primo accesso e salvate per le richieste successive.
+    """
+    if size is None:
+        return image_path.read_bytes()
+    path = thumbnail_path(image_id, size)
+    if path.exists():
+        return path.read_bytes()
+    img = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Impossibile decodificare l'immagine")
+    return save_thumbnail(img, image_id, size)
+
+
 # ============================================
 # PYDANTIC MODELS
 # ============================================
@@ -308,6 +1396,17 @@ class SubjectAddRequest(BaseModel):
     subject: str
 
 
+class BatchOperation(BaseModel):
+    op: str
+    subject: Optional[str] = None
+    image_id: Optional[str] = None
+    new_name: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+
+
 # ============================================
 # FASTAPI APP
 # ============================================
@@ -330,18 +1429,43 @@ app.add_middleware(
 # Database e Analyzer (inizializzati al primo uso)
 db: Optional[FaceDatabase] = None
 analyzer = None
+inference: Optional[InferenceExecutor] = None
+batcher: Optional[RecognitionBatcher] = None
+# Pool dell'enrollment massivo (decodifica, detection, salvataggio), separato da quello di inferenza
+bulk_executor: Optional[ThreadPoolExecutor] = None
 
 
 @app.on_event("startup")
 async def startup_event():
     """Inizializza database e modello all'avvio"""
-    global db, analyzer
-    db = FaceDatabase(EMBEDDINGS_DB_PATH)
+    global db, analyzer, inference, batcher, bulk_executor
+    db = FaceDatabase(
+        EMBEDDINGS_META_PATH,
+        EMBEDDINGS_JOURNAL_PATH,
+        JOURNAL_COMPACT_EVERY,
+        legacy_path=LEGACY_EMBEDDINGS_DB_PATH
+    )
     analyzer = FaceAnalyzerSingleton.get_instance()
+    inference = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+    batcher = RecognitionBatcher(inference, BATCH_WINDOW_MS, BATCH_MAX_SIZE)
+    bulk_executor = ThreadPoolExecutor(max_workers=BULK_DECODE_WORKERS, thread_name_prefix="bulk")
     logger.info("=== InsightFace API Service avviato ===")
     logger.info(f"Soglia similarità: {SIMILARITY_THRESHOLD}")
     logger.info(f"Soglia detection: {DETECTION_THRESHOLD}")
     logger.info(f"Modello: {MODEL_NAME}")
+    logger.info(f"Inferenza: {INFERENCE_WORKERS} worker, coda max {INFERENCE_QUEUE_SIZE}")
+    logger.info(f"Micro-batching: finestra {BATCH_WINDOW_MS} ms, batch max {BATCH_MAX_SIZE}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Attende l'inferenza in corso e compatta il journal in uno snapshot alla chiusura"""
+    if inference is not None:
+        inference.shutdown()
+    if bulk_executor is not None:
+        bulk_executor.shutdown(wait=True)
+    if db is not None:
+        db.close()
 
 
 @app.get("/health")
@@ -354,13 +1478,87 @@ async def health_check():
 # RECOGNITION ENDPOINTS
 # ============================================
 
+def detect_and_align(contents: bytes, det_prob_threshold: float, attribute_tasks: List[str],
+                     det_size: int, roi: Optional[Tuple[int, int, int, int]]) -> Tuple[List[Face], List[np.ndarray]]:
+    """Decodifica + detection + allineamento (bloccante, eseguita nel pool di inferenza)"""
+    img = decode_image(contents)
+    faces = detect_faces(img, det_prob_threshold, attribute_tasks, det_size, roi)
+    return faces, align_faces(img, faces)
+
+
+def build_recognition_results(faces: List[Face], embeddings: np.ndarray,
+                              prediction_count: int, limit: int) -> List[Dict]:
+    """Matching 1:N dei volti di un frame e costruzione della risposta CompreFace"""
+    if not faces:
+        return []
+    
+    # Matching di tutti i volti del frame in un solo prodotto matriciale
+    # (prediction_count <= 0 = tutti i candidati)
+    top_k = max(prediction_count, 0)
+    all_candidates = db.match(embeddings, top_k)
+    
+    results = []
+    for face, candidates in zip(faces, all_candidates):
+        # Bounding box
+        bbox = face.bbox.astype(int).tolist()
+        
+        # Log del miglior match trovato (anche se sotto soglia)
+        if candidates:
+            best = candidates[0]
+            logger.info(f"Miglior match: {best['subject']} con similarità {best['similarity']:.4f} (soglia: {SIMILARITY_THRESHOLD})")
+            if best["similarity"] < SIMILARITY_THRESHOLD:
+                logger.info(f"  -> Match SCARTATO (sotto soglia)")
+            else:
+                logger.info(f"  -> Match ACCETTATO")
+        
+        # Candidati già ordinati per similarità decrescente e limitati a prediction_count
+        matches = [
+            {"subject": c["subject"], "similarity": round(c["similarity"], 5)}
+            for c in candidates
+            if c["similarity"] >= SIMILARITY_THRESHOLD
+        ]
+        
+        # Costruisci risultato in formato CompreFace
+        result = {
+            "box": {
+                "probability": round(float(face.det_score), 5),
+                "x_min": max(0, bbox[0]),
+                "y_min": max(0, bbox[1]),
+                "x_max": bbox[2],
+                "y_max": bbox[3]
+            },
+            "subjects": matches,
+            "execution_time": {
+                "detector": 0,
+                "calculator": 0
+            }
+        }
+        
+        # Aggiungi attributi età/genere se disponibili
+        if hasattr(face, 'age') and face.age is not None:
+            result["age"] = {"probability": 1.0, "high": int(face.age) + 5, "low": int(face.age) - 5}
+        if hasattr(face, 'gender') and face.gender is not None:
+            gender_str = "male" if face.gender == 1 else "female"
+            result["gender"] = {"probability": 1.0, "value": gender_str}
+        
+        results.append(result)
+    
+    # Applica limite se specificato
+    if limit > 0:
+        results = results[:limit]
+    
+    return results
+
+
 @app.post("/api/v1/recognition/recognize")
 async def recognize_face(
     file: UploadFile = File(...),
     limit: int = Query(0, description="Limite risultati (0 = tutti)"),
     det_prob_threshold: float = Query(DETECTION_THRESHOLD, description="Soglia probabilità detection"),
     prediction_count: int = Query(1, description="Numero predizioni per volto"),
-    face_plugins: Optional[str] = Query(None, description="Plugin aggiuntivi (ignorato)"),
+    face_plugins: Optional[str] = Query(None, description="Plugin aggiuntivi (age, gender)"),
+    det_size: Optional[int] = Query(None, description="Dimensione detection (una di DET_SIZES, default DET_SIZE)"),
+    roi: Optional[str] = Query(None, description="Regione di interesse 'x,y,width,height' in pixel"),
     x_api_key: Optional[str] = Header(None, alias="x-api-key")
 ):
     """
@@ -368,94 +1566,150 @@ async def recognize_face(
     Compatibile con CompreFace /api/v1/recognition/recognize
     """
     try:
-        # Leggi immagine
-        img = await read_image_from_upload(file)
+        # Detection per richiesta, riconoscimento in micro-batch con le richieste concorrenti
+        faces, crops = await inference.run(
+            detect_and_align, await file.read(), det_prob_threshold, parse_face_plugins(face_plugins),
+            parse_det_size(det_size), parse_roi(roi)
+        )
+        embeddings = await batcher.embed(crops) if crops else None
         
-        # Rileva volti
-        faces = analyzer.get(img)
-        
-        if not faces:
-            return {"result": []}
-        
-        # Ottieni tutti gli embeddings dal database
-        all_embeddings = db.get_all_embeddings()
+        results = build_recognition_results(faces, embeddings, prediction_count, limit)
+        return {"result": results}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Errore riconoscimento: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def prepare_prelocated_faces(files: Optional[List[UploadFile]], file: Optional[UploadFile],
+                                   landmarks: Optional[str], boxes: Optional[str],
+                                   det_prob_threshold: float) -> Tuple[List[Face], List[np.ndarray]]:
+    """Volti da crop allineati (files) oppure da un frame con hint di landmark/box (file)"""
+    if files:
+        crops_contents = [await crop_file.read() for crop_file in files]
+        return await inference.run(faces_from_aligned_crops, crops_contents)
+    
+    if file is None:
+        raise HTTPException(status_code=400, detail="Provide aligned crops in 'files' or a frame in 'file'")
+    landmarks_list = parse_json_form(landmarks, "landmarks")
+    boxes_list = parse_json_form(boxes, "boxes")
+    if not landmarks_list and not boxes_list:
+        raise HTTPException(status_code=400, detail="A frame requires 'landmarks' or 'boxes' hints")
+    return await inference.run(faces_from_hints, await file.read(), landmarks_list, boxes_list, det_prob_threshold)
+
+
+@app.post("/api/v1/recognition/embed")
+async def embed_faces(
+    files: Optional[List[UploadFile]] = File(None),
+    file: Optional[UploadFile] = File(None),
+    landmarks: Optional[str] = Form(None),
+    boxes: Optional[str] = Form(None),
+    det_prob_threshold: float = Query(DETECTION_THRESHOLD),
+    x_api_key: Optional[str] = Header(None, alias="x-api-key")
+):
+    """
+    Calcola gli embeddings di volti già localizzati dal client, senza
+    detection sul frame intero: crop allineati 112x112 in 'files', oppure
+    un frame in 'file' con hint JSON 'landmarks' (5 punti per volto) o 'boxes'.
+    """
+    try:
+        faces, crops = await prepare_prelocated_faces(files, file, landmarks, boxes, det_prob_threshold)
+        embeddings = await batcher.embed(crops) if crops else []
         
-        results = []
-        for face in faces:
-            # Filtra per soglia detection
-            if face.det_score < det_prob_threshold:
-                continue
-            
-            # Bounding box
-            bbox = face.bbox.astype(int).tolist()
-            
-            # Trova i match migliori
-            matches = []
-            best_similarity = 0.0
-            best_subject = None
-            for stored in all_embeddings:
-                similarity = cosine_similarity(face.embedding, stored["embedding"])
-                # Teniamo traccia del migliore per logging
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_subject = stored["subject"]
-                if similarity >= SIMILARITY_THRESHOLD:
-                    matches.append({
-                        "subject": stored["subject"],
-                        "similarity": round(similarity, 5)
-                    })
-            
-            # Log del miglior match trovato (anche se sotto soglia)
-            if best_subject:
-                logger.info(f"Miglior match: {best_subject} con similarità {best_similarity:.4f} (soglia: {SIMILARITY_THRESHOLD})")
-                if best_similarity < SIMILARITY_THRESHOLD:
-                    logger.info(f"  -> Match SCARTATO (sotto soglia)")
-                else:
-                    logger.info(f"  -> Match ACCETTATO")
-            
-            # Ordina per similarità decrescente
-            matches.sort(key=lambda x: x["similarity"], reverse=True)
-            
-            # Limita il numero di predizioni
-            if prediction_count > 0:
-                matches = matches[:prediction_count]
-            
-            # Costruisci risultato in formato CompreFace
-            result = {
-                "box": {
-                    "probability": round(float(face.det_score), 5),
-                    "x_min": max(0, bbox[0]),
-                    "y_min": max(0, bbox[1]),
-                    "x_max": bbox[2],
-                    "y_max": bbox[3]
-                },
-                "subjects": matches,
-                "execution_time": {
-                    "detector": 0,
-                    "calculator": 0
+        return {
+            "result": [
+                {
+                    "box": {
+                        "x_min": int(face.bbox[0]),
+                        "y_min": int(face.bbox[1]),
+                        "x_max": int(face.bbox[2]),
+                        "y_max": int(face.bbox[3])
+                    },
+                    "embedding": [float(value) for value in embedding]
                 }
-            }
-            
-            # Aggiungi attributi età/genere se disponibili
-            if hasattr(face, 'age') and face.age is not None:
-                result["age"] = {"probability": 1.0, "high": int(face.age) + 5, "low": int(face.age) - 5}
-            if hasattr(face, 'gender') and face.gender is not None:
-                gender_str = "male" if face.gender == 1 else "female"
-                result["gender"] = {"probability": 1.0, "value": gender_str}
-            
-            results.append(result)
-        
-        # Applica limite se specificato
-        if limit > 0:
-            results = results[:limit]
+                for face, embedding in zip(faces, embeddings)
+            ]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Errore calcolo embedding: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/recognition/recognize/aligned")
+async def recognize_aligned_faces(
+    files: Optional[List[UploadFile]] = File(None),
+    file: Optional[UploadFile] = File(None),
+    landmarks: Optional[str] = Form(None),
+    boxes: Optional[str] = Form(None),
+    limit: int = Query(0, description="Limite risultati (0 = tutti)"),
+    det_prob_threshold: float = Query(DETECTION_THRESHOLD, description="Soglia probabilità detection (solo hint 'boxes')"),
+    prediction_count: int = Query(1, description="Numero predizioni per volto"),
+    x_api_key: Optional[str] = Header(None, alias="x-api-key")
+):
+    """
+    Riconoscimento 1:N di volti già localizzati dal client (stessi input di /embed).
+    Risposta nello stesso formato di /api/v1/recognition/recognize.
+    """
+    try:
+        faces, crops = await prepare_prelocated_faces(files, file, landmarks, boxes, det_prob_threshold)
+        embeddings = await batcher.embed(crops) if crops else None
         
+        results = build_recognition_results(faces, embeddings, prediction_count, limit)
         return {"result": results}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Errore riconoscimento: {e}")
+        logger.error(f"Errore riconoscimento volti allineati: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def single_enrollment_face(faces: List[Face], det_prob_threshold: float) -> Face:
+    """Verifica che un'immagine di enrollment contenga esattamente un volto sopra soglia"""
+    if not faces:
+        raise HTTPException(
+            status_code=400,
+            detail="No face is found in the given image"
+        )
+    
+    if len(faces) > 1:
+        raise HTTPException(
+            status_code=400,
+            detail="More than one face found in the image"
+        )
+    
+    face = faces[0]
+    
+    # Verifica soglia detection
+    if face.det_score < det_prob_threshold:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Face detection probability ({face.det_score:.2f}) below threshold ({det_prob_threshold})"
+        )
+    return face
+
+
+def enroll_image(contents: bytes, subject: str, det_prob_threshold: float) -> str:
+    """Detection + embedding + salvataggio di un volto (bloccante, eseguita nel pool di inferenza)"""
+    img = decode_image(contents)
+    
+    # Rileva volti
+    face = single_enrollment_face(analyzer.get(img), det_prob_threshold)
+    
+    # Genera ID e salva immagine
+    image_id = str(uuid.uuid4())
+    image_path = save_image(img, image_id)
+    
+    # Aggiungi al database con lo stesso image_id dell'immagine salvata
+    db.add_face(subject, face.embedding, image_path, image_id=image_id)
+    return image_id
+
+
 @app.post("/api/v1/recognition/faces")
 async def add_face(
     file: UploadFile = File(...),
@@ -468,51 +1722,7 @@ async def add_face(
     Compatibile con CompreFace POST /api/v1/recognition/faces
     """
     try:
-        # Leggi immagine
-        img = await read_image_from_upload(file)
-        
-        # Rileva volti
-        faces = analyzer.get(img)
-        
-        if not faces:
-            raise HTTPException(
-                status_code=400,
-                detail="No face is found in the given image"
-            )
-        
-        if len(faces) > 1:
-            raise HTTPException(
-                status_code=400,
-                detail="More than one face found in the image"
-            )
-        
-        face = faces[0]
-        
-        # Verifica soglia detection
-        if face.det_score < det_prob_threshold:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Face detection probability ({face.det_score:.2f}) below threshold ({det_prob_threshold})"
-            )
-        
-        # Genera ID e salva immagine
-        image_id = str(uuid.uuid4())
-        image_path = save_image(img, image_id)
-        
-        # Aggiungi al database
-        db.add_face(subject, face.embedding, image_path)
-        
-        # Usa lo stesso image_id nel database
-        # (aggiorniamo l'ultimo inserito con l'ID corretto)
-        for subj, subj_data in db.data["subjects"].items():
-            if subj == subject:
-                # Trova l'ultimo inserito e aggiorna la chiave
-                latest_id = list(subj_data["faces"].keys())[-1]
-                if latest_id != image_id:
-                    subj_data["faces"][image_id] = subj_data["faces"].pop(latest_id)
-                    subj_data["faces"][image_id]["image_path"] = image_path
-                    db.save()
-                break
+        image_id = await inference.run(enroll_image, await file.read(), subject, det_prob_threshold)
         
         logger.info(f"Volto aggiunto: subject={subject}, image_id={image_id}")
         
@@ -528,18 +1738,216 @@ async def add_face(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def bulk_items_from_archive(contents: bytes, subject: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Immagini di un archivio zip: il soggetto è quello indicato nel form oppure
+    il nome della cartella che contiene l'immagine (es. Mario Rossi/1.jpg).
+    """
+    try:
+        archive = zipfile.ZipFile(BytesIO(contents))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid archive, expected a zip file")
+    
+    items = []
+    with archive:
+        for info in archive.infolist():
+            path = Path(info.filename)
+            if (info.is_dir() or path.suffix.lower() not in BULK_IMAGE_EXTENSIONS
+                    or any(part.startswith((".", "__MACOSX")) for part in path.parts)):
+                continue
+            if len(items) >= BULK_MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"Too many images, max {BULK_MAX_FILES} per request")
+            items.append({
+                "file": info.filename,
+                "subject": subject or (path.parent.name if len(path.parts) > 1 else None),
+                "contents": archive.read(info)
+            })
+    return items
+
+
+def prepare_enrollment(item: Dict[str, Any], det_prob_threshold: float) -> Dict[str, Any]:
+    """Decodifica, detection e allineamento di un'immagine del batch (eseguita nel pool di decodifica)"""
+    if not item["subject"]:
+        raise ValueError("Subject is missing")
+    img = decode_image(item["contents"])
+    face = single_enrollment_face(detect_faces(img, 0.0), det_prob_threshold)
+    return {"img": img, "crop": align_faces(img, [face])[0]}
+
+
+async def embed_bulk_crops(crops: List[np.ndarray]) -> np.ndarray:
+    """
+    Embeddings di un chunk dell'enrollment massivo nel pool di inferenza condiviso,
+    con priorità bassa: attende (al massimo BULK_EMBED_WAIT_S) che ci sia un
+    worker libero, così il riconoscimento live non trova la coda occupata.
+    """
+    return await inference.run_when_idle(embed_crops, crops, timeout=BULK_EMBED_WAIT_S)
+
+
+async def enroll_batch(items: List[Dict[str, Any]], det_prob_threshold: float) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Enrollment di un batch di immagini a chunk di BULK_EMBED_BATCH:
+    decodifica, detection e salvataggio in parallelo nel pool dell'enrollment
+    (separato da quello di inferenza), embeddings del chunk con una sola
+    chiamata al modello; un solo record del journal per tutti i volti aggiunti.
+    Nessuno slot di inferenza resta occupato per tutta la durata del batch.
+    Ritorna (aggiunti, falliti); un'immagine non valida non blocca le altre.
+    Se il batch fallisce (es. 503 dei worker occupati) nessun volto viene
+    registrato e le immagini già salvate vengono rimosse.
+    """
+    loop = asyncio.get_running_loop()
+    added, failed, faces = [], [], []
+    
+    try:
+        for start in range(0, len(items), BULK_EMBED_BATCH):
+            chunk = items[start:start + BULK_EMBED_BATCH]
+            results = await asyncio.gather(
+                *(loop.run_in_executor(bulk_executor, prepare_enrollment, item, det_prob_threshold) for item in chunk),
+                return_exceptions=True
+            )
+            prepared = []
+            for item, result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    error = result.detail if isinstance(result, HTTPException) else str(result)
+                    failed.append({"file": item["file"], "subject": item["subject"], "error": error})
+                else:
+                    prepared.append((item, result))
+            if not prepared:
+                continue
+            
+            try:
+                embeddings = await embed_bulk_crops([face["crop"] for _, face in prepared])
+            except Exception as e:
+                if isinstance(e, HTTPException) and e.status_code == 503:
+                    # Nessun worker libero entro l'attesa: la richiesta va ripetuta per intero
+                    raise
+                error = e.detail if isinstance(e, HTTPException) else str(e)
+                failed.extend({"file": item["file"], "subject": item["subject"], "error": error} for item, _ in prepared)
+                continue
+            image_ids = [str(uuid.uuid4()) for _ in prepared]
+            image_paths = await asyncio.gather(
+                *(loop.run_in_executor(bulk_executor, save_image, face["img"], image_id)
+                  for (_, face), image_id in zip(prepared, image_ids)),
+                return_exceptions=True
+            )
+            for (item, _), embedding, image_path, image_id in zip(prepared, embeddings, image_paths, image_ids):
+                if isinstance(image_path, Exception):
+                    failed.append({"file": item["file"], "subject": item["subject"], "error": str(image_path)})
+                    continue
+                faces.append({"subject": item["subject"], "embedding": embedding,
+                              "image_path": image_path, "image_id": image_id})
+                added.append({"file": item["file"], "subject": item["subject"], "image_id": image_id})
+        
+        await loop.run_in_executor(bulk_executor, db.add_faces, faces)
+    except Exception:
+        # Nessun volto registrato: niente immagini o miniature orfane su disco
+        await asyncio.gather(
+            *(loop.run_in_executor(bulk_executor, discard_image, face["image_path"], face["image_id"])
+              for face in faces),
+            return_exceptions=True
+        )
+        raise
+    return added, failed
+
+
+@app.post("/api/v1/recognition/faces/bulk")
+async def add_faces_bulk(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    subject: Optional[str] = Form(None),
+    subjects: Optional[str] = Form(None),
+    det_prob_threshold: float = Query(DETECTION_THRESHOLD),
+    x_api_key: Optional[str] = Header(None, alias="x-api-key")
+):
+    """
+    Enrollment massivo di volti in una sola richiesta.
+    - files: immagini multipart, con `subject` comune oppure `subjects`
+      (lista JSON di nomi, uno per file nello stesso ordine)
+    - archive: zip di immagini, con `subject` comune oppure una cartella per soggetto
+    Ogni immagine deve contenere un solo volto; il risultato riporta per file
+    gli image_id aggiunti e gli errori delle immagini scartate.
+    """
+    try:
+        file_subjects = parse_json_form(subjects, "subjects")
+        items = []
+        for i, upload in enumerate(files or []):
+            items.append({
+                "file": upload.filename,
+                "subject": file_subjects[i] if file_subjects and i < len(file_subjects) else subject,
+                "contents": await upload.read()
+            })
+        if archive is not None:
+            items.extend(bulk_items_from_archive(await archive.read(), subject))
+        
+        if not items:
+            raise HTTPException(status_code=400, detail="No images provided")
+        if len(items) > BULK_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"Too many images, max {BULK_MAX_FILES} per request")
+        
+        added, failed = await enroll_batch(items, det_prob_threshold)
+        logger.info(f"Enrollment massivo: {len(added)} volti aggiunti, {len(failed)} scartati")
+        
+        return {"added": added, "failed": failed}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Errore enrollment massivo: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def run_db(func, *args):
+    """
+    Esegue una modifica del database fuori dall'event loop: scrittura e fsync
+    del journal (ed eventuale snapshot) non bloccano le altre richieste
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def versioned_response(payload_factory, if_none_match: Optional[str]):
+    """
+    Risposta di lettura validata con la versione del database: ETag con la
+    versione corrente e 304 (senza corpo) se il client ha già quella versione.
+    """
+    etag = f'"{db.version}"'
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=payload_factory(), headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def page_payload(key: str, items: List[Dict], total: int, page: int, size: int) -> Dict:
+    """Corpo di una risposta paginata (campi di paginazione come CompreFace)"""
+    return {
+        key: items,
+        "page_number": page,
+        "page_size": size,
+        "total_pages": (total + size - 1) // size,
+        "total_elements": total
+    }
+
+
 @app.get("/api/v1/recognition/faces")
 async def list_faces(
     subject: Optional[str] = Query(None),
+    page: Optional[int] = Query(None, ge=0),
+    size: Optional[int] = Query(None, ge=1, le=1000),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     x_api_key: Optional[str] = Header(None, alias="x-api-key")
 ):
     """
     Lista tutti i volti, opzionalmente filtrati per soggetto
     Compatibile con CompreFace GET /api/v1/recognition/faces
+    Con page/size ritorna solo la pagina richiesta (page parte da 0).
+    Supporta If-None-Match con l'ETag della versione del database (304).
     """
     try:
-        faces = db.list_faces(subject)
-        return {"faces": faces}
+        if page is None and size is None:
+            return versioned_response(lambda: {"faces": db.list_faces(subject)}, if_none_match)
+        
+        page, size = page or 0, size or 100
+        def payload():
+            faces, total = db.list_faces_page(subject, page, size)
+            return page_payload("faces", faces, total, page, size)
+        return versioned_response(payload, if_none_match)
     except Exception as e:
         logger.error(f"Errore lista volti: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -558,7 +1966,7 @@ async def delete_faces_by_subject(
         if not db.subject_exists(subject):
             raise HTTPException(status_code=404, detail=f"Subject '{subject}' not found")
         
-        count = db.delete_all_faces_of_subject(subject)
+        count = await run_db(db.delete_all_faces_of_subject, subject)
         logger.info(f"Eliminati {count} volti del soggetto: {subject}")
         
         return {"deleted": count}
@@ -579,7 +1987,7 @@ async def delete_face(
     Compatibile con CompreFace DELETE /api/v1/recognition/faces/{image_id}
     """
     try:
-        subject = db.delete_face(image_id)
+        subject = await run_db(db.delete_face, image_id)
         
         if subject is None:
             raise HTTPException(status_code=404, detail=f"Image '{image_id}' not found")
@@ -600,28 +2008,46 @@ async def delete_face(
 @app.get("/api/v1/recognition/faces/{image_id}/img")
 async def get_face_image(
     image_id: str,
+    size: Optional[int] = Query(None, description="Lato lungo della miniatura (vedi THUMBNAIL_SIZES)"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     x_api_key: Optional[str] = Header(None, alias="x-api-key")
 ):
     """
-    Ottiene l'immagine di un volto
+    Ottiene l'immagine di un volto, o una sua miniatura con size
     Compatibile con CompreFace GET /api/v1/recognition/faces/{image_id}/img
+    Il contenuto di un image_id non cambia: ETag fisso, cache del browser
+    per IMAGE_CACHE_MAX_AGE secondi e 304 con If-None-Match.
     """
     try:
+        if size is not None and size not in THUMBNAIL_SIZES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported size {size}, supported: {THUMBNAIL_SIZES}"
+            )
+        
         face_data = db.get_face_by_id(image_id)
         
         if face_data is None:
             raise HTTPException(status_code=404, detail=f"Image '{image_id}' not found")
         
+        headers = {
+            "ETag": f'"{image_id}-{size or "full"}"',
+            "Cache-Control": f"private, max-age={IMAGE_CACHE_MAX_AGE}"
+        }
+        if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        
         image_path = Path(face_data.get("image_path", ""))
         
         if not image_path.exists():
             raise HTTPException(status_code=404, detail="Image file not found on disk")
         
-        # Leggi e ritorna l'immagine
-        with open(image_path, "rb") as f:
-            image_data = f.read()
+        # Lettura (ed eventuale generazione della miniatura) fuori dall'event loop
+        image_data = await asyncio.get_running_loop().run_in_executor(
+            None, read_face_image, image_path, image_id, size
+        )
         
-        return Response(content=image_data, media_type="image/jpeg")
+        return Response(content=image_data, media_type="image/jpeg", headers=headers)
     
     except HTTPException:
         raise
@@ -630,26 +2056,114 @@ async def get_face_image(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================
+# DETECTION ENDPOINTS
+# ============================================
+
+def detect_image(contents: bytes, det_prob_threshold: float, attribute_tasks: List[str],
+                 det_size: int, roi: Optional[Tuple[int, int, int, int]]) -> List[Face]:
+    """Decodifica + sola detection (bloccante, eseguita nel pool di inferenza)"""
+    return detect_faces(decode_image(contents), det_prob_threshold, attribute_tasks, det_size, roi)
+
+
+@app.post("/api/v1/detection/detect")
+async def detect(
+    file: UploadFile = File(...),
+    limit: int = Query(0, description="Limite risultati (0 = tutti)"),
+    det_prob_threshold: float = Query(DETECTION_THRESHOLD, description="Soglia probabilità detection"),
+    face_plugins: Optional[str] = Query(None, description="Plugin aggiuntivi (age, gender)"),
+    det_size: Optional[int] = Query(None, description="Dimensione detection (una di DET_SIZES, default DET_SIZE)"),
+    roi: Optional[str] = Query(None, description="Regione di interesse 'x,y,width,height' in pixel"),
+    x_api_key: Optional[str] = Header(None, alias="x-api-key")
+):
+    """
+    Solo detection, senza modello di riconoscimento né matching
+    Compatibile con CompreFace /api/v1/detection/detect; i landmark a 5 punti
+    restituiti possono essere inviati a /recognition/recognize/aligned.
+    """
+    try:
+        faces = await inference.run(
+            detect_image, await file.read(), det_prob_threshold, parse_face_plugins(face_plugins),
+            parse_det_size(det_size), parse_roi(roi)
+        )
+        
+        results = []
+        for face in faces:
+            bbox = face.bbox.astype(int).tolist()
+            result = {
+                "box": {
+                    "probability": round(float(face.det_score), 5),
+                    "x_min": max(0, bbox[0]),
+                    "y_min": max(0, bbox[1]),
+                    "x_max": bbox[2],
+                    "y_max": bbox[3]
+                },
+                "landmarks": face.kps.round(2).tolist() if face.kps is not None else []
+            }
+            if hasattr(face, 'age') and face.age is not None:
+                result["age"] = {"probability": 1.0, "high": int(face.age) + 5, "low": int(face.age) - 5}
+            if hasattr(face, 'gender') and face.gender is not None:
+                result["gender"] = {"probability": 1.0, "value": "male" if face.gender == 1 else "female"}
+            results.append(result)
+        
+        if limit > 0:
+            results = results[:limit]
+        
+        return {"result": results}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Errore detection: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================
 # SUBJECTS ENDPOINTS
 # ============================================
 
 @app.get("/api/v1/recognition/subjects")
 async def list_subjects(
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     x_api_key: Optional[str] = Header(None, alias="x-api-key")
 ):
     """
     Lista tutti i soggetti
     Compatibile con CompreFace GET /api/v1/recognition/subjects
+    Supporta If-None-Match con l'ETag della versione del database (304).
     """
     try:
-        subjects = db.list_subjects()
-        return {"subjects": subjects}
+        return versioned_response(lambda: {"subjects": db.list_subjects()}, if_none_match)
     except Exception as e:
         logger.error(f"Errore lista soggetti: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/v1/recognition/subjects/summary")
+async def list_subject_summary(
+    prefix: Optional[str] = Query(None),
+    page: int = Query(0, ge=0),
+    size: int = Query(50, ge=1, le=500),
+    images: int = Query(1, ge=0, le=50),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    x_api_key: Optional[str] = Header(None, alias="x-api-key")
+):
+    """
+    Pagina di soggetti raggruppati, in ordine alfabetico: per ciascuno il
+    numero di volti e i primi `images` image_id (es. la miniatura).
+    Filtro opzionale per prefisso del nome (case-insensitive).
+    Supporta If-None-Match con l'ETag della versione del database (304).
+    """
+    try:
+        def payload():
+            groups, total = db.list_subject_groups(prefix, page, size, images)
+            return page_payload("subjects", groups, total, page, size)
+        return versioned_response(payload, if_none_match)
+    except Exception as e:
+        logger.error(f"Errore riepilogo soggetti: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/api/v1/recognition/subjects")
 async def add_subject(
     request: SubjectAddRequest,
@@ -668,7 +2182,7 @@ async def add_subject(
                 detail=f"Subject '{subject}' already exists"
             )
         
-        db.add_subject(subject)
+        await run_db(db.add_subject, subject)
         logger.info(f"Soggetto creato: {subject}")
         
         return {"subject": subject}
@@ -692,7 +2206,7 @@ async def delete_subject(
         if not db.subject_exists(subject):
             raise HTTPException(status_code=404, detail=f"Subject '{subject}' not found")
         
-        db.delete_subject(subject)
+        await run_db(db.delete_subject, subject)
         logger.info(f"Soggetto eliminato: {subject}")
         
         return {"subject": subject}
@@ -725,7 +2239,7 @@ async def rename_subject(
                 detail=f"Subject '{new_name}' already exists"
             )
         
-        db.rename_subject(subject, new_name)
+        await run_db(db.rename_subject, subject, new_name)
         logger.info(f"Soggetto rinominato: {subject} -> {new_name}")
         
         return {"updated": True}
@@ -736,6 +2250,31 @@ async def rename_subject(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/v1/recognition/batch")
+async def apply_batch(
+    request: BatchRequest,
+    x_api_key: Optional[str] = Header(None, alias="x-api-key")
+):
+    """
+    Applica più modifiche in una sola transazione (un lock, una scrittura del journal):
+    - {"op": "delete_face", "image_id": ...}
+    - {"op": "delete_all_faces", "subject": ...}
+    - {"op": "delete_subject", "subject": ...}
+    - {"op": "rename_subject", "subject": ..., "new_name": ...}
+    Se un'operazione non è valida nessuna viene applicata (400).
+    """
+    try:
+        deleted = await run_db(db.apply_batch, [operation.model_dump() for operation in request.operations])
+        logger.info(f"Batch applicato: {len(request.operations)} operazioni, {deleted} volti eliminati")
+        
+        return {"operations": len(request.operations), "deleted_faces": deleted}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Errore batch di modifiche: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================
 # DEBUG ENDPOINTS
 # ============================================
@@ -746,11 +2285,17 @@ async def get_status():
     return {
         "status": "running",
         "model": MODEL_NAME,
+        "modules": list(analyzer.models.keys()),
         "det_size": DET_SIZE,
+        "det_sizes": DET_SIZES,
         "similarity_threshold": SIMILARITY_THRESHOLD,
         "detection_threshold": DETECTION_THRESHOLD,
+        "inference_workers": inference.max_workers,
+        "inference_pending": inference.pending,
+        "db_version": db.version,
+        "thumbnail_sizes": THUMBNAIL_SIZES,
         "total_subjects": len(db.list_subjects()),
-        "total_faces": len(db.list_faces())
+        "total_faces": db.face_count()
     }
 
 
@@ -5,10 +5,19 @@ let config = {
     port: '',
     detProbThreshold: 0.8,
     similarityThreshold: 0.85,
-    facePlugins: 'age,gender',
+    facePlugins: '',
     shellyUrl:""
 };
 
+// Camera mostrata da questa pagina (?camera=<id>); senza parametro il server usa
+// la camera di default e avvia/ferma il riconoscimento su tutte le camere
+const cameraId = new URLSearchParams(window.location.search).get('camera');
+
+function cameraUrl(path) {
+    if (!cameraId) return path;
+    return `${path}${path.includes('?') ? '&' : '?'}camera=${encodeURIComponent(cameraId)}`;
+}
+
 let subjectName = "";
 let similarityScore = 0;
 let subjectVisible = false; // Variabile per tenere traccia della visibilità del soggetto
@@ -54,33 +63,30 @@ window.addEventListener('DOMContentLoaded', () => {
 
 // Ferma lo stream quando l'utente chiude o lascia la pagina
 window.addEventListener('beforeunload', () => {
-    // Ferma il riconoscimento
-    if (recognitionTimer) {
-        clearInterval(recognitionTimer);
+    // Chiude la sottoscrizione ai risultati
+    if (recognitionEvents) {
+        recognitionEvents.close();
     }
     // Ferma lo stream video sul server
-    navigator.sendBeacon('/stop_video_stream', '');
+    navigator.sendBeacon(cameraUrl('/stop_video_stream'), '');
 });
 
 // Ferma lo stream anche quando la pagina diventa nascosta (cambio tab, minimizzazione)
 document.addEventListener('visibilitychange', () => {
     if (document.visibilityState === 'hidden') {
         // Opzionale: ferma lo stream quando la tab non è visibile
-        // Decommenta le righe seguenti se vuoi questo comportamento
-        // if (recognitionTimer) {
-        //     clearInterval(recognitionTimer);
-        // }
-        // fetch('/stop_video_stream', { method: 'POST' });
+        // Decommenta la riga seguente se vuoi questo comportamento
+        // fetch(cameraUrl('/stop_video_stream'), { method: 'POST' });
     }
 });
 
 // Elementi DOM
-const videoElement = document.getElementById('videoElement');
+const previewImage = document.getElementById('previewImage');
 const canvas = document.getElementById('canvas');
 const ctx = canvas.getContext('2d');
 let stream = null;
 let isRunning = false;
-let recognitionTimer = null;
+let recognitionEvents = null;  // EventSource dei risultati del worker lato server
 let lastResults = [];
 
 // Avvio della telecamera
@@ -89,7 +95,7 @@ async function startCamera() {
         log("Avvio della camera tramite stream condiviso...");
         
         // Avvia lo stream condiviso sul server
-        const response = await fetch('/start_video_stream', {
+        const response = await fetch(cameraUrl('/start_video_stream'), {
             method: 'POST'
         });
         
@@ -106,7 +112,9 @@ async function startCamera() {
         // Avvia anche il riconoscimento
         await startRecognition();
         
-        // Inizia il loop di rendering
+        // Collega l'anteprima MJPEG e inizia il loop di rendering
+        connectPreview();
+        setInterval(checkStreamHealth, 5000);
         requestAnimationFrame(renderFrame);
         
     } catch (error) {
@@ -118,14 +126,14 @@ async function startCamera() {
 
 async function startRecognition() {
     try {
-        const response = await fetch('/start_recognition', {
+        const response = await fetch(cameraUrl('/start_recognition'), {
             method: 'POST'
         });
         
         if (response.ok) {
             isRunning = true;
             log("Riconoscimento facciale avviato.");
-            recognitionLoop();
+            subscribeRecognitionResults();
         } else {
             throw new Error('Impossibile avviare il riconoscimento');
         }
@@ -137,16 +145,18 @@ async function startRecognition() {
 // Nuova funzione per fermare il riconoscimento
 async function stopRecognition() {
     try {
-        const response = await fetch('/stop_recognition', {
+        const response = await fetch(cameraUrl('/stop_recognition'), {
             method: 'POST'
         });
         
         if (response.ok) {
             isRunning = false;
-            if (recognitionTimer) {
-                clearTimeout(recognitionTimer);
-                recognitionTimer = null;
+            if (recognitionEvents) {
+                recognitionEvents.close();
+                recognitionEvents = null;
             }
+            lastResults = [];
+            subjectVisible = false;
             log("Riconoscimento facciale fermato.");
         } else {
             throw new Error('Impossibile fermare il riconoscimento');
@@ -156,209 +166,61 @@ async function stopRecognition() {
     }
 }
 
-// Funzione per inviare log di riconoscimento al backend
-async function sendRecognitionLog(subject, similarity, recognized, type = 'detection') {
-    try {
-        await fetch('/recognition_log', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                subject: subject,
-                similarity: similarity,
-                recognized: recognized,
-                type: type
-            })
-        });
-    } catch (error) {
-        console.error('Errore invio log riconoscimento:', error);
+// Sottoscrive i risultati del riconoscimento eseguito dal server (Server-Sent Events).
+// Il server prende i frame direttamente dalla webcam, interroga InsightFace,
+// registra i log e attiva lo Shelly: il browser si limita a disegnare gli overlay.
+function subscribeRecognitionResults() {
+    if (recognitionEvents) {
+        return;
     }
-}
-
-// Variabile per evitare log duplicati
-let lastLoggedSubject = null;
-let lastLogTime = 0;
-
-// Loop di riconoscimento (eseguito ogni 1 secondo)
-function recognitionLoop() {
-    if (!isRunning) return;
-
-    recognizeFromVideo()
-        .then(results => {
-            if (results && results.length > 0) {
-                lastResults = results;
-                subjectVisible = true; // Il soggetto è visibile
-                log(`Riconosciuto ${results.length} volti.`);
-                
-                // Invia log per ogni volto riconosciuto
-                results.forEach(result => {
-                    if (result.subjects && result.subjects.length > 0) {
-                        const bestMatch = result.subjects.sort((a, b) => b.similarity - a.similarity)[0];
-                        const currentTime = Date.now();
-                        
-                        // Invia log solo se è passato abbastanza tempo dall'ultimo log dello stesso soggetto
-                        if (bestMatch.similarity >= config.similarityThreshold) {
-                            if (bestMatch.subject !== lastLoggedSubject || (currentTime - lastLogTime) > 5000) {
-                                sendRecognitionLog(bestMatch.subject, bestMatch.similarity, true, 'recognition');
-                                lastLoggedSubject = bestMatch.subject;
-                                lastLogTime = currentTime;
-                            }
-                        } else {
-                            // Volto rilevato ma non riconosciuto con certezza sufficiente
-                            if ((currentTime - lastLogTime) > 5000) {
-                                sendRecognitionLog('Non riconosciuto', bestMatch.similarity, false, 'failed');
-                                lastLogTime = currentTime;
-                            }
-                        }
-                    } else {
-                        // Volto rilevato ma senza match
-                        const currentTime = Date.now();
-                        if ((currentTime - lastLogTime) > 5000) {
-                            sendRecognitionLog('Sconosciuto', 0, false, 'detection');
-                            lastLogTime = currentTime;
-                        }
-                    }
-                });
-            } else {
-                subjectVisible = false; // Nessun soggetto riconosciuto
-                lastLoggedSubject = null; // Reset quando non c'è più nessuno
-            }
-        })
-        .catch(error => {
-            log(`ERRORE nel riconoscimento: ${error.message}`);
-            console.error("Errore nel riconoscimento:", error);
-        })
-        .finally(() => {
-            // Pianifica il prossimo riconoscimento
-            recognitionTimer = setTimeout(recognitionLoop, 1000);
-        });
-}
-
-// Riconoscimento facciale dal frame dello stream condiviso
-async function recognizeFromVideo() {
-    try {
-        // Ottieni il frame dal server
-        const frameResponse = await fetch('/get_video_frame');
-        const frameData = await frameResponse.json();
-        
-        if (!frameData.frame) {
-            return null;
-        }
-        
-        // Converte il frame base64 in blob
-        const byteCharacters = atob(frameData.frame);
-        const byteNumbers = new Array(byteCharacters.length);
-        for (let i = 0; i < byteCharacters.length; i++) {
-            byteNumbers[i] = byteCharacters.charCodeAt(i);
+    recognitionEvents = new EventSource(cameraUrl('/recognition_events'));
+    recognitionEvents.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.results && data.results.length > 0) {
+            lastResults = data.results;
+            subjectVisible = true; // Il soggetto è visibile
+        } else {
+            lastResults = [];
+            subjectVisible = false; // Nessun soggetto riconosciuto
         }
-        const byteArray = new Uint8Array(byteNumbers);
-        const blob = new Blob([byteArray], { type: 'image/jpeg' });
-        
-        const timestamp = new Date().getTime();
-        const file = new File([blob], `webcam_${timestamp}.jpg`, { type: 'image/jpeg' });
-        
-        const formData = new FormData();
-        formData.append('file', file);
+    };
+    recognitionEvents.onerror = () => {
+        // EventSource si riconnette automaticamente
+        console.error('Connessione ai risultati di riconoscimento interrotta, riconnessione...');
+    };
+}
 
-        // Costruire l'URL base in modo sicuro
-        let baseUrl = config.host;
-        
-        // Aggiungi la porta se non è già inclusa nell'host
-        if (config.port && !baseUrl.includes(`:${config.port}`)) {
-            baseUrl = `${baseUrl}:${config.port}`;
-        }
-        
-        // Costruisci l'URL completo per l'API
-        const apiUrl = `${baseUrl}/api/v1/recognition/recognize`;
-        
-        // Prepara i parametri di query
-        const params = new URLSearchParams({
-            limit: '0',
-            det_prob_threshold: config.detProbThreshold,
-            prediction_count: '1'
-        });
-        
-        // Aggiungi face_plugins solo se è definito e non vuoto
-        if (config.facePlugins && config.facePlugins.trim() !== '') {
-            params.append('face_plugins', config.facePlugins);
-        }
 
-        log(`Invio richiesta a: ${apiUrl}?${params.toString()}`);
-        
-        const response = await fetch(`${apiUrl}?${params.toString()}`, {
-            method: 'POST',
-            headers: {
-                'x-api-key': config.apiKey
-            },
-            body: formData
-        });
-        
-        if (!response.ok) {
-            const errorText = await response.text();
-            log(`Risposta API: ${response.status} - ${errorText}`);
-            throw new Error(`Errore API: ${response.status}`);
+// Anteprima live: stream MJPEG dal server (un'unica connessione, JPEG binari
+// inviati solo quando la camera produce un nuovo frame), disegnato sul canvas
+function connectPreview() {
+    previewImage.onerror = () => {
+        // Stream interrotto: tenta un restart e riconnette
+        if (!window.lastRestartAttempt || (Date.now() - window.lastRestartAttempt) > 10000) {
+            window.lastRestartAttempt = Date.now();
+            fetch(cameraUrl('/restart_system'), { method: 'POST' })
+                .catch(err => console.error('Errore restart:', err));
         }
-        
-        const data = await response.json();
-        log(`Risposta API ricevuta correttamente.`);
-        return data.result;
-        
-    } catch (error) {
-        log(`ERRORE nella richiesta API: ${error.message}`);
-        console.error("Errore nella richiesta API:", error);
-        return null;
-    }
+        setTimeout(connectPreview, 2000);
+    };
+    previewImage.src = cameraUrl(`/video_feed?t=${Date.now()}`);
 }
 
-
-let lastRequestTime = 0;  // Variabile per tenere traccia dell'ultima richiesta
-
-
-// Rendering del frame con la logica di pulizia delle scritte (MIGLIORATA)
-function renderFrame() {
-    if (!isRunning) {
-        requestAnimationFrame(renderFrame);
-        return;
-    }
-    
-    // Prima ottieni e disegna il frame video
-    fetch('/get_video_frame')
+// Controllo periodico dello stream: se il server non ha più la webcam attiva
+// riavvia il sistema e riconnette l'anteprima
+function checkStreamHealth() {
+    fetch(cameraUrl('/webcam_status'))
         .then(response => response.json())
-        .then(frameData => {
-            if (frameData.frame) {
-                // Crea un'immagine temporanea per disegnare sul canvas
-                const img = new Image();
-                img.onload = () => {
-                    // Pulisci il canvas
-                    ctx.clearRect(0, 0, canvas.width, canvas.height);
-                    
-                    // Disegna l'immagine sul canvas (specchiata)
-                    ctx.save();
-                    ctx.scale(-1, 1);
-                    ctx.drawImage(img, -canvas.width, 0, canvas.width, canvas.height);
-                    ctx.restore();
-                    
-                    // Poi disegna gli overlay
-                    drawOverlays();
-                };
-                img.src = `data:image/jpeg;base64,${frameData.frame}`;
-            } else {
-                // Se non c'è frame, mostra schermo nero con messaggio e prova restart
-                ctx.fillStyle = 'black';
-                ctx.fillRect(0, 0, canvas.width, canvas.height);
-                
-                ctx.fillStyle = 'white';
-                ctx.font = '20px Arial';
-                ctx.textAlign = 'center';
-                ctx.fillText('Sistema in restart...', canvas.width / 2, canvas.height / 2);
-                
-                // Prova a riavviare il sistema se non l'abbiamo fatto di recente
+        .then(status => {
+            if (!status.stream_running && isRunning) {
                 if (!window.lastRestartAttempt || (Date.now() - window.lastRestartAttempt) > 5000) {
                     window.lastRestartAttempt = Date.now();
-                    fetch('/restart_system', { method: 'POST' })
+                    fetch(cameraUrl('/restart_system'), { method: 'POST' })
                         .then(response => response.json())
                         .then(result => {
                             if (result.status === 'success') {
                                 log('Sistema riavviato automaticamente');
+                                connectPreview();
                             }
                         })
                         .catch(error => {
@@ -367,27 +229,42 @@ function renderFrame() {
                 }
             }
         })
-        .catch(error => {
-            // Mostra errore sul canvas
-            ctx.fillStyle = 'black';
-            ctx.fillRect(0, 0, canvas.width, canvas.height);
+        .catch(error => console.error('Errore controllo stream:', error));
+}
+
+// Messaggio a tutto schermo sul canvas (stream assente o in errore)
+function drawCameraMessage(message, color, font) {
+    ctx.fillStyle = 'black';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+    
+    ctx.fillStyle = color;
+    ctx.font = font;
+    ctx.textAlign = 'center';
+    ctx.fillText(message, canvas.width / 2, canvas.height / 2);
+}
+
+// Rendering del frame con la logica di pulizia delle scritte
+function renderFrame() {
+    if (isRunning) {
+        if (previewImage.complete && previewImage.naturalWidth > 0) {
+            // Pulisci il canvas
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
             
-            ctx.fillStyle = 'red';
-            ctx.font = '16px Arial';
-            ctx.textAlign = 'center';
-            ctx.fillText('Errore connessione camera', canvas.width / 2, canvas.height / 2);
+            // Disegna l'immagine sul canvas (specchiata)
+            ctx.save();
+            ctx.scale(-1, 1);
+            ctx.drawImage(previewImage, -canvas.width, 0, canvas.width, canvas.height);
+            ctx.restore();
             
-            // Tentativo di restart dopo errore
-            if (!window.lastRestartAttempt || (Date.now() - window.lastRestartAttempt) > 10000) {
-                window.lastRestartAttempt = Date.now();
-                fetch('/restart_system', { method: 'POST' })
-                    .catch(err => console.error('Errore restart:', err));
-            }
-        })
-        .finally(() => {
-            // Continua il loop di rendering
-            requestAnimationFrame(renderFrame);
-        });
+            // Poi disegna gli overlay
+            drawOverlays();
+        } else {
+            drawCameraMessage('Sistema in restart...', 'white', '20px Arial');
+        }
+    }
+    
+    // Continua il loop di rendering
+    requestAnimationFrame(renderFrame);
 }
 
 
@@ -417,36 +294,6 @@ function drawOverlays() {
                         // Scrivi la somiglianza in basso a destra
                         ctx.textAlign = 'right';
                         ctx.fillText(`Similarità: ${similarityScore.toFixed(2)}`, canvas.width - 20, canvas.height - 40);
-
-                        // Logica Shelly (rimane uguale)...
-                        const currentTime = new Date().getTime();
-                        if (currentTime - lastRequestTime >= 5000) {
-                            fetch('/shelly_url', {
-                                method: 'POST',
-                                headers: {
-                                    'Content-Type': 'application/json'
-                                }
-                            }).then(response => {
-                                if (!response.ok) {
-                                    console.error('Errore nella richiesta allo Shelly');
-                                    log('Errore nella richiesta allo Shelly');
-                                } else {
-                                    console.info('Richiesta Shelly inviata correttamente');
-                                    log('Dispositivo Shelly attivato correttamente');
-                                }
-                                return response.json();
-                            }).then(data => {
-                                if (data.error) {
-                                    log(`Errore Shelly: ${data.error}`);
-                                } else {
-                                    log(`Shelly: ${data.message}`);
-                                }
-                            }).catch(error => {
-                                console.error('Errore nella richiesta allo Shelly', error);
-                                log(`Errore connessione Shelly: ${error.message}`);
-                            });
-                            lastRequestTime = currentTime;
-                        }
                     }
                 }
             }
@@ -468,15 +315,13 @@ window.addEventListener('message', async (event) => {
         // Gestione restart completo
         try {
             log('Ricevuto comando restart dal sistema remoto');
-            const response = await fetch('/restart_system', { method: 'POST' });
+            const response = await fetch(cameraUrl('/restart_system'), { method: 'POST' });
             const result = await response.json();
             if (result.status === 'success') {
                 log('Sistema riavviato dopo cattura foto remota');
                 isRunning = true;
-                // Riavvia anche il loop di riconoscimento se necessario
-                if (!recognitionTimer) {
-                    recognitionLoop();
-                }
+                // Riattiva la sottoscrizione ai risultati se necessario
+                subscribeRecognitionResults();
                 // Reset flag ultimo restart
                 delete window.lastRestartAttempt;
             }